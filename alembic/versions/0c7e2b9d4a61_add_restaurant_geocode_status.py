@@ -0,0 +1,42 @@
+"""add restaurant geocode status
+
+Revision ID: 0c7e2b9d4a61
+Revises: f1a6c8e3b5d2
+Create Date: 2026-10-18 22:14:38.905127
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0c7e2b9d4a61'
+down_revision = 'f1a6c8e3b5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 已經存在的餐廳都有經緯度，所以預設為 resolved
+    with op.batch_alter_table('restaurant') as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                'geocode_status', sa.String(length=20), nullable=False, server_default='resolved'
+            )
+        )
+        batch_op.add_column(
+            sa.Column('geocode_attempts', sa.Integer(), nullable=False, server_default='0')
+        )
+        batch_op.alter_column('lat', existing_type=sa.Float(), nullable=True)
+        batch_op.alter_column('lng', existing_type=sa.Float(), nullable=True)
+        batch_op.create_index('ix_restaurant_geocode_status', ['geocode_status'], unique=False)
+
+
+def downgrade() -> None:
+    # 如果還有沒有經緯度的餐廳 (pending_geocode / failed)，要先處理掉才能降版
+    with op.batch_alter_table('restaurant') as batch_op:
+        batch_op.drop_index('ix_restaurant_geocode_status')
+        batch_op.alter_column('lng', existing_type=sa.Float(), nullable=False)
+        batch_op.alter_column('lat', existing_type=sa.Float(), nullable=False)
+        batch_op.drop_column('geocode_attempts')
+        batch_op.drop_column('geocode_status')
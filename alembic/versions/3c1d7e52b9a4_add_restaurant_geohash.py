@@ -0,0 +1,60 @@
+"""add restaurant geohash
+
+Revision ID: 3c1d7e52b9a4
+Revises: a008b1f94ac4
+Create Date: 2026-10-18 11:32:08.516204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.geo import encode_geohash
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1d7e52b9a4'
+down_revision = 'a008b1f94ac4'
+branch_labels = None
+depends_on = None
+
+# 回填資料時每一批更新的筆數
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    op.add_column('restaurant', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index(op.f('ix_restaurant_geohash'), 'restaurant', ['geohash'], unique=False)
+
+    # 回填已經存在的餐廳資料
+    restaurant = sa.table(
+        'restaurant',
+        sa.column('id', sa.Integer),
+        sa.column('lat', sa.Float),
+        sa.column('lng', sa.Float),
+        sa.column('geohash', sa.String),
+    )
+
+    conn = op.get_bind()
+
+    rows = conn.execute(sa.select(restaurant.c.id, restaurant.c.lat, restaurant.c.lng)).fetchall()
+
+    update_stmt = (
+        restaurant.update()
+        .where(restaurant.c.id == sa.bindparam('_id'))
+        .values(geohash=sa.bindparam('_geohash'))
+    )
+
+    for start in range(0, len(rows), BATCH_SIZE):
+        params = [
+            {'_id': row.id, '_geohash': encode_geohash(row.lat, row.lng)}
+            for row in rows[start : start + BATCH_SIZE]
+            if row.lat is not None and row.lng is not None
+        ]
+
+        if params:
+            conn.execute(update_stmt, params)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_restaurant_geohash'), table_name='restaurant')
+    op.drop_column('restaurant', 'geohash')
@@ -0,0 +1,40 @@
+"""add restaurant location
+
+Revision ID: 5b7f0c2d9e16
+Revises: 3c1d7e52b9a4
+Create Date: 2026-10-18 17:05:41.208113
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7f0c2d9e16'
+down_revision = '3c1d7e52b9a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 只有 PostgreSQL 需要 PostGIS 的 location 欄位，SQLite 使用 geohash 和 haversine_km()
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+
+    # generated column 在新增欄位時就會計算好已經存在的資料
+    op.execute(
+        """
+        ALTER TABLE restaurant ADD COLUMN location geography(Point, 4326)
+        GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(lng, lat), 4326)::geography) STORED
+        """
+    )
+    op.execute('CREATE INDEX idx_restaurant_location ON restaurant USING GIST (location)')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('DROP INDEX IF EXISTS idx_restaurant_location')
+    op.execute('ALTER TABLE restaurant DROP COLUMN IF EXISTS location')
@@ -0,0 +1,46 @@
+"""use partial pending geocode index
+
+Revision ID: 7a3e9f1c2b58
+Revises: 0c7e2b9d4a61
+Create Date: 2026-10-19 09:12:06.418530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3e9f1c2b58'
+down_revision = '0c7e2b9d4a61'
+branch_labels = None
+depends_on = None
+
+PENDING_WHERE = sa.text("geocode_status = 'pending_geocode'")
+
+
+def upgrade() -> None:
+    # 幾乎所有餐廳都是 resolved，`geocode_status` 的 index 沒有篩選效果，
+    # 但 SQLite 會優先使用它的等值比對，而不是 `ix_restaurant_geohash` 的範圍查詢
+    op.drop_index('ix_restaurant_geocode_status', table_name='restaurant')
+
+    # 只有支援 partial index 的資料庫才建立 (背景 worker 查詢等待中的餐廳)
+    if op.get_bind().dialect.name not in ('sqlite', 'postgresql'):
+        return
+
+    op.create_index(
+        'ix_restaurant_pending_geocode',
+        'restaurant',
+        ['geocode_attempts', 'id'],
+        unique=False,
+        sqlite_where=PENDING_WHERE,
+        postgresql_where=PENDING_WHERE,
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name in ('sqlite', 'postgresql'):
+        op.drop_index('ix_restaurant_pending_geocode', table_name='restaurant')
+
+    op.create_index(
+        'ix_restaurant_geocode_status', 'restaurant', ['geocode_status'], unique=False
+    )
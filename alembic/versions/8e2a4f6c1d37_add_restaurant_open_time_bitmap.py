@@ -0,0 +1,77 @@
+"""add restaurant open time bitmap
+
+Revision ID: 8e2a4f6c1d37
+Revises: 5b7f0c2d9e16
+Create Date: 2026-10-18 18:12:05.734920
+
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.open_time_bitmap import BITMAP_SIZE, build_bitmap
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2a4f6c1d37'
+down_revision = '5b7f0c2d9e16'
+branch_labels = None
+depends_on = None
+
+# 回填資料時每一批更新的筆數
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    op.add_column(
+        'restaurant', sa.Column('open_time_bitmap', sa.LargeBinary(BITMAP_SIZE), nullable=True)
+    )
+
+    # 根據已經存在的營業時間回填 bitmap
+    restaurant = sa.table(
+        'restaurant',
+        sa.column('id', sa.Integer),
+        sa.column('open_time_bitmap', sa.LargeBinary),
+    )
+    restaurant_open_time = sa.table(
+        'restaurant_open_time',
+        sa.column('restaurant_id', sa.Integer),
+        sa.column('day_of_week', sa.Integer),
+        sa.column('open_time', sa.Time),
+        sa.column('close_time', sa.Time),
+    )
+
+    conn = op.get_bind()
+
+    open_times = defaultdict(list)
+
+    for row in conn.execute(
+        sa.select(
+            restaurant_open_time.c.restaurant_id,
+            restaurant_open_time.c.day_of_week,
+            restaurant_open_time.c.open_time,
+            restaurant_open_time.c.close_time,
+        )
+    ):
+        open_times[row.restaurant_id].append((row.day_of_week, row.open_time, row.close_time))
+
+    update_stmt = (
+        restaurant.update()
+        .where(restaurant.c.id == sa.bindparam('_id'))
+        .values(open_time_bitmap=sa.bindparam('_bitmap'))
+    )
+
+    restaurant_ids = list(open_times)
+
+    for start in range(0, len(restaurant_ids), BATCH_SIZE):
+        params = [
+            {'_id': restaurant_id, '_bitmap': build_bitmap(open_times[restaurant_id])}
+            for restaurant_id in restaurant_ids[start : start + BATCH_SIZE]
+        ]
+
+        conn.execute(update_stmt, params)
+
+
+def downgrade() -> None:
+    op.drop_column('restaurant', 'open_time_bitmap')
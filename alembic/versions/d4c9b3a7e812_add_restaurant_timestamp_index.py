@@ -0,0 +1,25 @@
+"""add restaurant timestamp index
+
+Revision ID: d4c9b3a7e812
+Revises: 8e2a4f6c1d37
+Create Date: 2026-10-18 19:52:37.190284
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4c9b3a7e812'
+down_revision = '8e2a4f6c1d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_restaurant_create_at'), 'restaurant', ['create_at'], unique=False)
+    op.create_index(op.f('ix_restaurant_update_at'), 'restaurant', ['update_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_restaurant_update_at'), table_name='restaurant')
+    op.drop_index(op.f('ix_restaurant_create_at'), table_name='restaurant')
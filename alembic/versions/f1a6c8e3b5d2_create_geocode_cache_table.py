@@ -0,0 +1,36 @@
+"""create geocode cache table
+
+Revision ID: f1a6c8e3b5d2
+Revises: d4c9b3a7e812
+Create Date: 2026-10-18 21:31:05.482913
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f1a6c8e3b5d2'
+down_revision = 'd4c9b3a7e812'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'geocode_cache',
+        sa.Column('address', sa.String(length=255), nullable=False),
+        sa.Column('lat', sa.Float(), nullable=False),
+        sa.Column('lng', sa.Float(), nullable=False),
+        sa.Column('create_at', sa.DateTime(), nullable=True),
+        sa.Column('update_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('address'),
+    )
+    op.create_index(
+        op.f('ix_geocode_cache_update_at'), 'geocode_cache', ['update_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_geocode_cache_update_at'), table_name='geocode_cache')
+    op.drop_table('geocode_cache')
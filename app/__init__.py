@@ -12,6 +12,8 @@ import os
 from fastapi import FastAPI
 from dotenv import load_dotenv
 
+from app import passwords
+from app.rate_limit import login_rate_limiter
 from app.config import config
 
 
@@ -36,4 +38,49 @@ def create_app(config_name: str = None) -> FastAPI:
 
     app.api_version = api_config.API_VERSION
 
+    if api_config.SPATIAL_INDEX_ENABLE:
+        app.add_event_handler("startup", _build_spatial_index)
+
+    if api_config.GEOCODE_DEFERRED:
+        app.add_event_handler("startup", _start_geocode_worker)
+        app.add_event_handler("shutdown", _stop_geocode_worker)
+
+    app.add_event_handler("shutdown", _close_map_api)
+
+    passwords.configure_password_hashing(api_config)
+    login_rate_limiter.configure(api_config)
+    app.add_event_handler("shutdown", passwords.shutdown_password_pool)
+
     return app
+
+
+def _build_spatial_index():
+    """從資料庫建立記憶體中的餐廳空間索引"""
+
+    from app.database import SessionLocal
+    from app.spatial_index import restaurant_index
+
+    with SessionLocal() as db:
+        restaurant_index.build(db)
+
+
+async def _close_map_api():
+    """關閉地圖 API client 的連線池"""
+
+    from app.geocoding import close_async_map_api
+
+    await close_async_map_api()
+
+
+async def _start_geocode_worker():
+    """啟動在背景查詢 `pending_geocode` 餐廳經緯度的 worker"""
+
+    from app.geocode_worker import geocode_worker
+
+    geocode_worker.start()
+
+
+async def _stop_geocode_worker():
+    from app.geocode_worker import geocode_worker
+
+    await geocode_worker.stop()
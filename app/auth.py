@@ -6,16 +6,22 @@ LastEditTime: 2023-07-06 23:24:18
 Description: 存放跟使用者認證相關的程式
 '''
 
+import logging
 from typing import Optional
 from datetime import datetime, timedelta
 
+from fastapi import BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from jose import jwt
 
+from app import passwords
 from app.config.config import BaseConfig
-from app.database import crud
+from app.database import SessionLocal, crud
 from app.schemas.user_schema import OnReadNoOAuthModel
 
+logger = logging.getLogger(__name__)
+
 
 def authenticate_user(db: Session, username: str, password: str) -> "OnReadNoOAuthModel":
     """認證使用者
@@ -34,6 +40,52 @@ def authenticate_user(db: Session, username: str, password: str) -> "OnReadNoOAu
     return OnReadNoOAuthModel(id=user.id, username=user.username, email=user.email)
 
 
+async def authenticate_user_async(
+    db: Session, username: str, password: str, background_tasks: Optional[BackgroundTasks] = None
+) -> "OnReadNoOAuthModel":
+    """和 `authenticate_user()` 相同，但在 process pool 中驗證密碼，不會佔用處理請求的 thread
+    (查詢資料庫在 thread pool 中執行，不會阻塞 event loop)
+
+    有傳入 `background_tasks` 時，密碼雜湊過時的使用者在認證通過後，會在回應之後重新計算雜湊
+    """
+
+    user = await run_in_threadpool(crud.get_user_with_username, db, username)
+
+    if not user:
+        return False
+
+    if not await passwords.verify_password_async(password, user.password_hash):
+        return False
+
+    if background_tasks is not None and user.password_needs_update:
+        background_tasks.add_task(rehash_password, user.id, user.password_hash, password)
+
+    return OnReadNoOAuthModel(id=user.id, username=user.username, email=user.email)
+
+
+def _update_password_hash(user_id: int, old_password_hash: str, new_password_hash: str) -> bool:
+    # 背景工作在回應之後才執行，不能使用請求的 session (可能已經關閉)，要建立新的 session
+    with SessionLocal() as db:
+        return crud.update_user_password_hash(db, user_id, old_password_hash, new_password_hash)
+
+
+async def rehash_password(user_id: int, old_password_hash: str, password: str):
+    """用目前的雜湊設定重新計算使用者的密碼雜湊 (失敗時只記錄錯誤，下次登入會再重新計算)
+
+    更新資料庫在 thread pool 中執行，不會阻塞 event loop
+    """
+
+    try:
+        new_password_hash = await passwords.hash_password_async(password)
+
+        await run_in_threadpool(
+            _update_password_hash, user_id, old_password_hash, new_password_hash
+        )
+
+    except Exception:
+        logger.exception("Failed to rehash password of user %s.", user_id)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """生成 JWT Token
     `expires_delta` 默認值為 15 min
@@ -0,0 +1,198 @@
+'''
+Author: weijay
+Date: 2026-10-18 20:32:14
+LastEditors: weijay
+LastEditTime: 2026-10-18 20:32:14
+Description: 批次匯入餐廳 (JSON / CSV)
+'''
+
+import csv
+import io
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app import geocoding
+from app.database import crud
+from app.schemas import database_schema, restaurant_schema
+
+# CSV 中 `open_times` 欄位的格式: `星期幾|開始時間|結束時間` ，多個營業時間用 `;` 分隔
+# 例如 `1|11:00|14:00;1|17:00|21:00`
+CSV_OPEN_TIME_SEPARATOR = ";"
+CSV_OPEN_TIME_FIELD_SEPARATOR = "|"
+
+
+class ImportRow:
+    """一筆通過驗證、等待匯入的餐廳"""
+
+    __slots__ = ("index", "item", "open_times", "lat", "lng")
+
+    def __init__(
+        self,
+        index: int,
+        item: restaurant_schema.OnCreateModel,
+        open_times: List[database_schema.RestaurantOpenTimeDBModel],
+    ):
+        self.index = index
+        self.item = item
+        self.open_times = open_times
+        self.lat: Optional[float] = None
+        self.lng: Optional[float] = None
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()
+    )
+
+
+def validate_row(index: int, data: dict) -> ImportRow:
+    """驗證一筆餐廳資料 (格式和 `POST /restaurant/` 相同)
+
+    Raises:
+        ValueError: 資料格式不正確
+    """
+
+    if not isinstance(data, dict):
+        raise ValueError("row should be an object")
+
+    try:
+        item = restaurant_schema.OnCreateModel(**data)
+
+    except ValidationError as e:
+        raise ValueError(_format_validation_error(e))
+
+    open_times = []
+
+    for open_time in item.open_times or []:
+        try:
+            open_times.append(
+                database_schema.RestaurantOpenTimeDBModel(
+                    day_of_week=open_time.day_of_week,
+                    open_time=datetime.strptime(open_time.open_time, "%H:%M").time(),
+                    close_time=datetime.strptime(open_time.close_time, "%H:%M").time(),
+                )
+            )
+
+        except ValueError:
+            raise ValueError("time format error, it should be %H:%M format.")
+
+    return ImportRow(index, item, open_times)
+
+
+def parse_csv(content: str) -> List[dict]:
+    """把 CSV 內容轉換成和 JSON 匯入相同格式的 dict
+
+    欄位: `name` 、 `address` 、 `phone` 、 `desc` 、 `price` 、 `open_times` ，空白欄位視為沒有資料
+    """
+
+    rows = []
+
+    for record in csv.DictReader(io.StringIO(content)):
+        data = {key: value for key, value in record.items() if key and value not in (None, "")}
+
+        if "open_times" in data:
+            open_times = []
+
+            for value in data["open_times"].split(CSV_OPEN_TIME_SEPARATOR):
+                if not value.strip():
+                    continue
+
+                fields = [field.strip() for field in value.split(CSV_OPEN_TIME_FIELD_SEPARATOR)]
+
+                if len(fields) != 3:
+                    # 交給 validate_row 回報錯誤
+                    open_times.append({"day_of_week": value})
+                    continue
+
+                open_times.append(
+                    {"day_of_week": fields[0], "open_time": fields[1], "close_time": fields[2]}
+                )
+
+            data["open_times"] = open_times
+
+        rows.append(data)
+
+    return rows
+
+
+def geocode_rows(db: Session, rows: List[ImportRow], max_workers: int):
+    """查詢多筆餐廳的經緯度，結果會設定到每一筆資料中
+
+    先查快取，相同地址只查一次，沒有快取的地址使用 batch API 查詢 (最多同時 `max_workers` 個請求)
+
+    Raises:
+        MapApiError: 地圖 API 暫時無法使用
+    """
+
+    if not rows:
+        return
+
+    results = geocoding.get_coords_many(db, [row.item.address for row in rows], max_workers)
+
+    for row, (lat, lng) in zip(rows, results):
+        row.lat, row.lng = lat, lng
+
+
+def import_restaurants(db: Session, data: list, max_workers: int) -> dict:
+    """批次匯入餐廳
+
+    1. 先驗證所有資料，格式錯誤的資料不會匯入
+    2. 查詢所有餐廳的經緯度 (會使用快取)，查不到經緯度的資料不會匯入
+    3. 分批新增餐廳和營業時間
+
+    Returns:
+        dict: 匯入結果，包含成功、失敗的數量、每一筆失敗的原因和處理速度
+    """
+
+    start = time.perf_counter()
+
+    errors = []
+    rows = []
+
+    for index, row_data in enumerate(data):
+        try:
+            rows.append(validate_row(index, row_data))
+
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+
+    geocode_rows(db, rows, max_workers)
+
+    valid_rows = []
+
+    for row in rows:
+        if row.lat and row.lng:
+            valid_rows.append(row)
+
+        else:
+            error = (
+                f"The address '{row.item.address}' format is incorrect "
+                "and cannot be processed correctly."
+            )
+
+            errors.append({"index": row.index, "error": error})
+
+    restaurant_ids = crud.bulk_create_restaurants(
+        db,
+        [
+            database_schema.RestaurantDBModel(**row.item.dict(), lat=row.lat, lng=row.lng)
+            for row in valid_rows
+        ],
+        [row.open_times for row in valid_rows],
+    )
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "total": len(data),
+        "created": len(restaurant_ids),
+        "failed": len(errors),
+        "restaurant_ids": restaurant_ids,
+        "errors": sorted(errors, key=lambda error: error["index"]),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(len(data) / elapsed, 1) if elapsed > 0 else None,
+    }
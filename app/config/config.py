@@ -21,6 +21,27 @@ API_DESC = """
 """
 
 
+# SQLite 的 PRAGMA 設定組合，每個設定類別可以用 `SQLITE_PRAGMAS` 選擇要使用哪一組
+SQLITE_PRAGMA_PROFILES = {
+    # 使用 SQLite 預設值 (rollback journal，寫入時會阻塞所有讀取)
+    "default": {},
+    # WAL 模式下讀取不會被寫入阻塞，搭配 synchronous=NORMAL 只有在 checkpoint 時才需要 fsync
+    # (斷電時可能遺失最後幾筆 commit，但資料庫不會損毀)
+    "wal": {
+        # 等待其他連線釋放鎖的毫秒數，要最先設定，切換 journal_mode 時才不會直接失敗
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        # 用 mmap 讀取資料庫檔案前 256 MB，減少 read() 系統呼叫和複製
+        "mmap_size": 256 * 1024 * 1024,
+        # 每個連線的 page cache 大小，負數的單位是 KiB (32 MB)
+        "cache_size": -32 * 1024,
+        # 暫存資料表和索引 (例如 ORDER BY 、 GROUP BY 的排序) 放在記憶體中
+        "temp_store": "MEMORY",
+    },
+}
+
+
 class BaseConfig:
     API_VERSION = "v1"
     DEBUG = False
@@ -30,13 +51,113 @@ class BaseConfig:
     JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
     JWT_TOKEN_EXPIRE_MIN = os.environ.get("JWT_TOKEN_EXPIRE_MIN", 15)
 
+    # 已認證使用者的快取保存秒數和記憶體中最多快取幾個使用者 (0 代表不使用快取)
+    USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 60))
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+
+    # 新密碼使用的雜湊演算法 (`argon2` 或 `bcrypt`)
+    # 其他演算法或參數不同的舊雜湊仍然可以驗證，使用者登入成功後會用目前的設定重新計算
+    PASSWORD_SCHEME = os.environ.get("PASSWORD_SCHEME", "argon2")
+
+    # argon2id 的記憶體用量 (KiB)、迭代次數和平行度
+    PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get("PASSWORD_ARGON2_MEMORY_COST", 65536))
+    PASSWORD_ARGON2_TIME_COST = int(os.environ.get("PASSWORD_ARGON2_TIME_COST", 3))
+    PASSWORD_ARGON2_PARALLELISM = int(os.environ.get("PASSWORD_ARGON2_PARALLELISM", 4))
+
+    # bcrypt 的 rounds (每加 1 計算時間加倍)
+    PASSWORD_BCRYPT_ROUNDS = int(os.environ.get("PASSWORD_BCRYPT_ROUNDS", 12))
+
+    # 計算密碼雜湊的 process 數量 (0 代表在目前 process 的 thread 中計算)
+    PASSWORD_HASH_WORKERS = int(
+        os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))
+    )
+
+    # 登入限流 (token bucket)：同一個使用者名稱和同一個 IP 可以連續嘗試的次數，以及每分鐘恢復的次數
+    # 超過時直接回傳 429 ，不會計算密碼雜湊
+    LOGIN_RATE_LIMIT_ENABLE = os.environ.get("LOGIN_RATE_LIMIT_ENABLE", "true").lower() == "true"
+    LOGIN_USERNAME_BURST = int(os.environ.get("LOGIN_USERNAME_BURST", 5))
+    LOGIN_USERNAME_PER_MINUTE = float(os.environ.get("LOGIN_USERNAME_PER_MINUTE", 5))
+    LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST", 20))
+    LOGIN_IP_PER_MINUTE = float(os.environ.get("LOGIN_IP_PER_MINUTE", 30))
+
+    # 放在 reverse proxy 後面時，所有連線的來源 IP 都是 proxy ，會共用同一個 IP 限流額度
+    # 列出信任的 proxy IP 或網段 (以逗號分隔，例如 `127.0.0.1,10.0.0.0/8`)，
+    # 連線來自這些 proxy 時才會從 `X-Forwarded-For` 取得 client IP
+    LOGIN_TRUSTED_PROXIES = [
+        proxy.strip()
+        for proxy in os.environ.get("LOGIN_TRUSTED_PROXIES", "").split(",")
+        if proxy.strip()
+    ]
+
+    # 是否開放監控路由 (`/monitor/*`)，開放時也只有登入的使用者可以存取
+    MONITOR_ENABLE = os.environ.get("MONITOR_ENABLE", "false").lower() == "true"
+
+    DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///database.db")
+
+    # 連線池設定 (SQLite 的記憶體資料庫不使用)
+    # pool_size: 保持開啟的連線數量； max_overflow: 忙碌時最多可以再多開的連線數量
+    # pool_timeout: 等待可用連線的秒數； pool_recycle: 連線使用多久 (秒) 後重新建立，避免被資料庫端關閉
+    # pool_pre_ping: 取出連線時先檢查連線是否還可以用
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+
+    # 單一 SQL 最多執行多久 (毫秒)，0 代表不限制 (只有 PostgreSQL 支援)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
+
+    # 每次建立 SQLite 連線時執行的 PRAGMA，參考 `SQLITE_PRAGMA_PROFILES`
+    SQLITE_PRAGMAS = SQLITE_PRAGMA_PROFILES[os.environ.get("SQLITE_PRAGMA_PROFILE", "wal")]
+
+    # 是否在啟動時建立記憶體中的餐廳空間索引 (關閉時隨機選擇餐廳會直接查詢資料庫)
+    SPATIAL_INDEX_ENABLE = os.environ.get("SPATIAL_INDEX_ENABLE", "false").lower() == "true"
+
+    # 同時向地圖 API 查詢經緯度的最大數量 (批次匯入和非同步 client 的連線池大小)
+    GEOCODE_CONCURRENCY = int(os.environ.get("GEOCODE_CONCURRENCY", 8))
+
+    # 呼叫地圖 API 的逾時秒數、失敗時的重試次數和第一次重試前的最長等待秒數 (之後每次加倍)
+    GEOCODE_TIMEOUT = float(os.environ.get("GEOCODE_TIMEOUT", 10))
+    GEOCODE_MAX_RETRIES = int(os.environ.get("GEOCODE_MAX_RETRIES", 3))
+    GEOCODE_RETRY_BACKOFF = float(os.environ.get("GEOCODE_RETRY_BACKOFF", 0.5))
+
+    # 地圖 API 連續失敗幾次後開啟斷路器，以及斷路器開啟多少秒後再嘗試呼叫
+    GEOCODE_CIRCUIT_FAILURES = int(os.environ.get("GEOCODE_CIRCUIT_FAILURES", 5))
+    GEOCODE_CIRCUIT_RESET_SECONDS = float(os.environ.get("GEOCODE_CIRCUIT_RESET_SECONDS", 30))
+
+    # 新增餐廳時不等待地圖 API，先以 `pending_geocode` 狀態新增，再由背景 worker 查詢經緯度
+    GEOCODE_DEFERRED = os.environ.get("GEOCODE_DEFERRED", "false").lower() == "true"
+
+    # 背景 worker 沒有新工作時多久檢查一次 (秒)、一次處理幾筆餐廳、每筆餐廳最多查詢幾次
+    GEOCODE_WORKER_INTERVAL = float(os.environ.get("GEOCODE_WORKER_INTERVAL", 10))
+    GEOCODE_WORKER_BATCH_SIZE = int(os.environ.get("GEOCODE_WORKER_BATCH_SIZE", 100))
+    GEOCODE_MAX_ATTEMPTS = int(os.environ.get("GEOCODE_MAX_ATTEMPTS", 5))
+
+    # 地圖 API 無法使用時背景 worker 暫停的秒數上限 (從 `GEOCODE_WORKER_INTERVAL` 開始每次加倍)
+    GEOCODE_WORKER_MAX_BACKOFF = float(os.environ.get("GEOCODE_WORKER_MAX_BACKOFF", 300))
+
+    # 批次匯入餐廳時，一次最多可以匯入的餐廳數量
+    IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", 10000))
+
+    # 地址轉換經緯度的快取保存天數 (資料庫和記憶體快取共用)
+    GEOCODE_CACHE_TTL_DAYS = int(os.environ.get("GEOCODE_CACHE_TTL_DAYS", 90))
+
+    # 記憶體中最多快取幾個地址的經緯度 (0 代表不使用記憶體快取)
+    GEOCODE_CACHE_LRU_SIZE = int(os.environ.get("GEOCODE_CACHE_LRU_SIZE", 10000))
+
 
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
 
 
 class TestConfig(BaseConfig):
-    pass
+    SPATIAL_INDEX_ENABLE = False
+    PASSWORD_ARGON2_MEMORY_COST = 1024
+    PASSWORD_ARGON2_TIME_COST = 1
+    PASSWORD_ARGON2_PARALLELISM = 1
+    PASSWORD_BCRYPT_ROUNDS = 4
+    PASSWORD_HASH_WORKERS = 0
+    SQLITE_PRAGMAS = SQLITE_PRAGMA_PROFILES["default"]
 
 
 config_dict = {"dev": DevelopmentConfig, "test": TestConfig}
@@ -6,24 +6,166 @@ LastEditTime: 2023-05-10 15:23:57
 Description: Initial DataBase ORM
 '''
 
+import functools
+import math
 import os
+import sqlite3
+from typing import Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 
+from app import geo
+from app.config import config
+
 load_dotenv()
 
-if os.environ.get("DATABASE_URL"):
-    SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL")
 
-else:
-    SQLALCHEMY_DATABASE_URL = "sqlite:///database.db"
+_DEGREE_TO_RADIAN = math.pi / 180
+
+
+def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float):
+    """註冊到 SQLite 的 `haversine_km()`，任何一個參數是 NULL 就回傳 NULL
+
+    和 `app.geo.haversine` 的計算相同，但是展開成區域變數運算，減少每一筆資料的函式呼叫成本
+    """
+
+    try:
+        sin_lat = math.sin((lat2 - lat1) * _DEGREE_TO_RADIAN / 2)
+        sin_lng = math.sin((lng2 - lng1) * _DEGREE_TO_RADIAN / 2)
+
+        a = (
+            sin_lat * sin_lat
+            + math.cos(lat1 * _DEGREE_TO_RADIAN)
+            * math.cos(lat2 * _DEGREE_TO_RADIAN)
+            * sin_lng
+            * sin_lng
+        )
+
+    except TypeError:
+        return None
+
+    return 2 * geo.EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _get_bit(value: bytes, n: int):
+    """註冊到 SQLite 的 `get_bit()`，和 PostgreSQL 的 `get_bit(bytea, n)` 相同，NULL 回傳 NULL"""
+
+    if value is None or n is None:
+        return None
+
+    return value[n // 8] >> (n % 8) & 1
+
+
+@event.listens_for(Engine, "connect")
+def register_sqlite_functions(dbapi_connection, connection_record):
+    """每次建立 SQLite 連線時註冊自訂函式
+
+    不是每個 SQLite 版本都有編譯數學函式 (ASIN、SQRT...)，所以把距離計算註冊成
+    `haversine_km(lat1, lng1, lat2, lng2)`，查詢時每一筆資料只需要呼叫一次函式
+
+    另外註冊和 PostgreSQL 相同的 `get_bit(bytes, n)` ，用來檢查餐廳的 `open_time_bitmap`
+
+    """
+
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    dbapi_connection.create_function("haversine_km", 4, _haversine_km, deterministic=True)
+    dbapi_connection.create_function("get_bit", 2, _get_bit, deterministic=True)
+
+
+def _is_sqlite_memory(url: URL) -> bool:
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def _set_sqlite_pragmas(pragmas: dict, dbapi_connection, connection_record):
+    """每次建立 SQLite 連線時執行 `pragmas` 中的 PRAGMA"""
+
+    cursor = dbapi_connection.cursor()
+
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+
+    finally:
+        cursor.close()
+
+
+def create_engine_from_config(api_config=config.BaseConfig) -> Engine:
+    """根據設定 (`DATABASE_URL` 、 `DB_*` 、 `SQLITE_PRAGMAS`) 建立 engine
+
+    - SQLite: 關閉 `check_same_thread` ，每次建立連線時執行 `SQLITE_PRAGMAS` ，
+      記憶體資料庫只有一個連線，所以不使用連線池設定
+    - 其他資料庫: 使用連線池設定，PostgreSQL 另外設定 `statement_timeout`
+    """
+
+    url = make_url(api_config.DATABASE_URL)
+    backend = url.get_backend_name()
+
+    engine_args = {}
+
+    if backend == "sqlite":
+        engine_args["connect_args"] = {"check_same_thread": False}
+
+    if not (backend == "sqlite" and _is_sqlite_memory(url)):
+        engine_args.update(
+            pool_size=api_config.DB_POOL_SIZE,
+            max_overflow=api_config.DB_MAX_OVERFLOW,
+            pool_timeout=api_config.DB_POOL_TIMEOUT,
+            pool_recycle=api_config.DB_POOL_RECYCLE,
+            pool_pre_ping=api_config.DB_POOL_PRE_PING,
+        )
+
+    if backend == "postgresql" and api_config.DB_STATEMENT_TIMEOUT_MS > 0:
+        engine_args["connect_args"] = {
+            "options": f"-c statement_timeout={api_config.DB_STATEMENT_TIMEOUT_MS}"
+        }
+
+    engine = create_engine(url, **engine_args)
+
+    if backend == "sqlite" and api_config.SQLITE_PRAGMAS:
+        event.listen(
+            engine,
+            "connect",
+            functools.partial(_set_sqlite_pragmas, dict(api_config.SQLITE_PRAGMAS)),
+        )
+
+    return engine
+
+
+def get_pool_stats(target_engine: Optional[Engine] = None) -> dict:
+    """取得連線池的使用狀況
+
+    Returns:
+        dict: `pool` 為連線池類型，使用 `QueuePool` 時另外有
+            - `size`: 保持開啟的連線數量
+            - `checked_in`: 閒置的連線數量
+            - `checked_out`: 使用中的連線數量
+            - `overflow`: 超過 `size` 多開的連線數量 (還沒有用滿 `size` 時為負數)
+    """
+
+    pool = (target_engine or engine).pool
+
+    stats = {"pool": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+
+    return stats
 
-# check_same_thread 只有 SQLite 要設定
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine_args = {"connect_args": {"check_same_thread": False}}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_args)
+# 使用 `APP_ENV` 對應的設定，沒有設定時使用 `BaseConfig`
+engine = create_engine_from_config(
+    config.config_dict.get(os.environ.get("APP_ENV"), config.BaseConfig)
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
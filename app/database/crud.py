@@ -6,15 +6,49 @@ LastEditTime: 2023-08-01 17:20:41
 Description: 對資料庫進行 CRUD 操作
 '''
 
+import random
 from datetime import datetime
-from typing import List
-
-from sqlalchemy import func, text
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+from sqlalchemy import (
+    Float,
+    and_,
+    exists,
+    false,
+    func,
+    insert,
+    literal,
+    literal_column,
+    or_,
+    select,
+    text,
+    update,
+)
 from sqlalchemy.orm import Session
 
+from app import geo, open_time_bitmap
 from app.database import model
+from app.spatial_index import restaurant_index
 from app.schemas import database_schema
 
+# 使用 Haversine formula 計算距離的原生 SQL 指令
+# haversine_km 是在建立 SQLite 連線時註冊的函式 (參考 `app.database.register_sqlite_functions`)，
+# 其他資料庫使用 `_get_haversine_expression()` 的數學運算式
+_HAVERSINE_SQL = "haversine_km(:lat, :lng, lat, lng) <= :distance"
+
+# 地球半徑 (km)
+_EARTH_RADIUS_KM = 6371
+
+# PostgreSQL 使用 PostGIS 的 geography 欄位計算距離，可以使用 GiST 索引
+# location 欄位參考 `model.RESTAURANT_POSTGIS_DDL`
+_POSTGIS_DWITHIN_SQL = """
+ST_DWithin(
+    restaurant.location,
+    CAST(ST_SetSRID(ST_MakePoint(:lng, :lat), 4326) AS geography),
+    :distance * 1000
+)
+"""
+
 
 def create_restaurant_open_times(
     db: Session, restaurant_id: int, open_times: List[database_schema.RestaurantOpenTimeDBModel]
@@ -84,9 +118,16 @@ def delete_restaurant_open_time(db: Session, open_time_id: int):
     return open_time
 
 
+# 存在 `Session.info` 中的 `check_is_user_restaurant()` 結果，session 的生命週期和請求相同
+_USER_RESTAURANT_MEMO_KEY = "user_restaurant_memo"
+
+
 def check_is_user_restaurant(db: Session, user_id: int, restaurant_id: int) -> bool:
     """檢查傳入的 `restaurant_id` 是否屬於 `user_id`
 
+    只用中間表的主鍵 (user_id, restaurant_id) 做 `EXISTS` 查詢，不會載入使用者的所有餐廳，
+    同一個 session (同一個請求) 中重複檢查時直接使用上次的結果
+
     Args:
         db (Session): sessionmaker 實例
 
@@ -98,34 +139,106 @@ def check_is_user_restaurant(db: Session, user_id: int, restaurant_id: int) -> b
         bool: 如果是，回傳 `True` 反之，回傳 `False`
     """
 
-    user = db.get(model.User, user_id)
+    memo = db.info.setdefault(_USER_RESTAURANT_MEMO_KEY, {})
+    key = (int(user_id), int(restaurant_id))
+
+    if key not in memo:
+        table = model.user_restaurant_intermediary_table
+
+        memo[key] = db.scalar(
+            select(exists().where(table.c.user_id == key[0], table.c.restaurant_id == key[1]))
+        )
 
-    restaurant_list = user.restaurants.all()
+    return memo[key]
 
-    if restaurant_id not in set([r.id for r in restaurant_list]):
-        return False
 
-    return True
+def _clear_user_restaurant_memo(db: Session):
+    """使用者和餐廳的關係改變時，清除 `check_is_user_restaurant()` 的結果"""
 
+    db.info.pop(_USER_RESTAURANT_MEMO_KEY, None)
 
-def get_restaurants(db: Session, skip: int = 0, limit: int = 100):
-    """取得餐廳資料
+
+def get_restaurants(db: Session, after_id: Optional[int] = None, limit: int = 100):
+    """取得餐廳資料，依照 ID 排序
+
+    使用 keyset 分頁 (`id > after_id`)，不使用 `offset` ，所以不管是第幾頁查詢成本都相同
 
     Args:
         db (Session): sessionmaker 實例
-        skip (int, optional): 要跳過多少筆資料，同等於 `offset`. Defaults to 0.
+        after_id (Optional[int], optional): 上一頁最後一筆的 ID. Defaults to None.
         limit (int, optional): 最大回傳筆數. Defaults to 100.
     """
 
-    return db.query(model.Restaurant).offset(skip).limit(limit).all()
+    query = db.query(model.Restaurant)
+
+    if after_id is not None:
+        query = query.filter(model.Restaurant.id > after_id)
+
+    return query.order_by(model.Restaurant.id).limit(limit).all()
+
 
+def get_restaurants_with_user(
+    db: Session, user_id: int, after_id: Optional[int] = None, limit: int = 100
+):
+    """根據傳入的 `user_id` 取得對應的使用者收藏的餐廳列表，依照 ID 排序
 
-def get_restaurants_with_user(db: Session, user_id: int):
-    """根據傳入的 `user_id` 取得對應的使用者收藏的餐廳列表"""
+    分頁方式和 `get_restaurants()` 相同，使用者不存在時回傳空的列表
+    """
 
     user = db.get(model.User, user_id)
 
-    return user.restaurants.all()
+    if user is None:
+        return []
+
+    query = user.restaurants
+
+    if after_id is not None:
+        query = query.filter(model.Restaurant.id > after_id)
+
+    return query.order_by(model.Restaurant.id).limit(limit).all()
+
+
+# 匯出餐廳資料時的欄位
+_EXPORT_COLUMNS = (
+    model.Restaurant.id,
+    model.Restaurant.name,
+    model.Restaurant.address,
+    model.Restaurant.phone,
+    model.Restaurant.lat,
+    model.Restaurant.lng,
+    model.Restaurant.desc,
+    model.Restaurant.price,
+    model.Restaurant.is_enable,
+    model.Restaurant.create_at,
+    model.Restaurant.update_at,
+)
+
+
+def iter_restaurants_for_export(
+    db: Session, since: Optional[datetime] = None, batch_size: int = 1000
+) -> Iterator[dict]:
+    """逐筆產生要匯出的餐廳資料 (dict)
+
+    只查詢餐廳本身的欄位 (不會 join `open_times` 和 `types`)，並使用 `yield_per` 分批從資料庫讀取，
+    不管資料有多少筆，記憶體用量都相同
+
+    Args:
+        db (Session): sessionmaker 實例
+        since (Optional[datetime], optional): 只匯出這個時間 (UTC) 之後新增或更新的餐廳.
+            Defaults to None.
+        batch_size (int, optional): 每次從資料庫讀取的筆數. Defaults to 1000.
+    """
+
+    query = db.query(*_EXPORT_COLUMNS)
+
+    if since is not None:
+        # 還沒有被更新過的餐廳 update_at 是 NULL，所以要再看 create_at
+        query = query.filter(
+            or_(model.Restaurant.update_at >= since, model.Restaurant.create_at >= since)
+        )
+
+    for row in query.order_by(model.Restaurant.id).yield_per(batch_size):
+        yield row._asdict()
 
 
 def get_restaurant(db: Session, restaurant_id: int):
@@ -136,6 +249,62 @@ def get_restaurant(db: Session, restaurant_id: int):
     return restaurant
 
 
+def get_restaurants_with_ids(
+    db: Session, restaurant_ids: List[int], distances: Optional[List[float]] = None
+) -> list:
+    """根據傳入的 `restaurant_ids` 取得對應的餐廳資料，回傳的順序會跟 `restaurant_ids` 相同
+
+    如果有傳入 `distances` (與 `restaurant_ids` 一一對應)，會設定到餐廳的 `distance_km`
+    """
+
+    if not restaurant_ids:
+        return []
+
+    items = db.query(model.Restaurant).filter(model.Restaurant.id.in_(restaurant_ids)).all()
+
+    item_dict = {item.id: item for item in items}
+
+    if distances is not None:
+        for r_id, distance in zip(restaurant_ids, distances):
+            if r_id in item_dict:
+                item_dict[r_id].distance_km = distance
+
+    return [item_dict[r_id] for r_id in restaurant_ids if r_id in item_dict]
+
+
+def set_restaurants_is_open(
+    restaurants: list,
+    at: Optional[datetime] = None,
+    day_of_week: Union[int, str, None] = None,
+    current_time: Optional[str] = None,
+) -> list:
+    """一次計算所有餐廳在 `at` 時是否營業中，並設定到餐廳的 `is_open`
+
+    沒有傳入 `at` 時，使用 `day_of_week` 的 `current_time` (和篩選營業中餐廳的時段相同)，
+    都沒有傳入 (或格式不正確) 時使用現在的時間
+
+    只使用餐廳本身的 `open_time_bitmap` 在記憶體中計算，不會再查詢資料庫，
+    沒有營業時間資料的餐廳會被當作營業中
+    """
+
+    slot_index = None
+
+    if at is None and day_of_week and current_time:
+        slot_index = open_time_bitmap.get_slot_index(day_of_week, current_time)
+
+    if slot_index is None:
+        slot_index = open_time_bitmap.get_slot_index_at(at or datetime.now())
+
+    for restaurant in restaurants:
+        if restaurant.open_time_bitmap is None:
+            restaurant.is_open = True
+
+        else:
+            restaurant.is_open = open_time_bitmap.is_open(restaurant.open_time_bitmap, slot_index)
+
+    return restaurants
+
+
 def create_restaurant(db: Session, restaurant: database_schema.RestaurantDBModel):
     """建立餐廳資料"""
 
@@ -151,9 +320,80 @@ def create_restaurant(db: Session, restaurant: database_schema.RestaurantDBModel
     db.commit()
     db.refresh(db_restaurant)
 
+    restaurant_index.upsert(db_restaurant.id, db_restaurant.lat, db_restaurant.lng)
+
     return db_restaurant
 
 
+def bulk_create_restaurants(
+    db: Session,
+    restaurants: List[database_schema.RestaurantDBModel],
+    open_times: List[List[database_schema.RestaurantOpenTimeDBModel]],
+    batch_size: int = 500,
+) -> List[int]:
+    """一次建立多筆餐廳和營業時間
+
+    每 `batch_size` 筆餐廳使用一次 `executemany` 新增餐廳、一次新增營業時間，然後 commit，
+    不會建立 ORM 物件，所以 `geohash` 和 `open_time_bitmap` 在這裡直接計算
+
+    Args:
+        db (Session): sessionmaker 實例
+        restaurants (List[database_schema.RestaurantDBModel]): 餐廳資料
+        open_times (List[List[database_schema.RestaurantOpenTimeDBModel]]): 每一筆餐廳的營業時間，
+            順序要和 `restaurants` 相同
+        batch_size (int, optional): 每一批新增的餐廳數量. Defaults to 500.
+
+    Returns:
+        List[int]: 新增的餐廳 ID，順序和 `restaurants` 相同
+    """
+
+    restaurant_ids = []
+
+    for start in range(0, len(restaurants), batch_size):
+        batch_restaurants = restaurants[start : start + batch_size]
+        batch_open_times = open_times[start : start + batch_size]
+
+        restaurant_rows = [
+            {
+                **restaurant.dict(),
+                "geohash": geo.encode_geohash(restaurant.lat, restaurant.lng),
+                "open_time_bitmap": open_time_bitmap.build_bitmap(
+                    (o.day_of_week, o.open_time, o.close_time) for o in restaurant_open_times
+                ),
+            }
+            for restaurant, restaurant_open_times in zip(batch_restaurants, batch_open_times)
+        ]
+
+        batch_ids = (
+            db.execute(
+                insert(model.Restaurant).returning(
+                    model.Restaurant.id, sort_by_parameter_order=True
+                ),
+                restaurant_rows,
+            )
+            .scalars()
+            .all()
+        )
+
+        open_time_rows = [
+            {"restaurant_id": restaurant_id, **open_time.dict()}
+            for restaurant_id, restaurant_open_times in zip(batch_ids, batch_open_times)
+            for open_time in restaurant_open_times
+        ]
+
+        if open_time_rows:
+            db.execute(insert(model.RestaurantOpenTime), open_time_rows)
+
+        db.commit()
+
+        for restaurant_id, restaurant in zip(batch_ids, batch_restaurants):
+            restaurant_index.upsert(restaurant_id, restaurant.lat, restaurant.lng)
+
+        restaurant_ids.extend(batch_ids)
+
+    return restaurant_ids
+
+
 def create_restaurant_with_user(
     db: Session, restaurant: database_schema.RestaurantDBModel, user_id: int
 ) -> "model.Restaurant":
@@ -165,11 +405,14 @@ def create_restaurant_with_user(
         user_id (int): 使用者 ID 值
 
     Returns:
-        model.Restaurant: 根據這個資料建立的資料庫餐廳模型實例
+        model.Restaurant: 根據這個資料建立的資料庫餐廳模型實例，使用者不存在時回傳 `None`
     """
 
     user = db.get(model.User, user_id)
 
+    if user is None:
+        return None
+
     db_restaurant = model.Restaurant(
         name=restaurant.name,
         address=restaurant.address,
@@ -181,23 +424,88 @@ def create_restaurant_with_user(
     user.restaurants.append(db_restaurant)
     db.add(db_restaurant)
     db.commit()
+
+    _clear_user_restaurant_memo(db)
     db.refresh(db_restaurant)
 
+    restaurant_index.upsert(db_restaurant.id, db_restaurant.lat, db_restaurant.lng)
+
     return db_restaurant
 
 
 def update_restaurant(
-    db: Session, restaurant_id: int, updated_data: database_schema.RestaurantUpdateDBModel
+    db: Session,
+    restaurant_id: int,
+    updated_data: database_schema.RestaurantUpdateDBModel,
+    defer_geocode: bool = False,
+    get_coords: Optional[Callable] = None,
 ):
-    """更新餐廳資料，如果資料庫中找不到傳進來的 `restaurant_id` 資料，則回傳 `None`"""
+    """更新餐廳資料，如果資料庫中找不到傳進來的 `restaurant_id` 資料，則回傳 `None`
+
+    如果 `address` 正規化後和原本的地址不同 (而且沒有同時傳入經緯度)，會重新查詢經緯度 (會先查詢快取)，
+    經緯度、 `geohash` 和 `geocode_status` 會和其他欄位在同一個 transaction 中更新
+
+    Args:
+        defer_geocode (bool, optional): 查不到新地址的經緯度或地圖 API 無法使用時，改成 `pending_geocode`
+            狀態交給背景 worker 查詢，而不是 raise `ValueError` 或 `MapApiError`. Defaults to False.
+        get_coords (Callable, optional): 查詢一個地址經緯度的函式 `(db, address) -> (lat, lng)`.
+            Defaults to `geocoding.get_coords`.
+
+    Raises:
+        ValueError: 查不到新地址的經緯度
+        MapApiError: 地圖 API 暫時無法使用
+    """
+
+    # 避免循環 import
+    from app import geocoding
+    from app.utils import MapApiError
+
+    if get_coords is None:
+        get_coords = geocoding.get_coords
 
     restaurant = db.query(model.Restaurant).filter(model.Restaurant.id == restaurant_id).first()
 
     if not restaurant:
         return None
 
+    data = updated_data.dict()
+
+    address = data.get("address")
+    has_coords = data.get("lat") is not None and data.get("lng") is not None
+
+    if (
+        address is not None
+        and not has_coords
+        and geocoding.normalize_address(address) != geocoding.normalize_address(restaurant.address)
+    ):
+        try:
+            lat, lng = get_coords(db, address)
+
+        except MapApiError:
+            if not defer_geocode:
+                raise
+
+            lat, lng = None, None
+
+        if lat is None or lng is None:
+            if not defer_geocode:
+                raise ValueError(f"Can't get the coordinates of the address '{address}'.")
+
+            restaurant.geocode_status = model.GEOCODE_STATUS_PENDING
+            restaurant.geohash = None
+
+        else:
+            restaurant.geocode_status = model.GEOCODE_STATUS_RESOLVED
+
+        restaurant.lat, restaurant.lng = lat, lng
+        restaurant.geocode_attempts = 0
+
+    elif has_coords:
+        restaurant.geocode_status = model.GEOCODE_STATUS_RESOLVED
+        restaurant.geocode_attempts = 0
+
     # 只要更新有傳入的資料就好，其他欄位如果沒有更新，就照舊
-    for field, value in updated_data.dict().items():
+    for field, value in data.items():
         if value is None:
             continue
         else:
@@ -208,9 +516,62 @@ def update_restaurant(
     db.commit()
     db.refresh(restaurant)
 
+    restaurant_index.upsert(restaurant.id, restaurant.lat, restaurant.lng, restaurant.is_enable)
+
     return restaurant
 
 
+def get_pending_geocode_restaurants(db: Session, limit: int) -> List["model.Restaurant"]:
+    """取得最多 `limit` 筆等待查詢經緯度的餐廳，查詢失敗次數少的優先"""
+
+    return (
+        db.query(model.Restaurant)
+        .filter(model.Restaurant.geocode_status == model.GEOCODE_STATUS_PENDING)
+        .order_by(model.Restaurant.geocode_attempts, model.Restaurant.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def update_restaurants_geocode(
+    db: Session, restaurants: List["model.Restaurant"], coords: List[tuple], max_attempts: int
+) -> int:
+    """設定背景查詢到的經緯度
+
+    查不到經緯度的餐廳會增加一次失敗次數，失敗 `max_attempts` 次後狀態改為 `failed`
+
+    Args:
+        db (Session): sessionmaker 實例
+        restaurants (List[model.Restaurant]): 等待查詢經緯度的餐廳
+        coords (List[tuple]): 每一筆餐廳的 (緯度, 經度)，順序要和 `restaurants` 相同
+        max_attempts (int): 最多查詢幾次
+
+    Returns:
+        int: 成功設定經緯度的餐廳數量
+    """
+
+    resolved = []
+
+    for restaurant, (lat, lng) in zip(restaurants, coords):
+        if lat is not None and lng is not None:
+            restaurant.lat, restaurant.lng = lat, lng
+            restaurant.geocode_status = model.GEOCODE_STATUS_RESOLVED
+            resolved.append(restaurant)
+
+        else:
+            restaurant.geocode_attempts += 1
+
+            if restaurant.geocode_attempts >= max_attempts:
+                restaurant.geocode_status = model.GEOCODE_STATUS_FAILED
+
+    db.commit()
+
+    for restaurant in resolved:
+        restaurant_index.upsert(restaurant.id, restaurant.lat, restaurant.lng, restaurant.is_enable)
+
+    return len(resolved)
+
+
 def delete_restaurant(db: Session, restaurant_id: int):
     """刪除餐廳資料，如果資料庫中找不到傳進來的 `restaurant_id` 資料，則回傳 `None`"""
 
@@ -222,9 +583,205 @@ def delete_restaurant(db: Session, restaurant_id: int):
     db.delete(restaurant)
     db.commit()
 
+    _clear_user_restaurant_memo(db)
+    restaurant_index.remove(restaurant.id)
+
     return restaurant
 
 
+def _is_postgresql(query) -> bool:
+    """`query` 使用的資料庫是否為 PostgreSQL"""
+
+    return query.session.get_bind().dialect.name == "postgresql"
+
+
+def _is_sqlite(query) -> bool:
+    """`query` 使用的資料庫是否為 SQLite (只有 SQLite 連線有註冊 `haversine_km()`)"""
+
+    return query.session.get_bind().dialect.name == "sqlite"
+
+
+def _get_haversine_expression(lat: float, lng: float):
+    """回傳用 SQL 數學函式計算餐廳與 (`lat`, `lng`) 距離 (km) 的運算式 (SQLite 和 PostgreSQL 以外的資料庫使用)"""
+
+    def radians(value):
+        return value * func.pi() / 180
+
+    lat, lng = literal(lat, Float), literal(lng, Float)
+
+    return (
+        _EARTH_RADIUS_KM
+        * 2
+        * func.asin(
+            func.sqrt(
+                func.power(func.sin(radians(lat - model.Restaurant.lat) / 2), 2)
+                + func.cos(radians(lat))
+                * func.cos(radians(model.Restaurant.lat))
+                * func.power(func.sin(radians(lng - model.Restaurant.lng) / 2), 2)
+            )
+        )
+    )
+
+
+def _get_haversine_filter(query, lat: float, lng: float, distance: float):
+    """回傳篩選出距離 (`lat`, `lng`) `distance` (km) 內餐廳的條件"""
+
+    if _is_sqlite(query):
+        return text(_HAVERSINE_SQL)
+
+    return _get_haversine_expression(lat, lng) <= distance
+
+
+def _get_postgis_point(lat: float, lng: float):
+    """回傳 (`lat`, `lng`) 的 PostGIS geography"""
+
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(lng, lat), 4326))
+
+
+def _get_distance_column(query, lat: float, lng: float):
+    """回傳計算餐廳與 (`lat`, `lng`) 距離 (km) 的欄位"""
+
+    if _is_postgresql(query):
+        distance = func.ST_Distance(
+            literal_column("restaurant.location"), _get_postgis_point(lat, lng), type_=Float
+        )
+
+        return (distance / 1000.0).label("distance_km")
+
+    if _is_sqlite(query):
+        return func.haversine_km(lat, lng, model.Restaurant.lat, model.Restaurant.lng).label(
+            "distance_km"
+        )
+
+    return _get_haversine_expression(lat, lng).label("distance_km")
+
+
+def _filter_by_distance(query, lat: float, lng: float, distance: float):
+    """篩選出距離 (`lat`, `lng`) `distance` (km) 內的餐廳
+
+    先用覆蓋搜尋範圍的 geohash 前綴篩選 (使用 `ix_restaurant_geohash` index)，
+    如果搜尋範圍沒辦法用 geohash 表示，就改用經緯度範圍篩選 (使用 `idx_lat_lng` index)，
+    最後再對剩下的資料用 Haversine formula 計算實際距離 (SQLite 使用 `haversine_km()`，其他資料庫使用數學運算式)
+
+    如果資料庫是 PostgreSQL，直接使用 PostGIS 的 `ST_DWithin` (使用 `idx_restaurant_location` index)
+
+    `geocode_status` 不是 `resolved` 的餐廳會被排除
+
+    SQL 中的 `:lat` 、 `:lng` 和 `:distance` 參數要在呼叫端使用 `params()` 傳入
+    """
+
+    # 還沒查詢到經緯度的餐廳不會出現在依照位置查詢的結果中
+    query = query.filter(model.Restaurant.geocode_status == model.GEOCODE_STATUS_RESOLVED)
+
+    if _is_postgresql(query):
+        return query.filter(text(_POSTGIS_DWITHIN_SQL))
+
+    geohashes = geo.get_covering_geohashes(lat, lng, distance)
+
+    if geohashes is not None:
+        # 用字串範圍比較來做前綴查詢 ( "~" 比所有 geohash 字元都大 )，這樣才能使用 index
+        return query.filter(
+            or_(
+                *[
+                    and_(
+                        model.Restaurant.geohash >= prefix, model.Restaurant.geohash < prefix + "~"
+                    )
+                    for prefix in geohashes
+                ]
+            )
+        ).filter(_get_haversine_filter(query, lat, lng, distance))
+
+    min_lat, max_lat, min_lng, max_lng = geo.get_bounding_box(lat, lng, distance)
+
+    query = query.filter(model.Restaurant.lat.between(min_lat, max_lat))
+
+    if min_lng is not None:
+        query = query.filter(model.Restaurant.lng.between(min_lng, max_lng))
+
+    return query.filter(_get_haversine_filter(query, lat, lng, distance))
+
+
+def _filter_by_open_time(query, day_of_week: int, current_time: str):
+    """篩選出在 `day_of_week` 的 `current_time` (HH:MM) 時營業中的餐廳
+
+    只需要檢查餐廳 `open_time_bitmap` 中對應時段的 bit，不用 join `restaurant_open_time`
+    (SQLite 的 `get_bit()` 參考 `app.database.register_sqlite_functions`)
+    """
+
+    slot_index = open_time_bitmap.get_slot_index(day_of_week, current_time)
+
+    if slot_index is None:
+        return query.filter(false())
+
+    return query.filter(func.get_bit(model.Restaurant.open_time_bitmap, slot_index) == 1)
+
+
+def _query_enabled_restaurants(db: Session):
+    """所有使用者共用的餐廳查詢只包含啟用中的餐廳 (和記憶體中的空間索引相同)"""
+
+    return db.query(model.Restaurant).filter(model.Restaurant.is_enable.is_(True))
+
+
+def _sample_randomly(db: Session, query, limit: int, lat: float, lng: float) -> list:
+    """從 `query` 的查詢結果中隨機取出最多 `limit` 筆餐廳
+
+    不使用 `ORDER BY RANDOM()` ，因為資料庫需要把所有符合條件的資料排序後才能取出前幾筆
+
+    這裡分成兩個階段:
+    1. 只查詢符合條件的餐廳 ID 和距離 (不會 join `open_times` 和 `types`)，
+       並用 reservoir sampling 一邊讀取一邊抽樣，每一筆被選到的機率都一樣
+    2. 只針對被選到的餐廳 ID 取得完整的餐廳資料
+    """
+
+    id_query = query.with_entities(
+        model.Restaurant.id, _get_distance_column(query, lat, lng)
+    ).yield_per(1000)
+
+    reservoir = []
+
+    for index, row in enumerate(id_query):
+        if index < limit:
+            reservoir.append(row)
+
+        else:
+            replace_index = random.randint(0, index)
+
+            if replace_index < limit:
+                reservoir[replace_index] = row
+
+    # reservoir 前幾筆的順序跟查詢結果相同，所以要再打亂一次
+    random.shuffle(reservoir)
+
+    return get_restaurants_with_ids(
+        db, [row[0] for row in reservoir], [row[1] for row in reservoir]
+    )
+
+
+def _select_nearest(db: Session, query, limit: int, lat: float, lng: float) -> list:
+    """從 `query` 的查詢結果中取出距離 (`lat`, `lng`) 最近的 `limit` 筆餐廳
+
+    SQLite 只會對 geohash 篩選後的餐廳計算距離並排序，
+    PostgreSQL 使用 PostGIS 的 `<->` 運算子，可以直接用 GiST 索引依照距離取出資料
+    """
+
+    distance_column = _get_distance_column(query, lat, lng)
+
+    if _is_postgresql(query):
+        order_by = literal_column("restaurant.location").op("<->")(_get_postgis_point(lat, lng))
+
+    else:
+        order_by = distance_column
+
+    rows = (
+        query.with_entities(model.Restaurant.id, distance_column)
+        .order_by(order_by)
+        .limit(limit)
+        .all()
+    )
+
+    return get_restaurants_with_ids(db, [row[0] for row in rows], [row[1] for row in rows])
+
+
 def get_user_restaurant_randomly(
     db: Session, user_id: int, lat: float, lng: float, distance: float, limit: int
 ) -> list:
@@ -242,21 +799,6 @@ def get_user_restaurant_randomly(
         list: 符合條件的使用者餐廳
     """
 
-    # 這邊使用原生 SQL 指令來查詢
-    # 使用 Haversine formula
-    sql_text = """
-    (
-        6371 * 2 * ASIN(
-            SQRT(
-                POWER(SIN((:lat - ABS(lat)) * PI() / 180 / 2), 2)
-                + COS(:lat * PI() / 180)
-                * COS(ABS(lat) * PI() / 180)
-                * POWER(SIN((:lng - lng) * PI() / 180 / 2), 2)
-            )
-        )
-    ) <= :distance
-    """
-
     user = db.get(model.User, user_id)
 
     if user is None:
@@ -264,13 +806,12 @@ def get_user_restaurant_randomly(
 
     user_restaurant_query = user.restaurants
 
-    items = (
-        user_restaurant_query.filter(text(sql_text))
-        .params(lat=lat, lng=lng, distance=distance)
-        .limit(limit)
-        .all()
+    query = _filter_by_distance(user_restaurant_query, lat, lng, distance).params(
+        lat=lat, lng=lng, distance=distance
     )
 
+    items = _sample_randomly(db, query, limit, lat, lng)
+
     return items
 
 
@@ -300,22 +841,6 @@ def get_user_restaurant_randomly_with_open_time(
         list: 符合條件的使用者餐廳
     """
 
-    sql_text = """
-    (
-        6371 * 2 * ASIN(
-            SQRT(
-                POWER(SIN((:lat - ABS(lat)) * PI() / 180 / 2), 2)
-                + COS(:lat * PI() / 180)
-                * COS(ABS(lat) * PI() / 180)
-                * POWER(SIN((:lng - lng) * PI() / 180 / 2), 2)
-            )
-        )
-    ) <= :distance
-    AND :day_of_week = restaurant_open_time.day_of_week
-    AND TIME(:current_time) >= TIME(restaurant_open_time.open_time)
-    AND TIME(:current_time) <= TIME(restaurant_open_time.close_time)
-    """
-
     user = db.get(model.User, user_id)
 
     if user is None:
@@ -323,20 +848,58 @@ def get_user_restaurant_randomly_with_open_time(
 
     user_restaurant_query = user.restaurants
 
-    items = (
-        user_restaurant_query.join(model.RestaurantOpenTime)
-        .filter(text(sql_text))
-        .params(
-            lat=lat, lng=lng, distance=distance, day_of_week=day_of_week, current_time=current_time
-        )
-        .order_by(func.random())
-        .limit(limit)
-        .all()
-    )
+    query = _filter_by_open_time(
+        _filter_by_distance(user_restaurant_query, lat, lng, distance), day_of_week, current_time
+    ).params(lat=lat, lng=lng, distance=distance)
+
+    items = _sample_randomly(db, query, limit, lat, lng)
 
     return items
 
 
+def get_user_restaurant_nearest(
+    db: Session,
+    user_id: int,
+    lat: float,
+    lng: float,
+    distance: float,
+    limit: int,
+    day_of_week: Optional[int] = None,
+    current_time: Optional[str] = None,
+) -> list:
+    """取得距離內最近的使用者餐廳，會依照距離由近到遠排序
+
+    如果有傳入 `day_of_week` 和 `current_time` ，只會回傳營業中的餐廳
+
+    Args:
+        db (Session): sessionmaker 實例
+        user_id (int): 使用者 ID 值
+        lat (float): 使用者所在位置的緯度值
+        lng (float): 使用者所在位置的精度值
+        distance (float): 要搜索多少距離範圍內的餐廳 (km)
+        limit (int): 最大回傳數量
+        day_of_week (Optional[int]): 星期幾 (1~7)
+        current_time (Optional[str]): 目前的時間 (HH:MM) 24H
+
+    Returns:
+        list: 符合條件的使用者餐廳
+    """
+
+    user = db.get(model.User, user_id)
+
+    if user is None:
+        return []
+
+    query = _filter_by_distance(user.restaurants, lat, lng, distance)
+
+    if day_of_week and current_time:
+        query = _filter_by_open_time(query, day_of_week, current_time)
+
+    query = query.params(lat=lat, lng=lng, distance=distance)
+
+    return _select_nearest(db, query, limit, lat, lng)
+
+
 def get_restaurant_randomly(
     db: Session,
     lat: float,
@@ -354,30 +917,12 @@ def get_restaurant_randomly(
         limit (int): 回傳的餐廳數量
     """
 
-    # 這邊使用原生 SQL 指令來查詢
-    # 使用 Haversine formula
-    sql_text = """
-    (
-        6371 * 2 * ASIN(
-            SQRT(
-                POWER(SIN((:lat - ABS(lat)) * PI() / 180 / 2), 2)
-                + COS(:lat * PI() / 180)
-                * COS(ABS(lat) * PI() / 180)
-                * POWER(SIN((:lng - lng) * PI() / 180 / 2), 2)
-            )
-        )
-    ) <= :distance
-    """
-
-    items = (
-        db.query(model.Restaurant)
-        .filter(text(sql_text))
-        .params(lat=lat, lng=lng, distance=distance)
-        .order_by(func.random())
-        .limit(limit)
-        .all()
+    query = _filter_by_distance(_query_enabled_restaurants(db), lat, lng, distance).params(
+        lat=lat, lng=lng, distance=distance
     )
 
+    items = _sample_randomly(db, query, limit, lat, lng)
+
     return items
 
 
@@ -402,46 +947,81 @@ def get_restaurant_randomly_with_open_time(
         limit (int): 回傳的餐廳數量
     """
 
-    sql_text = """
-    (
-        6371 * 2 * ASIN(
-            SQRT(
-                POWER(SIN((:lat - ABS(lat)) * PI() / 180 / 2), 2)
-                + COS(:lat * PI() / 180)
-                * COS(ABS(lat) * PI() / 180)
-                * POWER(SIN((:lng - lng) * PI() / 180 / 2), 2)
-            )
-        )
-    ) <= :distance
-    AND :day_of_week = restaurant_open_time.day_of_week
-    AND TIME(:current_time) >= TIME(restaurant_open_time.open_time)
-    AND TIME(:current_time) <= TIME(restaurant_open_time.close_time)
-    """
+    query = _filter_by_open_time(
+        _filter_by_distance(_query_enabled_restaurants(db), lat, lng, distance),
+        day_of_week,
+        current_time,
+    ).params(lat=lat, lng=lng, distance=distance)
 
-    items = (
-        db.query(model.Restaurant)
-        .join(model.RestaurantOpenTime)
-        .filter(text(sql_text))
-        .params(
-            lat=lat, lng=lng, distance=distance, day_of_week=day_of_week, current_time=current_time
-        )
-        .order_by(func.random())
-        .limit(limit)
-        .all()
-    )
+    items = _sample_randomly(db, query, limit, lat, lng)
 
     return items
 
 
+def get_restaurant_nearest(
+    db: Session,
+    lat: float,
+    lng: float,
+    distance: float,
+    limit: int,
+    day_of_week: Optional[int] = None,
+    current_time: Optional[str] = None,
+) -> list:
+    """取得距離內最近的餐廳，會依照距離由近到遠排序
+
+    如果有傳入 `day_of_week` 和 `current_time` ，只會回傳營業中的餐廳
+
+    Args:
+        db (Session): sessionmaker 實例
+        lat (float): 所在位置緯度
+        lng (float): 所在位置經度
+        distance (float): 多少距離範圍內 (km)
+        limit (int): 回傳的餐廳數量
+        day_of_week (Optional[int]): 星期幾
+        current_time (Optional[str]): 目前時間 (HH:MM) 24H
+    """
+
+    query = _filter_by_distance(_query_enabled_restaurants(db), lat, lng, distance)
+
+    if day_of_week and current_time:
+        query = _filter_by_open_time(query, day_of_week, current_time)
+
+    query = query.params(lat=lat, lng=lng, distance=distance)
+
+    return _select_nearest(db, query, limit, lat, lng)
+
+
 def create_user_not_oauth(db: Session, user_data: database_schema.UserNotOAuthDBModel):
     """新增非 OAuth 註冊的使用者"""
 
-    user = model.User(**user_data.dict())
+    user = model.User(**user_data.dict(exclude_none=True))
 
     db.add(user)
     db.commit()
 
 
+def update_user_password_hash(
+    db: Session, user_id: int, old_password_hash: str, new_password_hash: str
+) -> bool:
+    """更新使用者的密碼雜湊
+
+    只有在使用者的密碼雜湊還是 `old_password_hash` 時才會更新，避免覆蓋在這之間被修改的密碼
+
+    Returns:
+        bool: 是否有更新
+    """
+
+    result = db.execute(
+        update(model.User)
+        .where(model.User.id == user_id, model.User.password_hash == old_password_hash)
+        .values(password_hash=new_password_hash)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    return result.rowcount > 0
+
+
 def get_user_with_username(db: Session, username: str) -> "model.User":
     """根據 `username` 取得資料庫對應的使用者
 
@@ -453,6 +1033,15 @@ def get_user_with_username(db: Session, username: str) -> "model.User":
     return user
 
 
+def get_user(db: Session, user_id: int) -> "model.User":
+    """根據 `user_id` 取得資料庫對應的使用者
+
+    如果使用者不存在，回傳 `None`
+    """
+
+    return db.get(model.User, user_id)
+
+
 def get_user_with_email(db: Session, email: str) -> "model.User":
     """根據 `email` 取得資料庫對應的使用者
 
@@ -462,3 +1051,49 @@ def get_user_with_email(db: Session, email: str) -> "model.User":
     user = db.query(model.User).filter(model.User.email == email).first()
 
     return user
+
+
+def get_geocode_caches(db: Session, addresses: List[str], since: datetime) -> Dict[str, tuple]:
+    """取得多個 (正規化後) 地址在 `since` 之後更新的經緯度快取
+
+    Returns:
+        Dict[str, tuple]: 地址對應的 (緯度, 經度)，沒有快取或快取過期的地址不會出現
+    """
+
+    if not addresses:
+        return {}
+
+    rows = db.query(
+        model.GeocodeCache.address, model.GeocodeCache.lat, model.GeocodeCache.lng
+    ).filter(model.GeocodeCache.address.in_(addresses), model.GeocodeCache.update_at >= since)
+
+    return {address: (lat, lng) for address, lat, lng in rows}
+
+
+def save_geocode_caches(db: Session, coords: Dict[str, tuple]):
+    """新增或更新多個 (正規化後) 地址的經緯度快取"""
+
+    if not coords:
+        return
+
+    existing = {
+        cache.address: cache
+        for cache in db.query(model.GeocodeCache).filter(
+            model.GeocodeCache.address.in_(list(coords))
+        )
+    }
+
+    now = datetime.utcnow()
+
+    for address, (lat, lng) in coords.items():
+        cache = existing.get(address)
+
+        if cache is None:
+            db.add(
+                model.GeocodeCache(address=address, lat=lat, lng=lng, create_at=now, update_at=now)
+            )
+
+        else:
+            cache.lat, cache.lng, cache.update_at = lat, lng, now
+
+    db.commit()
@@ -6,10 +6,13 @@ LastEditTime: 2023-08-01 17:41:53
 Description: 定義  DataBase ORM 模型
 '''
 
+import itertools
 from typing import Union
 from datetime import datetime, time
 
 from sqlalchemy import (
+    DDL,
+    event,
     Index,
     String,
     Integer,
@@ -18,17 +21,23 @@ from sqlalchemy import (
     Float,
     DateTime,
     Boolean,
+    LargeBinary,
     Time,
     ForeignKey,
     Table,
+    text,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session, relationship, validates
 from sqlalchemy.ext.declarative import declarative_base
-from passlib.context import CryptContext
+
+from app import geo, open_time_bitmap, passwords
 
 Base = declarative_base()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 餐廳經緯度的查詢狀態，只有 `GEOCODE_STATUS_RESOLVED` 的餐廳會出現在依照位置查詢的結果中
+GEOCODE_STATUS_RESOLVED = "resolved"
+GEOCODE_STATUS_PENDING = "pending_geocode"
+GEOCODE_STATUS_FAILED = "failed"
 
 # restaurant 與 restaurant_type 多對多中間表
 restaurant_type_intermediary_table = Table(
@@ -56,13 +65,21 @@ class Restaurant(Base):
     name = Column(String(100), nullable=False, index=True)
     address = Column(Text, nullable=False)
     phone = Column(String(20), server_default=None)
-    lat = Column(Float, nullable=False)
-    lng = Column(Float, nullable=False)
+    # 經緯度還沒查詢到 (`geocode_status` 不是 `resolved`) 時為 NULL
+    lat = Column(Float)
+    lng = Column(Float)
+    geohash = Column(String(12), index=True)
+    geocode_status = Column(
+        String(20), nullable=False, default=GEOCODE_STATUS_RESOLVED, server_default="resolved"
+    )
+    geocode_attempts = Column(Integer, nullable=False, default=0, server_default="0")
     desc = Column(Text, server_default=None)
     price = Column(Integer, server_default=None)
     is_enable = Column(Boolean, default=True)
-    create_at = Column(DateTime, default=datetime.utcnow)
-    update_at = Column(DateTime, server_default=None, onupdate=datetime.utcnow)
+    # 每週營業時間的 bitmap，參考 `app.open_time_bitmap`
+    open_time_bitmap = Column(LargeBinary(open_time_bitmap.BITMAP_SIZE), server_default=None)
+    create_at = Column(DateTime, default=datetime.utcnow, index=True)
+    update_at = Column(DateTime, server_default=None, onupdate=datetime.utcnow, index=True)
 
     # 與 restaurant_open_time table 建立一對多關係
     open_times = relationship(
@@ -87,14 +104,28 @@ class Restaurant(Base):
         back_populates="restaurants",
     )
 
-    __table_args__ = (Index("idx_lat_lng", "lat", "lng"),)
+    __table_args__ = (
+        Index("idx_lat_lng", "lat", "lng"),
+        # 只索引等待查詢經緯度的餐廳 (背景 worker 使用)，幾乎所有餐廳都是 `resolved`，
+        # 一般的 `geocode_status` index 沒有篩選效果，還會讓 SQLite 放棄 geohash 的範圍查詢
+        Index(
+            "ix_restaurant_pending_geocode",
+            "geocode_attempts",
+            "id",
+            sqlite_where=text("geocode_status = 'pending_geocode'"),
+            postgresql_where=text("geocode_status = 'pending_geocode'"),
+        ),
+    )
+
+    # 查詢距離內的餐廳時計算出來的距離 (km)，不會存到資料庫
+    distance_km = None
 
     def __init__(
         self,
         name: str,
         address: str,
-        lat: float,
-        lng: float,
+        lat: Union[float, None],
+        lng: Union[float, None],
         phone: Union[str, None] = None,
         desc: Union[str, None] = None,
         price: Union[int, None] = None,
@@ -107,9 +138,41 @@ class Restaurant(Base):
         self.desc = desc
         self.price = price
 
+        # 沒有經緯度的餐廳要等背景 worker 查詢經緯度
+        if lat is None or lng is None:
+            self.geocode_status = GEOCODE_STATUS_PENDING
+
+        else:
+            self.geocode_status = GEOCODE_STATUS_RESOLVED
+
     def __repr__(self):
         return f"Data in restaurant table, name = {self.name}"
 
+    @validates("lat", "lng")
+    def validate_lat_lng(self, key: str, value: float) -> float:
+        """更新經緯度時，同時更新 `geohash` 欄位"""
+
+        lat = value if key == "lat" else self.lat
+        lng = value if key == "lng" else self.lng
+
+        if lat is not None and lng is not None:
+            self.geohash = geo.encode_geohash(lat, lng)
+
+        return value
+
+    def update_open_time_bitmap(self, excludes=()):
+        """根據目前的 `open_times` 重新計算 `open_time_bitmap`
+
+        Args:
+            excludes (optional): 要排除的營業時間 (例如即將被刪除的營業時間)
+        """
+
+        self.open_time_bitmap = open_time_bitmap.build_bitmap(
+            (open_time.day_of_week, open_time.open_time, open_time.close_time)
+            for open_time in self.open_times
+            if open_time not in excludes
+        )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -117,12 +180,31 @@ class Restaurant(Base):
             "address": self.address,
             "lat": self.lat,
             "lng": self.lng,
+            "geocode_status": self.geocode_status,
             "phone": self.phone,
             "desc": self.desc,
             "price": self.price,
         }
 
 
+# PostgreSQL 額外建立 PostGIS 的 geography 欄位和 GiST 索引，用來加速距離查詢
+# 欄位是由 lat 、 lng 自動產生的 (generated column)，所以程式不需要另外維護
+# SQLite 不會建立這個欄位 (參考 alembic 的 add restaurant location migration)
+RESTAURANT_POSTGIS_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    """
+    ALTER TABLE restaurant ADD COLUMN location geography(Point, 4326)
+    GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(lng, lat), 4326)::geography) STORED
+    """,
+    "CREATE INDEX idx_restaurant_location ON restaurant USING GIST (location)",
+)
+
+for _statement in RESTAURANT_POSTGIS_DDL:
+    event.listen(
+        Restaurant.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql")
+    )
+
+
 class RestaurantOpenTime(Base):
     """餐廳營業時間表"""
 
@@ -160,6 +242,29 @@ class RestaurantOpenTime(Base):
         }
 
 
+@event.listens_for(Session, "before_flush")
+def update_restaurant_open_time_bitmap(session: Session, flush_context, instances):
+    """新增、更新或刪除營業時間時，同時更新對應餐廳的 `open_time_bitmap`"""
+
+    restaurants = set()
+
+    with session.no_autoflush:
+        for obj in itertools.chain(session.new, session.dirty, session.deleted):
+            if not isinstance(obj, RestaurantOpenTime):
+                continue
+
+            restaurant = obj.restaurant
+
+            if restaurant is None and obj.restaurant_id is not None:
+                restaurant = session.get(Restaurant, obj.restaurant_id)
+
+            if restaurant is not None and restaurant not in session.deleted:
+                restaurants.add(restaurant)
+
+        for restaurant in restaurants:
+            restaurant.update_open_time_bitmap(excludes=session.deleted)
+
+
 class RestaurantType(Base):
     """餐廳種類表"""
 
@@ -215,10 +320,16 @@ class User(Base):
 
     @password.setter
     def password(self, password: str):
-        self.password_hash = pwd_context.hash(password)
+        self.password_hash = passwords.hash_password(password)
 
     def verify_password(self, password: str) -> bool:
-        return pwd_context.verify(password, self.password_hash)
+        return passwords.verify_password(password, self.password_hash)
+
+    @property
+    def password_needs_update(self) -> bool:
+        """密碼雜湊是否使用過時的演算法或參數 (驗證成功後應該用目前的設定重新計算)"""
+
+        return passwords.needs_update(self.password_hash)
 
 
 class OAuth(Base):
@@ -235,3 +346,15 @@ class OAuth(Base):
 
     # 與 user table 建立一對一關係 ( 只有在 user.is_oauth = true 會建立關係 )
     user = relationship("User", back_populates="oauth")
+
+
+class GeocodeCache(Base):
+    """地址轉換經緯度的快取表 (key 為正規化後的地址)"""
+
+    __tablename__ = "geocode_cache"
+
+    address = Column(String(255), primary_key=True)
+    lat = Column(Float, nullable=False)
+    lng = Column(Float, nullable=False)
+    create_at = Column(DateTime, default=datetime.utcnow)
+    update_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
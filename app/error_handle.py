@@ -6,6 +6,7 @@ LastEditTime: 2023-06-20 22:50:25
 Description: 定義常見的錯誤
 '''
 
+import math
 from typing import Union
 
 from fastapi import HTTPException, status
@@ -19,6 +20,8 @@ class ErrorDesc:
 
     ERROR_400 = "Bad request."
     ERROR_404 = "The item you requested does not exist."
+    ERROR_429 = "Too many requests."
+    ERROR_503 = "The service is temporarily unavailable."
 
 
 class CustomError:
@@ -56,3 +59,30 @@ class ErrorHandler:
             error_desc = ErrorDesc.ERROR_404
 
         raise HTTPException(status_code=404, detail=error_desc)
+
+    def raise_429(desc: Union[str, None] = None, retry_after: Union[float, None] = None):
+        """raise 429 error，`retry_after` 是建議 client 等待的秒數"""
+
+        if desc:
+            error_desc = desc
+
+        else:
+            error_desc = ErrorDesc.ERROR_429
+
+        headers = None
+
+        if retry_after is not None and math.isfinite(retry_after):
+            headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+        raise HTTPException(status_code=429, detail=error_desc, headers=headers)
+
+    def raise_503(desc: Union[str, None] = None):
+        """raise 503 error"""
+
+        if desc:
+            error_desc = desc
+
+        else:
+            error_desc = ErrorDesc.ERROR_503
+
+        raise HTTPException(status_code=503, detail=error_desc)
@@ -0,0 +1,52 @@
+'''
+Author: weijay
+Date: 2026-10-18 19:41:08
+LastEditors: weijay
+LastEditTime: 2026-10-18 19:41:08
+Description: 把資料庫查詢結果轉換成串流輸出的 NDJSON
+'''
+
+import json
+import zlib
+from datetime import date, datetime, time
+from typing import Iterable, Iterator
+
+# 累積多少筆資料才輸出一次，避免每一筆都觸發一次傳送
+CHUNK_ROWS = 500
+
+
+def _default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+def iter_ndjson(rows: Iterable[dict], chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """把每一筆 dict 轉換成一行 JSON，每 `chunk_rows` 筆輸出一次"""
+
+    lines = []
+
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, default=_default))
+
+        if len(lines) >= chunk_rows:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """把資料串流壓縮成 gzip 格式，不需要先把全部資料讀到記憶體中"""
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+
+        if data:
+            yield data
+
+    yield compressor.flush()
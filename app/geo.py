@@ -0,0 +1,200 @@
+'''
+Author: weijay
+Date: 2026-10-18 10:12:31
+LastEditors: weijay
+LastEditTime: 2026-10-18 10:12:31
+Description: 放一些跟地理位置計算相關的函示
+'''
+
+import math
+from typing import List, Optional, Tuple
+
+# 地球半徑 (km)，要跟 crud 中 Haversine SQL 使用的值一致
+EARTH_RADIUS_KM = 6371
+
+
+def get_bounding_box(
+    lat: float, lng: float, distance: float
+) -> Tuple[float, float, Optional[float], Optional[float]]:
+    """計算以 (`lat`, `lng`) 為中心、半徑 `distance` (km) 的圓的外接經緯度範圍
+
+    這個範圍只用來做粗略篩選 (讓資料庫可以使用 `idx_lat_lng` index)，
+    實際是否在距離內還是要再用 Haversine formula 計算
+
+    如果範圍包含南北極或是跨越 180 度經線，經度範圍會回傳 `None`，代表不篩選經度
+
+    Args:
+        lat (float): 中心點緯度
+        lng (float): 中心點經度
+        distance (float): 半徑 (km)
+
+    Returns:
+        Tuple[float, float, Optional[float], Optional[float]]: (最小緯度, 最大緯度, 最小經度, 最大經度)
+    """
+
+    angular_distance = distance / EARTH_RADIUS_KM
+
+    delta_lat = math.degrees(angular_distance)
+
+    min_lat = lat - delta_lat
+    max_lat = lat + delta_lat
+
+    # 範圍內包含極點，所有經度都有可能
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+
+    ratio = math.sin(angular_distance) / math.cos(math.radians(lat))
+
+    if ratio >= 1:
+        return min_lat, max_lat, None, None
+
+    delta_lng = math.degrees(math.asin(ratio))
+
+    min_lng = lng - delta_lng
+    max_lng = lng + delta_lng
+
+    # 跨越 180 度經線時，不篩選經度
+    if min_lng < -180 or max_lng > 180:
+        return min_lat, max_lat, None, None
+
+    return min_lat, max_lat, min_lng, max_lng
+
+
+# geohash 使用的 base32 字元
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# 存在資料庫中的 geohash 長度 (9 碼大約是 4.8m x 4.8m 的範圍)
+GEOHASH_PRECISION = 9
+
+# 查詢時最多使用幾個 geohash 格子來覆蓋搜尋範圍
+MAX_COVERING_CELLS = 9
+
+
+def encode_geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """把經緯度轉換成 geohash
+
+    Args:
+        lat (float): 緯度
+        lng (float): 經度
+        precision (int, optional): geohash 長度. Defaults to `GEOHASH_PRECISION`.
+
+    Returns:
+        str: geohash 字串
+    """
+
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+
+    result = []
+    bit = 0
+    char_index = 0
+    is_lng = True
+
+    while len(result) < precision:
+        if is_lng:
+            mid = (lng_range[0] + lng_range[1]) / 2
+
+            if lng >= mid:
+                char_index = char_index * 2 + 1
+                lng_range[0] = mid
+            else:
+                char_index = char_index * 2
+                lng_range[1] = mid
+
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+
+            if lat >= mid:
+                char_index = char_index * 2 + 1
+                lat_range[0] = mid
+            else:
+                char_index = char_index * 2
+                lat_range[1] = mid
+
+        is_lng = not is_lng
+        bit += 1
+
+        if bit == 5:
+            result.append(_GEOHASH_BASE32[char_index])
+            bit = 0
+            char_index = 0
+
+    return "".join(result)
+
+
+def get_geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """取得 `precision` 長度的 geohash 格子大小
+
+    Returns:
+        Tuple[float, float]: (緯度跨度, 經度跨度)，單位是度
+    """
+
+    bits = precision * 5
+
+    lat_bits = bits // 2
+    lng_bits = bits - lat_bits
+
+    return 180.0 / (2**lat_bits), 360.0 / (2**lng_bits)
+
+
+def get_covering_geohashes(lat: float, lng: float, distance: float) -> Optional[List[str]]:
+    """取得可以完整覆蓋以 (`lat`, `lng`) 為中心、半徑 `distance` (km) 範圍的 geohash 前綴
+
+    會選擇覆蓋範圍所需格子數不超過 `MAX_COVERING_CELLS` 的最長 geohash，
+    越長的 geohash 格子越小，篩選出來的範圍就越接近實際的搜尋範圍
+
+    如果範圍太大 (或是包含極點、跨越 180 度經線)，回傳 `None`，代表沒辦法用 geohash 篩選
+
+    Returns:
+        Optional[List[str]]: geohash 前綴列表
+    """
+
+    min_lat, max_lat, min_lng, max_lng = get_bounding_box(lat, lng, distance)
+
+    if min_lng is None:
+        return None
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_size, lng_size = get_geohash_cell_size(precision)
+
+        # 範圍在 geohash 格子中的索引
+        lat_start = math.floor((min_lat + 90) / lat_size)
+        lat_end = math.floor((max_lat + 90) / lat_size)
+        lng_start = math.floor((min_lng + 180) / lng_size)
+        lng_end = math.floor((max_lng + 180) / lng_size)
+
+        if (lat_end - lat_start + 1) * (lng_end - lng_start + 1) <= MAX_COVERING_CELLS:
+            break
+
+    else:
+        return None
+
+    result = set()
+
+    # 用每個格子的中心點算出對應的 geohash
+    for lat_index in range(lat_start, lat_end + 1):
+        for lng_index in range(lng_start, lng_end + 1):
+            cell_lat = min(-90 + (lat_index + 0.5) * lat_size, 90.0)
+            cell_lng = min(-180 + (lng_index + 0.5) * lng_size, 180.0)
+
+            result.add(encode_geohash(cell_lat, cell_lng, precision))
+
+    return sorted(result)
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """使用 Haversine formula 計算兩點之間的距離
+
+    Returns:
+        float: 距離 (km)
+    """
+
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+
+    a = (
+        math.sin(d_lat / 2) ** 2
+        + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
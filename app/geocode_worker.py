@@ -0,0 +1,162 @@
+'''
+Author: weijay
+Date: 2026-10-18 22:05:16
+LastEditors: weijay
+LastEditTime: 2026-10-18 22:05:16
+Description: 在背景查詢 `pending_geocode` 餐廳經緯度的 worker (restaurant table 就是工作佇列)
+'''
+
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from app import geocoding
+from app.config.config import BaseConfig
+from app.database import SessionLocal, crud
+from app.utils import MapApiError
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_pending_restaurants(
+    db: Session,
+    batch_size: int = BaseConfig.GEOCODE_WORKER_BATCH_SIZE,
+    max_attempts: int = BaseConfig.GEOCODE_MAX_ATTEMPTS,
+) -> tuple:
+    """查詢一批等待查詢經緯度的餐廳 (使用快取和 batch API)
+
+    只有地圖 API 回應查不到經緯度時才會增加失敗次數，
+    地圖 API 無法使用時不會修改任何餐廳 (仍然是 `pending_geocode`)
+
+    Returns:
+        tuple: (這一批處理的餐廳數量, 成功查詢到經緯度的數量)
+
+    Raises:
+        MapApiError: 地圖 API 暫時無法使用
+    """
+
+    restaurants = crud.get_pending_geocode_restaurants(db, batch_size)
+
+    if not restaurants:
+        return 0, 0
+
+    coords = geocoding.get_coords_many(
+        db, [restaurant.address for restaurant in restaurants], BaseConfig.GEOCODE_CONCURRENCY
+    )
+
+    resolved = crud.update_restaurants_geocode(db, restaurants, coords, max_attempts)
+
+    return len(restaurants), resolved
+
+
+class GeocodeWorker:
+    """在 event loop 中執行的背景 worker
+
+    - 有新的 `pending_geocode` 餐廳時呼叫 `notify()` 立刻處理，
+      否則每 `interval` 秒檢查一次 (也會處理其他 process 新增的餐廳)
+    - 查詢經緯度和資料庫操作在 thread 中執行，不會阻塞 event loop
+    - 地圖 API 無法使用時暫停 `interval` 秒，之後每次加倍 (最多 `max_backoff` 秒)，
+      這段期間 `notify()` 不會喚醒 worker
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval: float = BaseConfig.GEOCODE_WORKER_INTERVAL,
+        batch_size: int = BaseConfig.GEOCODE_WORKER_BATCH_SIZE,
+        max_backoff: float = BaseConfig.GEOCODE_WORKER_MAX_BACKOFF,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._event: Optional[asyncio.Event] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """在目前的 event loop 中啟動 worker"""
+
+        if self.is_running:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止 worker，正在處理的這一批會被取消 (沒有 commit 的餐廳仍然是 `pending_geocode`)"""
+
+        if self._task is None:
+            return
+
+        self._task.cancel()
+
+        try:
+            await self._task
+
+        except asyncio.CancelledError:
+            pass
+
+        self._loop = None
+        self._task = None
+        self._event = None
+
+    def notify(self):
+        """通知 worker 有新的 `pending_geocode` 餐廳 (可以在其他 thread 中呼叫，例如同步的路由)"""
+
+        if self._event is None:
+            return
+
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+        except RuntimeError:
+            # event loop 已經關閉
+            pass
+
+    def _resolve_once(self) -> tuple:
+        with self.session_factory() as db:
+            return resolve_pending_restaurants(db, self.batch_size)
+
+    async def _run(self):
+        backoff = 0.0
+
+        while True:
+            self._event.clear()
+
+            try:
+                processed, resolved = await self._loop.run_in_executor(None, self._resolve_once)
+
+            except MapApiError as e:
+                backoff = min(self.max_backoff, backoff * 2 if backoff else self.interval)
+                logger.warning("Map API is unavailable, retry in %s seconds: %s", backoff, e)
+
+                await asyncio.sleep(backoff)
+                continue
+
+            except Exception:
+                logger.exception("Failed to resolve pending geocode restaurants.")
+                processed, resolved = 0, 0
+
+            backoff = 0.0
+
+            # 這一批是滿的而且有進展，代表可能還有等待中的餐廳，直接處理下一批
+            if processed >= self.batch_size and resolved > 0:
+                continue
+
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=self.interval)
+
+            except asyncio.TimeoutError:
+                pass
+
+
+geocode_worker = GeocodeWorker(SessionLocal)
@@ -0,0 +1,222 @@
+'''
+Author: weijay
+Date: 2026-10-18 21:24:37
+LastEditors: weijay
+LastEditTime: 2026-10-18 21:24:37
+Description: 地址轉換經緯度，先查記憶體 LRU 快取，再查資料庫快取，最後才呼叫地圖 API
+'''
+
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import anyio.from_thread
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.config.config import BaseConfig
+from app.database import crud
+from app.utils import AsyncMapApi, LRUCache, MapApi
+
+# 正規化後超過這個長度的地址不會寫入資料庫快取 (`geocode_cache.address` 的長度)
+MAX_CACHE_ADDRESS_LENGTH = 255
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_address(address: str) -> str:
+    """正規化地址，讓寫法不同但實際相同的地址可以共用快取
+
+    - 全形字元轉換成半形 (NFKC)
+    - 去掉頭尾空白，連續空白合併成一個
+    - 英文字母轉換成小寫
+    - `臺` 統一成 `台`
+    """
+
+    address = unicodedata.normalize("NFKC", address)
+    address = _WHITESPACE_PATTERN.sub(" ", address).strip()
+
+    return address.casefold().replace("臺", "台")
+
+
+coords_cache = LRUCache(
+    BaseConfig.GEOCODE_CACHE_LRU_SIZE, BaseConfig.GEOCODE_CACHE_TTL_DAYS * 24 * 60 * 60
+)
+
+
+def _request_coords_many(
+    addresses: List[str], max_workers: int
+) -> List[Tuple[Optional[float], Optional[float]]]:
+    """使用地圖 API 的 batch API 查詢多個地址
+
+    Raises:
+        MapApiError: 地圖 API 暫時無法使用
+    """
+
+    return MapApi().get_coords_many(addresses, max_workers)
+
+
+def _get_cached_coords(
+    db: Session, addresses: List[str]
+) -> Tuple[List[str], Dict[str, tuple], Dict[str, str]]:
+    """正規化地址後查詢記憶體快取，再一次查詢資料庫中還沒過期的快取
+
+    Returns:
+        Tuple[List[str], Dict[str, tuple], Dict[str, str]]: (每個地址正規化後的 key,
+        有快取的 key 對應的經緯度, 沒有快取的 key 對應的原始地址)，相同的 key 只會出現一次
+    """
+
+    keys = [normalize_address(address) for address in addresses]
+
+    coords: Dict[str, tuple] = {}
+    missing: Dict[str, str] = {}
+
+    for key, address in zip(keys, addresses):
+        if key in coords or key in missing:
+            continue
+
+        value = coords_cache.get(key)
+
+        if value is not None:
+            coords[key] = value
+
+        else:
+            missing[key] = address
+
+    if missing:
+        since = datetime.utcnow() - timedelta(days=BaseConfig.GEOCODE_CACHE_TTL_DAYS)
+        cached = crud.get_geocode_caches(
+            db, [key for key in missing if len(key) <= MAX_CACHE_ADDRESS_LENGTH], since
+        )
+
+        for key, value in cached.items():
+            coords[key] = value
+            coords_cache.set(key, value)
+            del missing[key]
+
+    return keys, coords, missing
+
+
+def _save_coords(db: Session, coords: Dict[str, tuple], results: Dict[str, tuple]):
+    """把地圖 API 查到的經緯度寫入 `coords` 和快取，查不到的結果不會寫入"""
+
+    resolved = {}
+
+    for key, (lat, lng) in results.items():
+        if lat is None or lng is None:
+            continue
+
+        coords[key] = (lat, lng)
+        coords_cache.set(key, (lat, lng))
+
+        if len(key) <= MAX_CACHE_ADDRESS_LENGTH:
+            resolved[key] = (lat, lng)
+
+    crud.save_geocode_caches(db, resolved)
+
+
+def get_coords_many(
+    db: Session, addresses: List[str], max_workers: int = 1
+) -> List[Tuple[Optional[float], Optional[float]]]:
+    """取得多個地址的經緯度，回傳的順序和 `addresses` 相同
+
+    1. 正規化地址，相同的地址只會查詢一次
+    2. 查詢記憶體快取
+    3. 一次查詢資料庫中還沒過期的快取
+    4. 剩下的地址每 100 個使用一次地圖 batch API 查詢 (最多同時 `max_workers` 個請求)，
+       查到的結果會寫入快取
+
+    查不到經緯度的地址回傳 `(None, None)` ，且不會寫入快取
+
+    Raises:
+        MapApiError: 地圖 API 暫時無法使用 (和查不到經緯度不同，呼叫端應該稍後重試)
+    """
+
+    keys, coords, missing = _get_cached_coords(db, addresses)
+
+    if missing:
+        results = _request_coords_many(list(missing.values()), max_workers)
+
+        _save_coords(db, coords, dict(zip(missing, results)))
+
+    return [coords.get(key, (None, None)) for key in keys]
+
+
+def get_coords(db: Session, address: str) -> Tuple[Optional[float], Optional[float]]:
+    """取得一個地址的經緯度，查不到時回傳 `(None, None)`
+
+    Raises:
+        MapApiError: 地圖 API 暫時無法使用
+    """
+
+    return get_coords_many(db, [address])[0]
+
+
+def get_cached_coords(db: Session, address: str) -> Tuple[Optional[float], Optional[float]]:
+    """只從快取取得一個地址的經緯度，不會呼叫地圖 API，沒有快取時回傳 `(None, None)`"""
+
+    keys, coords, _ = _get_cached_coords(db, [address])
+
+    return coords.get(keys[0], (None, None))
+
+
+_async_map_api: Optional[AsyncMapApi] = None
+
+
+def get_async_map_api() -> AsyncMapApi:
+    """取得共用的非同步地圖 API client (共用連線池和斷路器)"""
+
+    global _async_map_api
+
+    if _async_map_api is None:
+        _async_map_api = AsyncMapApi()
+
+    return _async_map_api
+
+
+async def close_async_map_api():
+    """關閉共用的非同步地圖 API client 的連線池"""
+
+    if _async_map_api is not None:
+        await _async_map_api.aclose()
+
+
+def get_coords_from_thread(db: Session, address: str) -> Tuple[Optional[float], Optional[float]]:
+    """和 `get_coords()` 相同，但地圖 API 的請求交給 event loop 中共用的非同步 client 執行
+    (共用連線池、重試和斷路器)，資料庫操作仍然在目前的 thread 中執行
+
+    只能在 event loop 的 worker thread 中呼叫 (例如同步的路由)
+
+    Raises:
+        MapApiError: 地圖 API 暫時無法使用
+    """
+
+    keys, coords, missing = _get_cached_coords(db, [address])
+
+    if missing:
+        key, address = next(iter(missing.items()))
+        result = anyio.from_thread.run(get_async_map_api().get_coords, address)
+
+        _save_coords(db, coords, {key: result})
+
+    return coords.get(keys[0], (None, None))
+
+
+async def get_coords_async(db: Session, address: str) -> Tuple[Optional[float], Optional[float]]:
+    """和 `get_coords()` 相同，但使用共用的非同步地圖 API client (共用連線池、重試和斷路器)，
+    等待 API 回應時不會佔用 thread，查詢和寫入快取在 thread pool 中執行，不會阻塞 event loop
+
+    Raises:
+        MapApiError: 地圖 API 暫時無法使用
+    """
+
+    keys, coords, missing = await run_in_threadpool(_get_cached_coords, db, [address])
+
+    if missing:
+        key, address = next(iter(missing.items()))
+        result = await get_async_map_api().get_coords(address)
+
+        await run_in_threadpool(_save_coords, db, coords, {key: result})
+
+    return coords.get(keys[0], (None, None))
@@ -0,0 +1,107 @@
+'''
+Author: weijay
+Date: 2026-10-18 17:48:20
+LastEditors: weijay
+LastEditTime: 2026-10-18 17:48:20
+Description: 餐廳每週營業時間的 bitmap (7 天 x 96 個 15 分鐘時段)
+'''
+
+import math
+from datetime import datetime, time
+from typing import Iterable, Optional, Tuple, Union
+
+DAYS_OF_WEEK = 7
+
+# 一個時段 15 分鐘，一天有 96 個時段
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# 7 x 96 = 672 bits = 84 bytes
+BITMAP_SIZE = DAYS_OF_WEEK * SLOTS_PER_DAY // 8
+
+
+def _to_minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _to_slot_index(day_of_week: int, slot: int) -> int:
+    """把星期幾 (1~7) 和當天的第幾個時段轉換成 bitmap 中的位置，超過一天的時段會算到隔天"""
+
+    return ((day_of_week - 1) * SLOTS_PER_DAY + slot) % (DAYS_OF_WEEK * SLOTS_PER_DAY)
+
+
+def build_bitmap(open_times: Iterable[Tuple[int, time, time]]) -> Optional[bytes]:
+    """根據營業時間 (星期幾, 開始時間, 結束時間) 產生 bitmap
+
+    - 只要營業時間有涵蓋到某個時段的一部分，這個時段就會被設定成營業中
+    - 結束時間比開始時間早 (例如 18:00 ~ 02:00) 代表營業到隔天，
+      星期日 (7) 跨夜會接到星期一 (1)
+    - 開始時間和結束時間相同代表營業 24 小時
+    - 星期幾不在 1~7 之間的營業時間會被忽略
+
+    bit 的位置為 `(day_of_week - 1) * 96 + slot` ，第 n 個 bit 存在第 n // 8 個 byte 的第 n % 8 個 bit
+    (從最低位開始)，和 PostgreSQL `get_bit()` 的順序相同
+
+    Returns:
+        Optional[bytes]: 如果沒有任何營業時間，回傳 `None`
+    """
+
+    bitmap = bytearray(BITMAP_SIZE)
+    has_open_time = False
+
+    for day_of_week, open_time, close_time in open_times:
+        if not 1 <= day_of_week <= DAYS_OF_WEEK:
+            continue
+
+        has_open_time = True
+
+        start = _to_minutes(open_time)
+        end = _to_minutes(close_time)
+
+        if end <= start:
+            end += 24 * 60
+
+        for slot in range(start // SLOT_MINUTES, math.ceil(end / SLOT_MINUTES)):
+            index = _to_slot_index(day_of_week, slot)
+            bitmap[index // 8] |= 1 << (index % 8)
+
+    if not has_open_time:
+        return None
+
+    return bytes(bitmap)
+
+
+def get_slot_index(day_of_week: Union[int, str], current_time: Union[time, str]) -> Optional[int]:
+    """取得 `day_of_week` 的 `current_time` (HH:MM) 在 bitmap 中的位置
+
+    如果 `day_of_week` 或 `current_time` 的格式不正確，回傳 `None`
+    """
+
+    try:
+        day_of_week = int(day_of_week)
+
+        if isinstance(current_time, str):
+            current_time = datetime.strptime(current_time, "%H:%M").time()
+
+    except ValueError:
+        return None
+
+    if not 1 <= day_of_week <= DAYS_OF_WEEK:
+        return None
+
+    return _to_slot_index(day_of_week, _to_minutes(current_time) // SLOT_MINUTES)
+
+
+def is_open(bitmap: Optional[bytes], slot_index: int) -> bool:
+    """檢查 `bitmap` 在 `slot_index` 的時段是否營業中"""
+
+    if bitmap is None:
+        return False
+
+    return bool(bitmap[slot_index // 8] >> (slot_index % 8) & 1)
+
+
+def get_slot_index_at(at: datetime) -> int:
+    """取得 `at` 在 bitmap 中的位置 (星期一為 1)"""
+
+    return _to_slot_index(at.isoweekday(), _to_minutes(at.time()) // SLOT_MINUTES)
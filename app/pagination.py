@@ -0,0 +1,56 @@
+'''
+Author: weijay
+Date: 2026-10-18 19:02:46
+LastEditors: weijay
+LastEditTime: 2026-10-18 19:02:46
+Description: 列表 API 使用的 cursor (keyset) 分頁
+'''
+
+import base64
+import json
+from typing import Optional, Tuple
+
+
+def encode_cursor(last_id: int) -> str:
+    """把這一頁最後一筆資料的 ID 轉換成不透明的 cursor 字串"""
+
+    data = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """把 cursor 轉換回上一頁最後一筆資料的 ID，沒有 cursor 時回傳 `None`
+
+    Raises:
+        ValueError: cursor 格式不正確
+    """
+
+    if not cursor:
+        return None
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last_id = data["id"]
+
+    except (ValueError, TypeError, KeyError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    if not isinstance(last_id, int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    return last_id
+
+
+def get_page(items: list, limit: int) -> Tuple[list, Optional[str]]:
+    """從多查詢一筆 (`limit` + 1) 的結果中取出這一頁的資料和下一頁的 cursor
+
+    如果沒有下一頁，cursor 為 `None`
+    """
+
+    if len(items) <= limit:
+        return items, None
+
+    items = items[:limit]
+
+    return items, encode_cursor(items[-1].id)
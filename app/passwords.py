@@ -0,0 +1,155 @@
+'''
+Author: weijay
+Date: 2026-10-19 00:12:44
+LastEditors: weijay
+LastEditTime: 2026-10-19 00:12:44
+Description: 密碼雜湊和驗證
+
+- 新密碼使用設定的演算法 (預設 argon2id)，其他支援的演算法只用來驗證舊的雜湊
+- argon2 和 bcrypt 是 CPU 密集的計算，非同步的版本會在獨立的 process pool 中執行 (不受 GIL 限制)，
+  不會佔用 FastAPI 處理其他請求的 thread
+'''
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from app.config import config
+
+# 支援的雜湊演算法，不是目前設定的演算法都會被標記成過時
+PASSWORD_SCHEMES = ("argon2", "bcrypt")
+
+pwd_context = CryptContext(schemes=list(PASSWORD_SCHEMES), deprecated="auto")
+
+_max_workers = 0
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def configure_password_hashing(api_config=config.BaseConfig):
+    """根據設定類別設定雜湊演算法和參數，以及 process pool 的大小 (會關閉已經建立的 process pool)
+
+    Raises:
+        ValueError: 不支援 `PASSWORD_SCHEME` 設定的演算法
+    """
+
+    global _max_workers
+
+    if api_config.PASSWORD_SCHEME not in PASSWORD_SCHEMES:
+        raise ValueError(f"Unsupported password scheme: {api_config.PASSWORD_SCHEME}")
+
+    pwd_context.load(
+        {
+            "schemes": list(PASSWORD_SCHEMES),
+            "default": api_config.PASSWORD_SCHEME,
+            "deprecated": "auto",
+            "argon2__type": "ID",
+            "argon2__memory_cost": api_config.PASSWORD_ARGON2_MEMORY_COST,
+            "argon2__time_cost": api_config.PASSWORD_ARGON2_TIME_COST,
+            "argon2__parallelism": api_config.PASSWORD_ARGON2_PARALLELISM,
+            "bcrypt__rounds": api_config.PASSWORD_BCRYPT_ROUNDS,
+        }
+    )
+
+    shutdown_password_pool()
+
+    _max_workers = api_config.PASSWORD_HASH_WORKERS
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, password_hash: Optional[str]) -> bool:
+    """驗證密碼，沒有密碼雜湊 (例如 OAuth 使用者) 時回傳 `False`"""
+
+    if not password_hash:
+        return False
+
+    return pwd_context.verify(password, password_hash)
+
+
+def needs_update(password_hash: Optional[str]) -> bool:
+    """檢查密碼雜湊是否使用過時的演算法或參數，需要用目前的設定重新計算"""
+
+    if not password_hash:
+        return False
+
+    return pwd_context.needs_update(password_hash)
+
+
+def _init_worker(context_config: str):
+    """讓 process pool 中的 process 使用和主 process 相同的雜湊設定"""
+
+    pwd_context.load(context_config)
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+
+    if _max_workers <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_max_workers,
+                initializer=_init_worker,
+                initargs=(pwd_context.to_string(),),
+            )
+
+        return _pool
+
+
+def shutdown_password_pool():
+    """關閉 process pool，下一次呼叫非同步的函式時會重新建立"""
+
+    global _pool
+
+    with _pool_lock:
+        pool, _pool = _pool, None
+
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+async def _run(func, *args):
+    global _pool
+
+    # 沒有 process pool 時使用 event loop 預設的 thread pool
+    pool = _get_pool()
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+    except BrokenProcessPool:
+        # process 意外結束時 pool 就不能再使用，丟棄後下一次呼叫會重新建立
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+
+        raise
+
+
+async def hash_password_async(password: str) -> str:
+    """和 `hash_password()` 相同，但在 process pool 中計算"""
+
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(password: str, password_hash: Optional[str]) -> bool:
+    """和 `verify_password()` 相同，但在 process pool 中計算"""
+
+    if not password_hash:
+        return False
+
+    return await _run(verify_password, password, password_hash)
+
+
+# 使用 `APP_ENV` 對應的設定，沒有設定時使用 `BaseConfig` (`create_app()` 會再依照 app 的設定重新設定)
+configure_password_hashing(config.config_dict.get(os.environ.get("APP_ENV"), config.BaseConfig))
@@ -0,0 +1,229 @@
+'''
+Author: weijay
+Date: 2026-10-19 01:20:36
+LastEditors: weijay
+LastEditTime: 2026-10-19 01:20:36
+Description: 登入的 token bucket 限流，在計算密碼雜湊之前拒絕過多的登入嘗試
+
+每個使用者名稱和每個 client IP 各有一個 bucket，每次登入嘗試兩個 bucket 都要拿到 token ，
+登入成功時會補滿使用者名稱的 bucket (只有連續失敗會被限制)
+'''
+
+import ipaddress
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.config import config
+
+
+class RateLimitBackend(ABC):
+    """token bucket 的儲存後端介面
+
+    目前只有 `LocalRateLimitBackend` (每個 process 各自計算)，要在多個 process 之間共用限流狀態時
+    (例如 Redis + Lua script)，實作這個介面後傳入 `LoginRateLimiter`，`consume()` 必須是原子操作
+    """
+
+    @abstractmethod
+    def consume(self, key: str, capacity: float, refill_rate: float) -> float:
+        """從 `key` 的 bucket 拿一個 token (bucket 最多 `capacity` 個 token ，每秒補充 `refill_rate` 個)
+
+        Returns:
+            float: 0 代表拿到 token ，否則是還需要等待的秒數
+        """
+
+    @abstractmethod
+    def reset(self, key: str):
+        """補滿 `key` 的 bucket"""
+
+    @abstractmethod
+    def clear(self):
+        """清除所有 bucket"""
+
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """存在 process 記憶體中的後端 (預設)，也是共用後端的本地替身
+
+    最多保存 `maxsize` 個 bucket ，超過時丟棄最久沒有使用的 (等同補滿)
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+
+        # key -> (目前的 token 數量, 上次更新的時間)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, capacity: float, refill_rate: float) -> float:
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+
+            else:
+                wait = (1 - tokens) / refill_rate if refill_rate > 0 else math.inf
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+    def reset(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class LoginRateLimiter:
+    """登入限流，分別限制每個使用者名稱和每個 client IP 的登入嘗試次數
+
+    Args:
+        username_burst (int): 同一個使用者名稱可以連續嘗試的次數
+        username_per_minute (float): 同一個使用者名稱每分鐘恢復的嘗試次數
+        ip_burst (int): 同一個 IP 可以連續嘗試的次數
+        ip_per_minute (float): 同一個 IP 每分鐘恢復的嘗試次數
+        trusted_proxies (List[str]): 信任的 reverse proxy IP 或網段
+    """
+
+    def __init__(
+        self,
+        backend: Optional[RateLimitBackend] = None,
+        enabled: bool = config.BaseConfig.LOGIN_RATE_LIMIT_ENABLE,
+        username_burst: int = config.BaseConfig.LOGIN_USERNAME_BURST,
+        username_per_minute: float = config.BaseConfig.LOGIN_USERNAME_PER_MINUTE,
+        ip_burst: int = config.BaseConfig.LOGIN_IP_BURST,
+        ip_per_minute: float = config.BaseConfig.LOGIN_IP_PER_MINUTE,
+        trusted_proxies: List[str] = config.BaseConfig.LOGIN_TRUSTED_PROXIES,
+    ):
+        self.backend = backend if backend is not None else LocalRateLimitBackend()
+        self.enabled = enabled
+        self.username_burst = username_burst
+        self.username_per_minute = username_per_minute
+        self.ip_burst = ip_burst
+        self.ip_per_minute = ip_per_minute
+        self.set_trusted_proxies(trusted_proxies)
+
+        self._counters = {"allowed": 0, "throttled_username": 0, "throttled_ip": 0}
+        self._counters_lock = threading.Lock()
+
+    def configure(self, api_config=config.BaseConfig):
+        """根據設定類別設定限流的參數"""
+
+        self.enabled = api_config.LOGIN_RATE_LIMIT_ENABLE
+        self.username_burst = api_config.LOGIN_USERNAME_BURST
+        self.username_per_minute = api_config.LOGIN_USERNAME_PER_MINUTE
+        self.ip_burst = api_config.LOGIN_IP_BURST
+        self.ip_per_minute = api_config.LOGIN_IP_PER_MINUTE
+        self.set_trusted_proxies(api_config.LOGIN_TRUSTED_PROXIES)
+
+    def set_trusted_proxies(self, trusted_proxies: List[str]):
+        self._trusted_proxies = [
+            ipaddress.ip_network(proxy, strict=False) for proxy in trusted_proxies
+        ]
+
+    def _is_trusted_proxy(self, host: str) -> bool:
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+
+        return any(address in network for network in self._trusted_proxies)
+
+    def get_client_ip(self, remote_addr: Optional[str], forwarded_for: Optional[str] = None) -> str:
+        """取得用來限流的 client IP
+
+        連線來自信任的 proxy 時，從 `X-Forwarded-For` 由右往左找第一個不是信任 proxy 的 IP
+        (最左邊的值可以被 client 偽造，所以不能直接使用)，否則使用連線的來源 IP
+
+        Args:
+            remote_addr (Optional[str]): 連線的來源 IP
+            forwarded_for (Optional[str]): `X-Forwarded-For` header 的值
+        """
+
+        if not remote_addr:
+            return "unknown"
+
+        if not forwarded_for or not self._is_trusted_proxy(remote_addr):
+            return remote_addr
+
+        client_ip = remote_addr
+
+        for host in reversed([host.strip() for host in forwarded_for.split(",")]):
+            if not host:
+                break
+
+            client_ip = host
+
+            if not self._is_trusted_proxy(host):
+                break
+
+        return client_ip
+
+    def _count(self, name: str):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def acquire(self, username: str, client_ip: str) -> float:
+        """嘗試登入前呼叫，先檢查 IP 再檢查使用者名稱
+
+        Returns:
+            float: 0 代表可以嘗試登入，否則是還需要等待的秒數
+        """
+
+        if not self.enabled:
+            return 0.0
+
+        wait = self.backend.consume(f"ip:{client_ip}", self.ip_burst, self.ip_per_minute / 60)
+
+        if wait > 0:
+            self._count("throttled_ip")
+            return wait
+
+        wait = self.backend.consume(
+            f"username:{username}", self.username_burst, self.username_per_minute / 60
+        )
+
+        if wait > 0:
+            self._count("throttled_username")
+            return wait
+
+        self._count("allowed")
+
+        return 0.0
+
+    def reset_username(self, username: str):
+        """登入成功後補滿使用者名稱的 bucket"""
+
+        if self.enabled:
+            self.backend.reset(f"username:{username}")
+
+    def get_stats(self) -> Dict[str, int]:
+        """取得登入嘗試的計數 (允許、因為使用者名稱被限制、因為 IP 被限制)"""
+
+        with self._counters_lock:
+            return dict(self._counters)
+
+    def reset_stats(self):
+        with self._counters_lock:
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+login_rate_limiter = LoginRateLimiter()
@@ -6,7 +6,7 @@ LastEditTime: 2023-06-20 02:33:47
 Description: 初始化 rotuer
 '''
 
-from . import restaurant_router, user_router
+from . import monitor_router, restaurant_router, user_router
 
 
 def register_router(app, root_prefix):
@@ -14,3 +14,4 @@ def register_router(app, root_prefix):
 
     app.include_router(restaurant_router.router, prefix=root_prefix, tags=["餐廳相關路由"])
     app.include_router(user_router.router, prefix=root_prefix, tags=["使用者相關路由"])
+    app.include_router(monitor_router.router, prefix=root_prefix, tags=["監控相關路由"])
@@ -13,9 +13,10 @@ from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
 
 from app.database import SessionLocal, crud
-from app.error_handle import CustomError
-from app.schemas import auth_schema
+from app.error_handle import CustomError, ErrorHandler
+from app.schemas import auth_schema, user_schema
 from app.config.config import BaseConfig
+from app import user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -30,22 +31,75 @@ def get_db():
         db.close()
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+def _decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, BaseConfig.JWT_SECRET_KEY, algorithms=BaseConfig.JWT_ALGORITHM)
-        username = payload.get("sub")
-
-        if username is None:
-            CustomError.credentials_execption()
-
-        token_data = auth_schema.TokenData(username=username)
 
     except JWTError:
         CustomError.credentials_execption()
 
-    user = crud.get_user_with_username(db, token_data.username)
+    if payload.get("sub") is None:
+        CustomError.credentials_execption()
+
+    return payload
+
+
+def _get_user(db: Session, username: str) -> "user_schema.OnReadNoOAuthModel":
+    """先從快取取得使用者，沒有快取時才查詢資料庫"""
+
+    token_data = auth_schema.TokenData(username=username)
 
-    if user is None:
+    user = user_cache.get_cached_user(token_data.username)
+
+    if user is not None:
+        return user
+
+    db_user = crud.get_user_with_username(db, token_data.username)
+
+    if db_user is None:
         CustomError.credentials_execption()
 
-    return user
+    return user_cache.cache_user(db_user)
+
+
+def get_current_user(
+    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+) -> "user_schema.OnReadNoOAuthModel":
+    """取得目前認證的使用者 (和 session 無關的使用者資料，快取 `USER_CACHE_TTL` 秒)"""
+
+    payload = _decode_token(token)
+
+    return _get_user(db, payload["sub"])
+
+
+def get_current_user_id(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> int:
+    """只取得目前認證的使用者 ID
+
+    使用 JWT 中的 `uid` 確認使用者還存在 (先查詢快取)，舊的 token 沒有 `uid` 時用使用者名稱查詢
+    """
+
+    payload = _decode_token(token)
+    user_id = payload.get("uid")
+
+    if user_id is None:
+        return _get_user(db, payload["sub"]).id
+
+    user_id = int(user_id)
+
+    if user_cache.get_cached_user_by_id(user_id) is None:
+        db_user = crud.get_user(db, user_id)
+
+        # 使用者已經被刪除
+        if db_user is None:
+            CustomError.credentials_execption()
+
+        user_cache.cache_user(db_user)
+
+    return user_id
+
+
+def verify_monitor_access(user_id: int = Depends(get_current_user_id)):
+    """監控路由只有在設定 `MONITOR_ENABLE` 時開放，而且使用者要已經登入"""
+
+    if not BaseConfig.MONITOR_ENABLE:
+        ErrorHandler.raise_404()
@@ -0,0 +1,29 @@
+'''
+Author: weijay
+Date: 2026-10-18 22:48:19
+LastEditors: weijay
+LastEditTime: 2026-10-18 22:48:19
+Description: 監控路由
+'''
+
+from fastapi import APIRouter, Depends
+
+from app import database
+from app.rate_limit import login_rate_limiter
+from app.routers.depends import verify_monitor_access
+
+router = APIRouter(prefix="/monitor")
+
+
+@router.get("/db-pool", dependencies=[Depends(verify_monitor_access)])
+def read_db_pool_stats():
+    """取得資料庫連線池的使用狀況"""
+
+    return database.get_pool_stats()
+
+
+@router.get("/login-rate-limit", dependencies=[Depends(verify_monitor_access)])
+def read_login_rate_limit_stats():
+    """取得登入嘗試被允許和被限流的次數"""
+
+    return login_rate_limiter.get_stats()
@@ -6,16 +6,22 @@ LastEditTime: 2023-07-19 01:43:00
 Description: 餐廳路由
 '''
 
-from datetime import datetime
-from typing import Union
+from datetime import datetime, timezone
+from typing import Any, List, Union
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Body, Depends, File, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.schemas import restaurant_schema, database_schema
-from app.database import crud
-from app.utils import MapApi
+from app import bulk_import, export, geocoding, pagination
+from app.config.config import BaseConfig
+from app.database import crud, model
+from app.spatial_index import restaurant_index
 from app.error_handle import ErrorHandler
+from app.geocode_worker import geocode_worker
+from app.utils import MapApiError
 from app.routers.depends import get_db
 
 
@@ -23,40 +29,65 @@ router = APIRouter(prefix="/restaurant")
 
 
 @router.get("/", response_model=restaurant_schema.OnReadsModel)
-def read_restaurants(db: Session = Depends(get_db)):
-    """取得所有餐廳"""
+def read_restaurants(
+    at: Union[datetime, None] = Query(
+        default=None, description="要計算是否營業中的時間，預設為現在"
+    ),
+    cursor: Union[str, None] = Query(default=None, description="上一頁回傳的 next_cursor"),
+    limit: int = Query(default=100, ge=1, le=100, description="一頁的最大餐廳數量"),
+    db: Session = Depends(get_db),
+):
+    """取得所有餐廳 (使用 cursor 分頁)"""
 
-    items = crud.get_restaurants(db)
+    try:
+        after_id = pagination.decode_cursor(cursor)
 
-    return restaurant_schema.OnReadsModel(items=items)
+    except ValueError:
+        ErrorHandler.raise_400(f"The cursor '{cursor}' is invalid.")
 
+    # 多查詢一筆，用來判斷有沒有下一頁
+    items, next_cursor = pagination.get_page(crud.get_restaurants(db, after_id, limit + 1), limit)
 
-@router.post("/", status_code=201)
-def create_restaurant(items: restaurant_schema.OnCreateModel, db: Session = Depends(get_db)):
-    """新增餐廳"""
+    crud.set_restaurants_is_open(items, at or datetime.now())
 
-    # 檢查傳入的 open_time 中的 time 格式
-    if items.open_times is not None:
-        for open_time in items.open_times:
-            try:
-                datetime.strptime(open_time.open_time, "%H:%M").time()
-                datetime.strptime(open_time.close_time, "%H:%M").time()
+    return restaurant_schema.OnReadsModel(items=items, next_cursor=next_cursor)
 
-            except ValueError:
-                ErrorHandler.raise_400("time format error, it should be %H:%M format.")
 
-    # 使用第三方 Api 取得經緯度
-    lat, lng = MapApi().get_coords(items.address)
+@router.get("/export")
+def export_restaurants(
+    since: Union[datetime, None] = Query(
+        default=None, description="只匯出這個時間 (UTC) 之後新增或更新的餐廳"
+    ),
+    compress: bool = Query(default=False, description="是否使用 gzip 壓縮"),
+    db: Session = Depends(get_db),
+):
+    """以 NDJSON (一行一筆 JSON) 串流匯出所有餐廳"""
 
-    full_item = database_schema.RestaurantDBModel(**items.dict(), lat=lat, lng=lng)
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
 
-    if not (lat and lng):
-        ErrorHandler.raise_400(
-            f"The address '{items.address}' format is incorrect and cannot be processed correctly."
+    content = export.iter_ndjson(crud.iter_restaurants_for_export(db, since))
+
+    if compress:
+        return StreamingResponse(
+            export.iter_gzip(content),
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="restaurants.ndjson.gz"'},
         )
 
+    return StreamingResponse(content, media_type="application/x-ndjson")
+
+
+def _save_restaurant(db: Session, items: restaurant_schema.OnCreateModel, lat, lng):
+    """新增餐廳和營業時間 (同步的資料庫操作，在 thread pool 中執行)"""
+
+    full_item = database_schema.RestaurantDBModel(**items.dict(), lat=lat, lng=lng)
+
     r = crud.create_restaurant(db, full_item)
 
+    if r.geocode_status == model.GEOCODE_STATUS_PENDING:
+        geocode_worker.notify()
+
     if items.open_times is not None:
         db_open_times = []
 
@@ -71,24 +102,120 @@ def create_restaurant(items: restaurant_schema.OnCreateModel, db: Session = Depe
 
         crud.create_restaurant_open_times(db, r.id, db_open_times)
 
+
+@router.post("/", status_code=201)
+async def create_restaurant(items: restaurant_schema.OnCreateModel, db: Session = Depends(get_db)):
+    """新增餐廳"""
+
+    # 檢查傳入的 open_time 中的 time 格式
+    if items.open_times is not None:
+        for open_time in items.open_times:
+            try:
+                datetime.strptime(open_time.open_time, "%H:%M").time()
+                datetime.strptime(open_time.close_time, "%H:%M").time()
+
+            except ValueError:
+                ErrorHandler.raise_400("time format error, it should be %H:%M format.")
+
+    # 資料庫操作在 thread pool 中執行，等待地圖 Api 回應時不會佔用 thread
+    if BaseConfig.GEOCODE_DEFERRED:
+        # 只查詢快取，沒有快取就先以 pending_geocode 狀態新增，交給背景 worker 查詢經緯度
+        lat, lng = await run_in_threadpool(geocoding.get_cached_coords, db, items.address)
+
+    else:
+        # 使用第三方 Api 取得經緯度 (會先查詢快取)
+        try:
+            lat, lng = await geocoding.get_coords_async(db, items.address)
+
+        except MapApiError:
+            ErrorHandler.raise_503("The geocoding service is temporarily unavailable.")
+
+        if not (lat and lng):
+            ErrorHandler.raise_400(
+                f"The address '{items.address}' format is incorrect "
+                "and cannot be processed correctly."
+            )
+
+    await run_in_threadpool(_save_restaurant, db, items, lat, lng)
+
     return {"message": "created."}
 
 
+def _import_restaurants(db: Session, items: list) -> dict:
+    # 地圖 API 無法使用時整批都不會匯入，讓 client 稍後重試
+    try:
+        return bulk_import.import_restaurants(db, items, BaseConfig.GEOCODE_CONCURRENCY)
+
+    except MapApiError:
+        ErrorHandler.raise_503("The geocoding service is temporarily unavailable.")
+
+
+@router.post("/import", status_code=201, response_model=restaurant_schema.OnImportModel)
+def import_restaurants(items: List[Any] = Body(...), db: Session = Depends(get_db)):
+    """批次匯入餐廳 (JSON array，每一筆的格式和新增餐廳相同)
+
+    格式錯誤或是查不到經緯度的資料不會匯入，會在 `errors` 中回傳原因
+    """
+
+    if len(items) > BaseConfig.IMPORT_MAX_ROWS:
+        ErrorHandler.raise_400(f"Too many rows, the maximum is {BaseConfig.IMPORT_MAX_ROWS}.")
+
+    return _import_restaurants(db, items)
+
+
+@router.post("/import/csv", status_code=201, response_model=restaurant_schema.OnImportModel)
+def import_restaurants_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """批次匯入餐廳 (CSV 檔案，UTF-8 編碼)
+
+    欄位: `name` 、 `address` 、 `phone` 、 `desc` 、 `price` 、 `open_times`
+
+    `open_times` 的格式為 `星期幾|開始時間|結束時間` ，多個營業時間用 `;` 分隔，例如 `1|11:00|14:00;1|17:00|21:00`
+    """
+
+    try:
+        content = file.file.read().decode("utf-8-sig")
+
+    except UnicodeDecodeError:
+        ErrorHandler.raise_400("The CSV file should be UTF-8 encoded.")
+
+    items = bulk_import.parse_csv(content)
+
+    if len(items) > BaseConfig.IMPORT_MAX_ROWS:
+        ErrorHandler.raise_400(f"Too many rows, the maximum is {BaseConfig.IMPORT_MAX_ROWS}.")
+
+    return _import_restaurants(db, items)
+
+
 @router.patch("/{restaurant_id}", status_code=200)
 def update_restaurant(
     restaurant_id: str, item: restaurant_schema.OnUpdateModel, db: Session = Depends(get_db)
 ):
     """更新餐廳"""
 
-    # TODO 這裡要檢查有沒有更改到 `address` ，如果有，要重新取得經緯度
+    # 地址有更改時會重新取得經緯度 (會先查詢快取)
+    try:
+        updated_restaurant = crud.update_restaurant(
+            db,
+            restaurant_id,
+            database_schema.RestaurantUpdateDBModel(**item.dict()),
+            defer_geocode=BaseConfig.GEOCODE_DEFERRED,
+            get_coords=geocoding.get_coords_from_thread,
+        )
 
-    updated_restaurant = crud.update_restaurant(
-        db, restaurant_id, database_schema.RestaurantUpdateDBModel(**item.dict())
-    )
+    except ValueError:
+        ErrorHandler.raise_400(
+            f"The address '{item.address}' format is incorrect and cannot be processed correctly."
+        )
+
+    except MapApiError:
+        ErrorHandler.raise_503("The geocoding service is temporarily unavailable.")
 
     if not updated_restaurant:
         ErrorHandler.raise_404(f"The restaurant ID: {restaurant_id} is not founded in database.")
 
+    if updated_restaurant.geocode_status == model.GEOCODE_STATUS_PENDING:
+        geocode_worker.notify()
+
     return {"message": "updated."}
 
 
@@ -158,15 +285,43 @@ def read_restaurant_randomly(
     day_of_week: Union[int, None] = Query(default=None, description="星期幾"),
     current_time: Union[str, None] = Query(default=None, description="目前時間 (HH:MM) 24H"),
     limit: Union[int, None] = Query(default=1, ge=1, le=10, description="一次回傳的最大的餐廳數量"),
+    mode: str = Query(
+        default="random",
+        regex="^(random|nearest)$",
+        description="random: 隨機選擇, nearest: 距離最近",
+    ),
+    at: Union[datetime, None] = Query(
+        default=None, description="要計算是否營業中的時間，預設為現在"
+    ),
     db: Session = Depends(get_db),
 ):
-    """隨機取得範圍內的餐廳ㄧ"""
+    """隨機 (或依照距離由近到遠) 取得範圍內的餐廳ㄧ"""
+
+    is_filter_open_time = bool(day_of_week and current_time)
 
-    if day_of_week and current_time:
+    if mode == "nearest":
+        if not is_filter_open_time and restaurant_index.is_ready:
+            items = restaurant_index.nearest(lat, lng, distance, limit)
+            random_restaurants = crud.get_restaurants_with_ids(
+                db, [r_id for r_id, _ in items], [r_distance for _, r_distance in items]
+            )
+        else:
+            random_restaurants = crud.get_restaurant_nearest(
+                db, lat, lng, distance, limit, day_of_week, current_time
+            )
+    elif is_filter_open_time:
         random_restaurants = crud.get_restaurant_randomly_with_open_time(
             db, lat, lng, distance, day_of_week, current_time, limit
         )
+    elif restaurant_index.is_ready:
+        # 在記憶體中的空間索引完成距離篩選和隨機抽樣，資料庫只用來取得選到的餐廳資料
+        items = restaurant_index.sample(lat, lng, distance, limit)
+        random_restaurants = crud.get_restaurants_with_ids(
+            db, [r_id for r_id, _ in items], [r_distance for _, r_distance in items]
+        )
     else:
         random_restaurants = crud.get_restaurant_randomly(db, lat, lng, distance, limit)
 
+    crud.set_restaurants_is_open(random_restaurants, at, day_of_week, current_time)
+
     return restaurant_schema.OnReadsModel(items=random_restaurants)
@@ -9,24 +9,44 @@ Description: 使用者路由，這些 api 需要通過認證後才能存取
 from typing import Optional
 from datetime import timedelta, datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
 
-from app import auth
+from app import auth, geocoding, pagination, passwords
 from app.schemas import user_schema, database_schema, auth_schema, restaurant_schema
+from app.config.config import BaseConfig
 from app.database import crud, model
-from app.routers.depends import get_db, get_current_user
-from app.error_handle import ErrorHandler
-from app.utils import MapApi
+from app.routers.depends import get_db, get_current_user_id
+from app.error_handle import CustomError, ErrorHandler
+from app.geocode_worker import geocode_worker
+from app.rate_limit import login_rate_limiter
+from app.utils import MapApiError
 
 
 router = APIRouter(prefix="/user")
 
 
 @router.post("/token", response_model=auth_schema.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+async def login(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db),
+):
+    # 在驗證密碼之前限流，被限制的嘗試不會查詢資料庫和計算密碼雜湊
+    client_ip = login_rate_limiter.get_client_ip(
+        request.client.host if request.client else None, request.headers.get("x-forwarded-for")
+    )
+    retry_after = login_rate_limiter.acquire(form_data.username, client_ip)
+
+    if retry_after > 0:
+        ErrorHandler.raise_429("Too many login attempts.", retry_after)
+
+    user = await auth.authenticate_user_async(
+        db, form_data.username, form_data.password, background_tasks
+    )
 
     if not user:
         raise HTTPException(
@@ -35,49 +55,75 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    login_rate_limiter.reset_username(form_data.username)
+
     access_token_expires = timedelta(minutes=15)
     acess_token = auth.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
 
     return {"access_token": acess_token, "token_type": "bearer"}
 
 
 @router.post("/", status_code=201)
-def register(items: user_schema.OnCreateNoOAuthModel, db: Session = Depends(get_db)):
-    user = crud.get_user_with_username(db, items.username)
+async def register(items: user_schema.OnCreateNoOAuthModel, db: Session = Depends(get_db)):
+    # 資料庫操作在 thread pool 中執行，不會阻塞 event loop
+    user = await run_in_threadpool(crud.get_user_with_username, db, items.username)
 
     if user:
         raise HTTPException(409, "username or email is exist.")
 
-    user = crud.get_user_with_email(db, items.email)
+    user = await run_in_threadpool(crud.get_user_with_email, db, items.email)
 
     if user:
         raise HTTPException(409, "username or email is exist.")
 
-    crud.create_user_not_oauth(db, database_schema.UserNotOAuthDBModel(**items.dict()))
+    password_hash = await passwords.hash_password_async(items.password)
+
+    await run_in_threadpool(
+        crud.create_user_not_oauth,
+        db,
+        database_schema.UserNotOAuthDBModel(
+            username=items.username, email=items.email, password_hash=password_hash
+        ),
+    )
 
     return {"message": "created."}
 
 
 @router.get("/restaurant", response_model=restaurant_schema.OnReadsModel)
 def read_user_restaurants(
-    db: Session = Depends(get_db), user: model.User = Depends(get_current_user)
+    at: Optional[datetime] = Query(default=None, description="要計算是否營業中的時間，預設為現在"),
+    cursor: Optional[str] = Query(default=None, description="上一頁回傳的 next_cursor"),
+    limit: int = Query(default=100, ge=1, le=100, description="一頁的最大餐廳數量"),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    """取得使用者儲存的所有餐廳 (需要使用者登入)"""
+    """取得使用者儲存的所有餐廳 (需要使用者登入，使用 cursor 分頁)"""
 
-    items = crud.get_restaurants_with_user(db, user.id)
+    try:
+        after_id = pagination.decode_cursor(cursor)
 
-    return restaurant_schema.OnReadsModel(items=items)
+    except ValueError:
+        ErrorHandler.raise_400(f"The cursor '{cursor}' is invalid.")
+
+    # 多查詢一筆，用來判斷有沒有下一頁
+    items, next_cursor = pagination.get_page(
+        crud.get_restaurants_with_user(db, user_id, after_id, limit + 1), limit
+    )
+
+    crud.set_restaurants_is_open(items, at or datetime.now())
+
+    return restaurant_schema.OnReadsModel(items=items, next_cursor=next_cursor)
 
 
 @router.get("/restaurant/{restaurant_id}", response_model=restaurant_schema.OnReadModel)
 def read_user_restaurant(
-    restaurant_id: int, db: Session = Depends(get_db), user: model.User = Depends(get_current_user)
+    restaurant_id: int, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)
 ):
     """取得單一使用者餐廳資訊"""
 
-    if not crud.check_is_user_restaurant(db, user.id, restaurant_id):
+    if not crud.check_is_user_restaurant(db, user_id, restaurant_id):
         raise HTTPException(403)
 
     restaurant = crud.get_restaurant(db, restaurant_id)
@@ -91,11 +137,47 @@ def read_user_restaurant(
     )
 
 
+def _save_user_restaurant(
+    db: Session, items: restaurant_schema.OnCreateModel, lat, lng, user_id: int
+) -> bool:
+    """新增使用者的餐廳和營業時間 (同步的資料庫操作，在 thread pool 中執行)
+
+    Returns:
+        bool: 使用者不存在時回傳 `False`
+    """
+
+    full_item = database_schema.RestaurantDBModel(**items.dict(), lat=lat, lng=lng)
+
+    r = crud.create_restaurant_with_user(db, full_item, user_id)
+
+    if r is None:
+        return False
+
+    if r.geocode_status == model.GEOCODE_STATUS_PENDING:
+        geocode_worker.notify()
+
+    if items.open_times is not None:
+        db_open_times = []
+
+        for open_time_obj in items.open_times:
+            db_open_times.append(
+                database_schema.RestaurantOpenTimeDBModel(
+                    day_of_week=open_time_obj.day_of_week,
+                    close_time=datetime.strptime(open_time_obj.close_time, "%H:%M").time(),
+                    open_time=datetime.strptime(open_time_obj.open_time, "%H:%M").time(),
+                )
+            )
+
+        crud.create_restaurant_open_times(db, r.id, db_open_times)
+
+    return True
+
+
 @router.post("/restaurant", status_code=201)
-def create_user_restaurant(
+async def create_user_restaurant(
     items: restaurant_schema.OnCreateModel,
     db: Session = Depends(get_db),
-    user: model.User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
     """新增餐廳"""
 
@@ -109,31 +191,28 @@ def create_user_restaurant(
             except ValueError:
                 ErrorHandler.raise_400("time format error, it should be %H:%M format.")
 
-    # 使用第三方 Api 取得經緯度
-    lat, lng = MapApi().get_coords(items.address)
-
-    full_item = database_schema.RestaurantDBModel(**items.dict(), lat=lat, lng=lng)
-
-    if not (lat and lng):
-        ErrorHandler.raise_400(
-            f"The address '{items.address}' format is incorrect and cannot be processed correctly."
-        )
+    # 資料庫操作在 thread pool 中執行，等待地圖 Api 回應時不會佔用 thread
+    if BaseConfig.GEOCODE_DEFERRED:
+        # 只查詢快取，沒有快取就先以 pending_geocode 狀態新增，交給背景 worker 查詢經緯度
+        lat, lng = await run_in_threadpool(geocoding.get_cached_coords, db, items.address)
 
-    r = crud.create_restaurant_with_user(db, full_item, user.id)
+    else:
+        # 使用第三方 Api 取得經緯度 (會先查詢快取)
+        try:
+            lat, lng = await geocoding.get_coords_async(db, items.address)
 
-    if items.open_times is not None:
-        db_open_times = []
+        except MapApiError:
+            ErrorHandler.raise_503("The geocoding service is temporarily unavailable.")
 
-        for open_time_obj in items.open_times:
-            db_open_times.append(
-                database_schema.RestaurantOpenTimeDBModel(
-                    day_of_week=open_time_obj.day_of_week,
-                    close_time=datetime.strptime(open_time_obj.close_time, "%H:%M").time(),
-                    open_time=datetime.strptime(open_time_obj.open_time, "%H:%M").time(),
-                )
+        if not (lat and lng):
+            ErrorHandler.raise_400(
+                f"The address '{items.address}' format is incorrect "
+                "and cannot be processed correctly."
             )
 
-        crud.create_restaurant_open_times(db, r.id, db_open_times)
+    # 使用者在認證之後被刪除
+    if not await run_in_threadpool(_save_user_restaurant, db, items, lat, lng, user_id):
+        CustomError.credentials_execption()
 
     return {"message": "created."}
 
@@ -143,31 +222,48 @@ def update_user_restaurant(
     restaurant_id: int,
     item: restaurant_schema.OnUpdateModel,
     db: Session = Depends(get_db),
-    user: model.User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
     """更新使用者餐廳資料"""
 
     # 身份確認
-    if not crud.check_is_user_restaurant(db, user.id, restaurant_id):
+    if not crud.check_is_user_restaurant(db, user_id, restaurant_id):
         raise HTTPException(403)
 
-    updated_restaurant = crud.update_restaurant(
-        db, restaurant_id, database_schema.RestaurantUpdateDBModel(**item.dict())
-    )
+    # 地址有更改時會重新取得經緯度 (會先查詢快取)
+    try:
+        updated_restaurant = crud.update_restaurant(
+            db,
+            restaurant_id,
+            database_schema.RestaurantUpdateDBModel(**item.dict()),
+            defer_geocode=BaseConfig.GEOCODE_DEFERRED,
+            get_coords=geocoding.get_coords_from_thread,
+        )
+
+    except ValueError:
+        ErrorHandler.raise_400(
+            f"The address '{item.address}' format is incorrect and cannot be processed correctly."
+        )
+
+    except MapApiError:
+        ErrorHandler.raise_503("The geocoding service is temporarily unavailable.")
 
     if not updated_restaurant:
         ErrorHandler.raise_404(f"The restaurant ID: {restaurant_id} is not founded in database.")
 
+    if updated_restaurant.geocode_status == model.GEOCODE_STATUS_PENDING:
+        geocode_worker.notify()
+
     return {"message": "ok"}
 
 
 @router.delete("/restaurant/{restaurant_id}")
 def delete_user_restaurant(
-    restaurant_id: int, db: Session = Depends(get_db), user: model.User = Depends(get_current_user)
+    restaurant_id: int, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)
 ):
     """刪除使用者餐廳"""
 
-    if not crud.check_is_user_restaurant(db, user.id, restaurant_id):
+    if not crud.check_is_user_restaurant(db, user_id, restaurant_id):
         raise HTTPException(403)
 
     deleted_restaurant = crud.delete_restaurant(db, restaurant_id)
@@ -183,9 +279,9 @@ def create_user_restaurant_open_time(
     restaurant_id: int,
     open_times: restaurant_schema.OnCreateOpenTimeModel,
     db: Session = Depends(get_db),
-    user: model.User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
-    if not crud.check_is_user_restaurant(db, user.id, restaurant_id):
+    if not crud.check_is_user_restaurant(db, user_id, restaurant_id):
         raise HTTPException(403)
 
     open_times_obj = [
@@ -204,11 +300,11 @@ def update_user_restaurant_open_time(
     open_time_id: int,
     item: restaurant_schema.OnUpadteOpenTimeModel,
     db: Session = Depends(get_db),
-    user: model.User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
     """更新使用者餐廳營業時間"""
 
-    if not crud.check_is_user_restaurant(db, user.id, restaurant_id):
+    if not crud.check_is_user_restaurant(db, user_id, restaurant_id):
         raise HTTPException(403)
 
     updated_open_time = crud.update_restaurant_open_time(
@@ -226,11 +322,11 @@ def delete_user_restaurant_open_time(
     restaurant_id: int,
     open_time_id: int,
     db: Session = Depends(get_db),
-    user: model.User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
     """刪除使用者餐廳營業時間"""
 
-    if not crud.check_is_user_restaurant(db, user.id, restaurant_id):
+    if not crud.check_is_user_restaurant(db, user_id, restaurant_id):
         raise HTTPException(403)
 
     deleted_open_time = crud.delete_restaurant_open_time(db, open_time_id)
@@ -249,14 +345,26 @@ def get_randomly_restaurant(
     limit: Optional[int] = Query(default=1, ge=1, le=10, description="一次查詢回傳的最大餐廳數量"),
     day_of_week: Optional[str] = Query(default=None, description="星期幾"),
     current_time: Optional[str] = Query(default=None, description="目前時間 (HH:MM) 24H"),
+    mode: str = Query(
+        default="random",
+        regex="^(random|nearest)$",
+        description="random: 隨機選擇, nearest: 距離最近",
+    ),
+    at: Optional[datetime] = Query(default=None, description="要計算是否營業中的時間，預設為現在"),
     db: Session = Depends(get_db),
-    user: model.User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
-    if day_of_week and current_time:
+    if mode == "nearest":
+        items = crud.get_user_restaurant_nearest(
+            db, user_id, lat, lng, distance, limit, day_of_week, current_time
+        )
+    elif day_of_week and current_time:
         items = crud.get_user_restaurant_randomly_with_open_time(
-            db, user.id, lat, lng, distance, day_of_week, current_time, limit
+            db, user_id, lat, lng, distance, day_of_week, current_time, limit
         )
     else:
-        items = crud.get_user_restaurant_randomly(db, user.id, lat, lng, distance, limit)
+        items = crud.get_user_restaurant_randomly(db, user_id, lat, lng, distance, limit)
+
+    crud.set_restaurants_is_open(items, at, day_of_week, current_time)
 
     return restaurant_schema.OnReadsModel(items=items)
@@ -17,8 +17,9 @@ class RestaurantDBModel(BaseModel):
     name: str
     address: str
     phone: Optional[str] = None
-    lat: float
-    lng: float
+    # 沒有經緯度時會以 `pending_geocode` 狀態新增，由背景 worker 查詢經緯度
+    lat: Optional[float] = None
+    lng: Optional[float] = None
     desc: Optional[str] = None
     price: Optional[int] = None
 
@@ -56,5 +57,7 @@ class UserNotOAuthDBModel(BaseModel):
 
     username: str
     email: str
-    password: str
+    password: Optional[str] = None
+    # 已經計算好的密碼雜湊，有值時不會再計算 `password` 的雜湊
+    password_hash: Optional[str] = None
     is_oauth: int = 0
@@ -52,26 +52,39 @@ class _BaseModel(BaseModel):
 
 
 class RestaurantInDBModel(_BaseModel):
-    """對應 restaurant table 的 schemas model"""
+    """對應 restaurant table 的 schemas model
+
+    `geocode_status` 為 `pending_geocode` 或 `failed` 時， `lat` 、 `lng` 為 `None`
+    """
 
     id: int
-    lat: float
-    lng: float
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    geocode_status: str = "resolved"
 
     class Config:
         orm_mode = True
 
 
 class _OnReadsModel(RestaurantInDBModel):
-    """餐廳基本 schemas 但新增了 `is_open` 欄位，用於回傳多個 restaurant 時"""
+    """餐廳基本 schemas 但新增了 `is_open` 、 `distance_km` 欄位，用於回傳多個 restaurant 時
+
+    `is_open` 是查詢時間 (預設為現在) 是否營業中，沒有營業時間資料的餐廳為 `True`
+    `distance_km` 只有在根據位置查詢餐廳時才會有值
+    """
 
     is_open: bool = True
+    distance_km: Optional[float] = None
 
 
 class OnReadsModel(BaseModel):
-    """取得多個餐廳時的 schemas model"""
+    """取得多個餐廳時的 schemas model
+
+    `next_cursor` 是取得下一頁時要帶入的 cursor，沒有下一頁 (或不支援分頁) 時為 `None`
+    """
 
     items: List[_OnReadsModel]
+    next_cursor: Optional[str] = None
 
 
 class OnReadModel(RestaurantInDBModel):
@@ -92,3 +105,25 @@ class OnUpdateModel(BaseModel):
     phone: Optional[str] = None
     desc: Optional[str] = None
     price: Optional[int] = None
+
+
+class _ImportErrorModel(BaseModel):
+    """批次匯入餐廳時，一筆資料的錯誤"""
+
+    index: int
+    error: str
+
+
+class OnImportModel(BaseModel):
+    """批次匯入餐廳結果的 schemas model
+
+    `index` 是資料在 JSON array 中的位置 (CSV 為不含標題的第幾列，從 0 開始)
+    """
+
+    total: int
+    created: int
+    failed: int
+    restaurant_ids: List[int]
+    errors: List[_ImportErrorModel]
+    elapsed_seconds: float
+    rows_per_second: Optional[float] = None
@@ -0,0 +1,231 @@
+'''
+Author: weijay
+Date: 2026-10-18 13:02:44
+LastEditors: weijay
+LastEditTime: 2026-10-18 13:02:44
+Description: 存放在記憶體中的餐廳空間索引，用來加速隨機選擇餐廳
+'''
+
+import heapq
+import math
+import random
+import threading
+from array import array
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import geo
+
+
+class _GridCell:
+    """格子中的餐廳資料 (使用 array 存放，減少記憶體使用量)"""
+
+    __slots__ = ("ids", "lats", "lngs")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.lats = array("d")
+        self.lngs = array("d")
+
+    def append(self, restaurant_id: int, lat: float, lng: float):
+        self.ids.append(restaurant_id)
+        self.lats.append(lat)
+        self.lngs.append(lng)
+
+    def remove(self, restaurant_id: int):
+        index = self.ids.index(restaurant_id)
+
+        # 把最後一筆移到要刪除的位置，避免移動整個 array
+        last = len(self.ids) - 1
+
+        self.ids[index] = self.ids[last]
+        self.lats[index] = self.lats[last]
+        self.lngs[index] = self.lngs[last]
+
+        self.ids.pop()
+        self.lats.pop()
+        self.lngs.pop()
+
+
+class RestaurantSpatialIndex:
+    """餐廳的網格空間索引
+
+    把所有啟用中的餐廳依照經緯度放進固定大小的格子中，查詢時只要計算搜尋範圍內的格子，
+    就可以在記憶體中完成距離篩選和隨機抽樣，資料庫只需要用 ID 取得被選到的餐廳
+
+    在呼叫 `build()` 之前索引都是未啟用的狀態，這時候 `upsert()` 、 `remove()` 都不會有作用
+    """
+
+    def __init__(self, cell_size: float = 0.05):
+        """
+        Args:
+            cell_size (float, optional): 格子大小 (度). Defaults to 0.05 (大約 5 km).
+        """
+
+        self.cell_size = cell_size
+        self.is_ready = False
+
+        self._lock = threading.Lock()
+        self._cells: Dict[Tuple[int, int], _GridCell] = {}
+        self._locations: Dict[int, Tuple[int, int]] = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _get_cell_key(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def _insert(self, restaurant_id: int, lat: float, lng: float):
+        key = self._get_cell_key(lat, lng)
+
+        cell = self._cells.get(key)
+
+        if cell is None:
+            cell = self._cells[key] = _GridCell()
+
+        cell.append(restaurant_id, lat, lng)
+        self._locations[restaurant_id] = key
+
+    def _delete(self, restaurant_id: int):
+        key = self._locations.pop(restaurant_id, None)
+
+        if key is None:
+            return
+
+        cell = self._cells[key]
+        cell.remove(restaurant_id)
+
+        if not cell.ids:
+            del self._cells[key]
+
+    def build(self, db: Session):
+        """從資料庫載入所有啟用中且已經查詢到經緯度的餐廳並啟用索引"""
+
+        # 避免循環 import
+        from app.database import model
+
+        rows = (
+            db.query(model.Restaurant.id, model.Restaurant.lat, model.Restaurant.lng)
+            .filter(
+                model.Restaurant.is_enable.is_(True),
+                model.Restaurant.geocode_status == model.GEOCODE_STATUS_RESOLVED,
+            )
+            .yield_per(10000)
+        )
+
+        with self._lock:
+            self._cells = {}
+            self._locations = {}
+
+            for restaurant_id, lat, lng in rows:
+                self._insert(restaurant_id, lat, lng)
+
+            self.is_ready = True
+
+    def clear(self):
+        """清空並停用索引"""
+
+        with self._lock:
+            self._cells = {}
+            self._locations = {}
+            self.is_ready = False
+
+    def upsert(self, restaurant_id: int, lat: float, lng: float, is_enable: bool = True):
+        """新增或更新一筆餐廳的位置，如果餐廳沒有啟用，會從索引中移除"""
+
+        if not self.is_ready:
+            return
+
+        with self._lock:
+            self._delete(restaurant_id)
+
+            if is_enable and lat is not None and lng is not None:
+                self._insert(restaurant_id, lat, lng)
+
+    def remove(self, restaurant_id: int):
+        """從索引中移除一筆餐廳"""
+
+        if not self.is_ready:
+            return
+
+        with self._lock:
+            self._delete(restaurant_id)
+
+    def query_radius(self, lat: float, lng: float, distance: float) -> List[int]:
+        """取得距離 (`lat`, `lng`) `distance` (km) 內的所有餐廳 ID"""
+
+        return [
+            restaurant_id
+            for restaurant_id, _ in self.query_radius_with_distance(lat, lng, distance)
+        ]
+
+    def query_radius_with_distance(
+        self, lat: float, lng: float, distance: float
+    ) -> List[Tuple[int, float]]:
+        """取得距離 (`lat`, `lng`) `distance` (km) 內的所有餐廳 ID 和距離 (km)"""
+
+        min_lat, max_lat, min_lng, max_lng = geo.get_bounding_box(lat, lng, distance)
+
+        lat_start = math.floor(min_lat / self.cell_size)
+        lat_end = math.floor(max_lat / self.cell_size)
+
+        with self._lock:
+            if min_lng is None:
+                # 經度沒有限制，只能檢查所有緯度範圍內的格子
+                cells = [
+                    cell
+                    for (lat_index, _), cell in self._cells.items()
+                    if lat_start <= lat_index <= lat_end
+                ]
+
+            else:
+                lng_start = math.floor(min_lng / self.cell_size)
+                lng_end = math.floor(max_lng / self.cell_size)
+
+                cells = []
+
+                for lat_index in range(lat_start, lat_end + 1):
+                    for lng_index in range(lng_start, lng_end + 1):
+                        cell = self._cells.get((lat_index, lng_index))
+
+                        if cell is not None:
+                            cells.append(cell)
+
+            result = []
+
+            for cell in cells:
+                for restaurant_id, r_lat, r_lng in zip(cell.ids, cell.lats, cell.lngs):
+                    r_distance = geo.haversine(lat, lng, r_lat, r_lng)
+
+                    if r_distance <= distance:
+                        result.append((restaurant_id, r_distance))
+
+        return result
+
+    def sample(
+        self, lat: float, lng: float, distance: float, limit: int
+    ) -> List[Tuple[int, float]]:
+        """隨機取得距離內最多 `limit` 筆餐廳 ID 和距離 (km)"""
+
+        candidates = self.query_radius_with_distance(lat, lng, distance)
+
+        if len(candidates) <= limit:
+            random.shuffle(candidates)
+
+            return candidates
+
+        return random.sample(candidates, limit)
+
+    def nearest(
+        self, lat: float, lng: float, distance: float, limit: int
+    ) -> List[Tuple[int, float]]:
+        """取得距離內最近的 `limit` 筆餐廳 ID 和距離 (km)，由近到遠排序"""
+
+        candidates = self.query_radius_with_distance(lat, lng, distance)
+
+        return heapq.nsmallest(limit, candidates, key=lambda item: item[1])
+
+
+# 整個程式共用的餐廳空間索引
+restaurant_index = RestaurantSpatialIndex()
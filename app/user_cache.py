@@ -0,0 +1,147 @@
+'''
+Author: weijay
+Date: 2026-10-18 23:41:08
+LastEditors: weijay
+LastEditTime: 2026-10-18 23:41:08
+Description: 已認證使用者的快取，讓每個需要認證的請求不用再查詢一次資料庫
+
+使用者被新增、修改或刪除時 (SQLAlchemy mapper event) 會清除對應的快取
+'''
+
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from sqlalchemy import event, inspect
+
+from app.config.config import BaseConfig
+from app.database import model
+from app.schemas.user_schema import OnReadNoOAuthModel
+from app.utils import LRUCache
+
+
+class UserCacheBackend(ABC):
+    """使用者快取的儲存後端介面，key 是 `username:<使用者名稱>` 或 `id:<使用者 ID>`，value 是可以序列化的 dict
+
+    目前只有 `LocalUserCacheBackend`，要在多個 process 之間共用快取時 (例如 Redis)，
+    實作這個介面後傳入 `set_user_cache_backend()`
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        """取得快取的使用者，沒有或過期時回傳 None"""
+
+    @abstractmethod
+    def set(self, key: str, value: dict, ttl: float):
+        """快取使用者 `ttl` 秒"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """刪除快取的使用者"""
+
+    @abstractmethod
+    def clear(self):
+        """清除所有快取"""
+
+
+class LocalUserCacheBackend(UserCacheBackend):
+    """存在 process 記憶體中的後端 (預設)，也是共用後端的本地替身"""
+
+    def __init__(self, maxsize: int = BaseConfig.USER_CACHE_SIZE):
+        self._cache = LRUCache(maxsize, ttl=BaseConfig.USER_CACHE_TTL)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: dict, ttl: float):
+        self._cache.set(key, value, ttl)
+
+    def delete(self, key: str):
+        self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+_backend: UserCacheBackend = LocalUserCacheBackend()
+
+
+def set_user_cache_backend(backend: UserCacheBackend):
+    """替換使用者快取的後端"""
+
+    global _backend
+
+    _backend = backend
+
+
+def get_user_cache_backend() -> UserCacheBackend:
+    return _backend
+
+
+def _username_key(username: str) -> str:
+    return f"username:{username}"
+
+
+def _user_id_key(user_id: int) -> str:
+    return f"id:{user_id}"
+
+
+def _get(key: str) -> Optional[OnReadNoOAuthModel]:
+    value = _backend.get(key)
+
+    if value is None:
+        return None
+
+    return OnReadNoOAuthModel(**value)
+
+
+def get_cached_user(username: str) -> Optional[OnReadNoOAuthModel]:
+    """用使用者名稱取得快取的使用者，沒有快取或快取過期時回傳 `None`"""
+
+    return _get(_username_key(username))
+
+
+def get_cached_user_by_id(user_id: int) -> Optional[OnReadNoOAuthModel]:
+    """用使用者 ID 取得快取的使用者，沒有快取或快取過期時回傳 `None`"""
+
+    return _get(_user_id_key(user_id))
+
+
+def cache_user(user: "model.User") -> OnReadNoOAuthModel:
+    """快取使用者 (使用者名稱和使用者 ID 都可以取得)，回傳和 session 無關的使用者資料"""
+
+    cached = OnReadNoOAuthModel(id=user.id, username=user.username, email=user.email)
+
+    if BaseConfig.USER_CACHE_SIZE > 0 and BaseConfig.USER_CACHE_TTL > 0:
+        value = cached.dict()
+
+        _backend.set(_username_key(user.username), value, BaseConfig.USER_CACHE_TTL)
+        _backend.set(_user_id_key(user.id), value, BaseConfig.USER_CACHE_TTL)
+
+    return cached
+
+
+def invalidate_user(username: str, user_id: Optional[int] = None):
+    _backend.delete(_username_key(username))
+
+    if user_id is not None:
+        _backend.delete(_user_id_key(user_id))
+
+
+def clear_user_cache():
+    _backend.clear()
+
+
+@event.listens_for(model.User, "after_insert")
+@event.listens_for(model.User, "after_update")
+@event.listens_for(model.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: "model.User"):
+    """使用者被新增、修改或刪除時清除快取 (修改使用者名稱時新舊名稱都會清除)"""
+
+    history = inspect(target).attrs.username.history
+
+    for username in {target.username, *history.deleted}:
+        if username is not None:
+            invalidate_user(username, target.id)
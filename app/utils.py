@@ -6,20 +6,98 @@ LastEditTime: 2023-04-21 22:56:10
 Description: 放一些輔助通用的函示
 """
 
-
+import asyncio
 import os
-from typing import Tuple
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from requests.exceptions import ReadTimeout
+import httpx
 import requests
 
+from app.config.config import BaseConfig
+
+
+class LRUCache:
+    """有數量上限和過期時間的 LRU 快取 (thread-safe)
+
+    Args:
+        maxsize (int): 最多快取幾個 key (0 代表不快取)
+        ttl (float): 預設的快取保存秒數，`set()` 可以指定個別 key 的保存秒數
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """取得快取，沒有快取或快取過期時回傳 `None`"""
+
+        with self._lock:
+            item = self._data.get(key)
+
+            if item is None:
+                return None
+
+            expire_at, value = item
+
+            if expire_at <= time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+
+        expire_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class MapApiError(Exception):
+    """地圖 API 暫時無法使用 (連線錯誤、逾時、回傳錯誤狀態碼或格式不正確的回應，或是斷路器開啟中)
+
+    和「地址查不到經緯度」不同，查不到經緯度時回傳 `(None, None)`
+    """
+
 
 class MapApi:
     """地址轉換經緯度 (使用單例模式)"""
 
     BASE_URL = "https://www.mapquestapi.com/geocoding/v1"
 
+    # batch API 一次最多可以查詢的地址數量
+    BATCH_SIZE = 100
+    BATCH_TIMEOUT = 30
+
     def __init__(self):
         # 檢查是不是第一個實例化的
         if not hasattr(MapApi, "_first_init"):
@@ -64,3 +142,252 @@ class MapApi:
         coords = resp.json()["results"][0]["locations"][0]["latLng"]
 
         return coords.get("lat"), coords.get("lng")
+
+    def _get_coords_batch(self, addresses: List[str]) -> List[Tuple[float, float]]:
+        """使用 batch API 一次查詢最多 `BATCH_SIZE` 個地址，回傳的順序和 `addresses` 相同"""
+
+        payload = {"locations": addresses, "options": {"maxResults": 1}}
+
+        resp = requests.post(
+            f"{self.BASE_URL}/batch?key={self.api_key}", json=payload, timeout=self.BATCH_TIMEOUT
+        )
+        resp.raise_for_status()
+
+        results = resp.json()["results"]
+
+        return [_parse_coords(result) for result in results]
+
+    def get_coords_many(
+        self, addresses: List[str], max_workers: int = 1
+    ) -> List[Tuple[float, float]]:
+        """根據多個地址轉換成經緯度
+
+        相同的地址只會查詢一次，每 `BATCH_SIZE` 個地址使用一次 batch API 查詢
+        (最多同時 `max_workers` 個請求)，查不到經緯度的地址回傳 `(None, None)`
+
+        Args:
+            addresses (List[str]): 地址
+
+            max_workers (int): 同時發送的請求數量
+
+        Returns:
+            List[Tuple[float, float]]: 每個地址的 (緯度, 經度)，順序和 `addresses` 相同
+
+        Raises:
+            MapApiError: 任何一批查詢時地圖 API 無法使用 (不會回傳部分結果)
+        """
+
+        unique_addresses = list(dict.fromkeys(addresses))
+        chunks = [
+            unique_addresses[i : i + self.BATCH_SIZE]
+            for i in range(0, len(unique_addresses), self.BATCH_SIZE)
+        ]
+
+        def get_chunk_coords(chunk: List[str]) -> List[Tuple[float, float]]:
+            try:
+                results = self._get_coords_batch(chunk)
+
+            except requests.RequestException as e:
+                raise MapApiError(f"Map API request failed: {e}") from e
+
+            except (ValueError, KeyError) as e:
+                raise MapApiError("Map API returned an invalid response.") from e
+
+            if len(results) != len(chunk):
+                raise MapApiError("Map API returned an unexpected number of results.")
+
+            return results
+
+        coords = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks) or 1))) as executor:
+            for chunk, results in zip(chunks, executor.map(get_chunk_coords, chunks)):
+                coords.update(zip(chunk, results))
+
+        return [coords[address] for address in addresses]
+
+
+class CircuitBreaker:
+    """斷路器
+
+    連續失敗 `failure_threshold` 次後開啟，開啟後 `reset_timeout` 秒內的請求直接失敗，
+    時間到之後放行一個請求測試 (half-open)，成功就關閉斷路器，失敗就重新開始計時
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow_request(self) -> bool:
+        """檢查現在是否可以發送請求"""
+
+        if self.opened_at is None:
+            return True
+
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # half-open: 只放行這一個請求，其他請求要再等 `reset_timeout` 秒
+            self.opened_at = time.monotonic()
+            return True
+
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+def _parse_coords(data: dict) -> Tuple[Optional[float], Optional[float]]:
+    """從 MapQuest 回傳的 location 結果中取出經緯度，沒有結果時回傳 `(None, None)`"""
+
+    locations = data.get("locations") or []
+
+    if not locations:
+        return None, None
+
+    coords = locations[0].get("latLng") or {}
+
+    return coords.get("lat"), coords.get("lng")
+
+
+class AsyncMapApi:
+    """非同步的地址轉換經緯度 client
+
+    - 所有請求共用一個 keep-alive 連線池
+    - 同時最多發送 `max_concurrency` 個請求
+    - 連線錯誤、逾時、 429 和 5xx 會以指數退避 (`backoff` * 2^n 秒內的隨機時間) 重試 `max_retries` 次
+    - 連續失敗 (重試後仍然失敗) 太多次會開啟斷路器，開啟期間直接失敗不發送請求
+
+    Raises:
+        MapApiError: 重試後仍然失敗、斷路器開啟中或是 API 回傳 4xx 錯誤
+    """
+
+    BASE_URL = MapApi.BASE_URL
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: float = BaseConfig.GEOCODE_TIMEOUT,
+        max_concurrency: int = BaseConfig.GEOCODE_CONCURRENCY,
+        max_retries: int = BaseConfig.GEOCODE_MAX_RETRIES,
+        backoff: float = BaseConfig.GEOCODE_RETRY_BACKOFF,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        if api_key is None:
+            load_dotenv()
+            api_key = os.environ.get("MAP_API_KEY")
+
+            if not api_key:
+                raise Exception("Can't load 'MAP_API_KEY' from .env file.")
+
+        self.api_key = api_key
+        self.base_url = base_url or self.BASE_URL
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(
+            BaseConfig.GEOCODE_CIRCUIT_FAILURES, BaseConfig.GEOCODE_CIRCUIT_RESET_SECONDS
+        )
+
+        self._transport = transport
+        self._loop = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """取得目前 event loop 使用的連線池和 semaphore (連線和 semaphore 不能跨 event loop 使用)"""
+
+        loop = asyncio.get_running_loop()
+
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                transport=self._transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        return self._client, self._semaphore
+
+    async def aclose(self):
+        """關閉連線池"""
+
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        if not self.circuit_breaker.allow_request():
+            raise MapApiError("The map api circuit breaker is open.")
+
+        client, semaphore = self._get_client()
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+            try:
+                async with semaphore:
+                    resp = await client.post(path, params={"key": self.api_key}, json=payload)
+
+            except httpx.TransportError as e:
+                error = e
+                continue
+
+            if resp.status_code == 429 or resp.status_code >= 500:
+                error = MapApiError(f"The map api responded with {resp.status_code}.")
+                continue
+
+            # 有收到回應就代表 API 可以連線，4xx 不會重試也不計入斷路器
+            self.circuit_breaker.record_success()
+
+            if resp.status_code >= 400:
+                raise MapApiError(f"The map api responded with {resp.status_code}.")
+
+            return resp.json()
+
+        self.circuit_breaker.record_failure()
+
+        raise MapApiError(f"The map api request failed: {error!r}") from error
+
+    async def get_coords(self, address: str) -> Tuple[Optional[float], Optional[float]]:
+        """根據地址轉換成經緯度
+
+        Args:
+            address (str): 地址
+
+        Returns:
+            Tuple[Optional[float], Optional[float]]: (緯度, 經度)，查不到時回傳 `(None, None)`
+        """
+
+        data = await self._post("/address", {"location": address})
+
+        results = data.get("results") or []
+
+        if not results:
+            return None, None
+
+        return _parse_coords(results[0])
@@ -0,0 +1,7 @@
+'''
+Author: weijay
+Date: 2026-10-18 10:40:02
+LastEditors: weijay
+LastEditTime: 2026-10-18 10:40:02
+Description: 效能測試腳本，使用 `python -m benchmarks.<腳本名稱>` 執行
+'''
@@ -0,0 +1,121 @@
+'''
+Author: weijay
+Date: 2026-10-18 10:40:02
+LastEditors: weijay
+LastEditTime: 2026-10-18 10:40:02
+Description: 效能測試會用到的通用函示
+'''
+
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import uvicorn
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import geo
+from app.database import model
+
+# 台灣本島的大概範圍
+LAT_RANGE = (21.9, 25.3)
+LNG_RANGE = (120.0, 122.0)
+
+
+def create_bench_engine(path: str = None):
+    """建立效能測試用的 SQLite 資料庫 (預設建立在暫存資料夾)"""
+
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+    model.Base.metadata.create_all(bind=engine)
+
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def seed_restaurants(engine, number: int, batch_size: int = 50000, seed: int = 0):
+    """隨機產生 `number` 筆餐廳資料到資料庫中"""
+
+    rnd = random.Random(seed)
+
+    with engine.begin() as conn:
+        for start in range(0, number, batch_size):
+            rows = []
+
+            for i in range(start, min(start + batch_size, number)):
+                lat, lng = random_location(rnd)
+
+                rows.append(
+                    {
+                        "name": f"restaurant_{i}",
+                        "address": f"address_{i}",
+                        "lat": lat,
+                        "lng": lng,
+                        "geohash": geo.encode_geohash(lat, lng),
+                        "is_enable": True,
+                    }
+                )
+
+            conn.execute(insert(model.Restaurant.__table__), rows)
+
+
+def random_location(rnd: random.Random = random):
+    """隨機產生一個在資料範圍內的位置"""
+
+    return rnd.uniform(*LAT_RANGE), rnd.uniform(*LNG_RANGE)
+
+
+@contextmanager
+def timer(name: str, repeat: int = 1):
+    """計算區塊執行時間，並印出平均每次的時間"""
+
+    start = time.perf_counter()
+
+    yield
+
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<40} {elapsed / repeat * 1000:10.3f} ms / op")
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+
+        return sock.getsockname()[1]
+
+
+def percentile(values: list, percent: float) -> float:
+    if not values:
+        return float("nan")
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+@contextmanager
+def serve_app(app):
+    """在背景 thread 中用 uvicorn 啟動 app ，回傳 base url"""
+
+    port = get_free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    server_thread.start()
+
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        yield f"http://127.0.0.1:{port}"
+
+    finally:
+        server.should_exit = True
+        server_thread.join()
@@ -0,0 +1,104 @@
+'''
+Author: weijay
+Date: 2026-10-18 21:10:44
+LastEditors: weijay
+LastEditTime: 2026-10-18 21:10:44
+Description: 逐筆新增餐廳與批次匯入的效能比較 (地圖 API 每次請求使用固定延遲模擬)
+
+使用方式:
+    python -m benchmarks.bench_bulk_import --number 500 --latency 0.05
+'''
+
+import argparse
+import os
+import random
+import time
+from datetime import time as dt_time
+from unittest import mock
+
+from app import bulk_import
+from app.database import crud
+from app.schemas import database_schema
+from app.utils import MapApi
+from benchmarks._utils import create_bench_engine, random_location
+
+
+def make_rows(number: int):
+    return [
+        {
+            "name": f"restaurant_{i}",
+            "address": f"address_{i}",
+            "open_times": [{"day_of_week": 1, "open_time": "11:00", "close_time": "14:00"}],
+        }
+        for i in range(number)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=500, help="匯入的餐廳數量")
+    parser.add_argument("--latency", type=float, default=0.05, help="模擬地圖 API 的延遲 (秒)")
+    parser.add_argument("--workers", type=int, default=8, help="同時查詢經緯度的數量")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MAP_API_KEY", "benchmark")
+
+    rnd = random.Random(0)
+
+    def fake_get_coords(self, address):
+        time.sleep(args.latency)
+
+        return random_location(rnd)
+
+    def fake_get_coords_batch(self, addresses):
+        # batch API 一次請求查詢多個地址，只會有一次網路延遲
+        time.sleep(args.latency)
+
+        return [random_location(rnd) for _ in addresses]
+
+    rows = make_rows(args.number)
+
+    with mock.patch("app.utils.MapApi.get_coords", fake_get_coords), mock.patch(
+        "app.utils.MapApi._get_coords_batch", fake_get_coords_batch
+    ):
+        engine, SessionLocal = create_bench_engine()
+
+        with SessionLocal() as db:
+            start = time.perf_counter()
+
+            # 原本 POST /restaurant/ 的作法: 逐筆查詢經緯度、新增餐廳、新增營業時間
+            for row in rows:
+                lat, lng = MapApi().get_coords(row["address"])
+                restaurant = crud.create_restaurant(
+                    db, database_schema.RestaurantDBModel(**row, lat=lat, lng=lng)
+                )
+                crud.create_restaurant_open_times(
+                    db,
+                    restaurant.id,
+                    [
+                        database_schema.RestaurantOpenTimeDBModel(
+                            day_of_week=1, open_time=dt_time(11, 0), close_time=dt_time(14, 0)
+                        )
+                    ],
+                )
+
+            elapsed = time.perf_counter() - start
+            print(f"{'one by one':<20} {elapsed:8.2f} s  {args.number / elapsed:10.1f} rows/s")
+
+        engine.dispose()
+
+        engine, SessionLocal = create_bench_engine()
+
+        with SessionLocal() as db:
+            result = bulk_import.import_restaurants(db, rows, args.workers)
+
+            print(
+                f"{'bulk import':<20} {result['elapsed_seconds']:8.2f} s  "
+                f"{result['rows_per_second']:10.1f} rows/s"
+            )
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
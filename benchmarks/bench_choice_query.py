@@ -0,0 +1,94 @@
+'''
+Author: weijay
+Date: 2026-10-18 10:52:47
+LastEditors: weijay
+LastEditTime: 2026-10-18 10:52:47
+Description: 隨機選擇餐廳查詢的效能測試
+
+使用方式:
+    python -m benchmarks.bench_choice_query --number 1000000
+'''
+
+import argparse
+import random
+
+from sqlalchemy import func, text
+
+from app.database import crud, model
+from benchmarks._utils import create_bench_engine, seed_restaurants, random_location, timer
+
+# 依照距離篩選時應該使用的 index
+SPATIAL_INDEXES = ("ix_restaurant_geohash", "idx_lat_lng")
+
+
+def explain(db, query) -> str:
+    """印出並回傳 SQLite 的 query plan"""
+
+    compiled = query.statement.compile(db.get_bind())
+    params = [compiled.params[name] for name in compiled.positiontup]
+
+    cursor = db.connection().connection.cursor()
+    plan = [row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {compiled}", params)]
+
+    for line in plan:
+        print("   ", line)
+
+    return "\n".join(plan)
+
+
+def full_scan_query(db, lat, lng, distance):
+    """沒有經緯度範圍篩選，每一筆都計算 Haversine 的查詢 (原本的作法)"""
+
+    return (
+        db.query(model.Restaurant)
+        .filter(text(crud._HAVERSINE_SQL))
+        .params(lat=lat, lng=lng, distance=distance)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=1000000, help="餐廳資料筆數")
+    parser.add_argument("--distance", type=float, default=5.0, help="搜尋半徑 (km)")
+    parser.add_argument("--repeat", type=int, default=20, help="每種查詢執行次數")
+    args = parser.parse_args()
+
+    engine, SessionLocal = create_bench_engine()
+
+    print(f"seeding {args.number} restaurants ...")
+    seed_restaurants(engine, args.number)
+
+    rnd = random.Random(1)
+    locations = [random_location(rnd) for _ in range(args.repeat)]
+
+    with SessionLocal() as db:
+        lat, lng = locations[0]
+
+        print("\nquery plan (full scan):")
+        explain(db, full_scan_query(db, lat, lng, args.distance))
+
+        print("\nquery plan (geohash / bounding box prefilter):")
+        plan = explain(
+            db,
+            crud._filter_by_distance(
+                crud._query_enabled_restaurants(db), lat, lng, args.distance
+            ).params(lat=lat, lng=lng, distance=args.distance),
+        )
+
+        # 其他欄位的 index 取代了 geohash / 經緯度的 index 時，每一筆都要計算 Haversine
+        if not any(index in plan for index in SPATIAL_INDEXES):
+            raise SystemExit(f"the prefilter query does not use any of {SPATIAL_INDEXES}")
+
+        print()
+
+        with timer("full scan haversine", args.repeat):
+            for lat, lng in locations:
+                full_scan_query(db, lat, lng, args.distance).order_by(func.random()).limit(10).all()
+
+        with timer("crud.get_restaurant_randomly", args.repeat):
+            for lat, lng in locations:
+                crud.get_restaurant_randomly(db, lat, lng, args.distance, 10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+'''
+Author: weijay
+Date: 2026-10-19 00:48:17
+LastEditors: weijay
+LastEditTime: 2026-10-19 00:48:17
+Description: 同時登入時的效能測試，比較在 thread 中和在 process pool 中計算密碼雜湊
+
+同時也會發送不需要認證的讀取請求，觀察登入是否會拖慢其他請求
+
+使用方式:
+    python -m benchmarks.bench_concurrent_login --clients 16 --duration 10 --scheme argon2
+'''
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from app import create_app, passwords
+from app.config.config import BaseConfig, TestConfig
+from app.database import create_engine_from_config, model
+from app.rate_limit import login_rate_limiter
+from app.routers import register_router
+from app.routers.depends import get_db
+from benchmarks._utils import percentile, seed_restaurants, serve_app
+
+ROOT_URL = "/api/v1"
+
+PASSWORD = "benchmark password"
+
+
+def seed_users(engine, number: int):
+    """新增 `number` 個密碼相同的使用者 (只計算一次雜湊)"""
+
+    password_hash = passwords.hash_password(PASSWORD)
+
+    with engine.begin() as conn:
+        conn.execute(
+            insert(model.User.__table__),
+            [
+                {
+                    "username": f"user_{i}",
+                    "email": f"user_{i}@test.com",
+                    "password_hash": password_hash,
+                }
+                for i in range(number)
+            ],
+        )
+
+
+def run_mode(name: str, workers: int, args) -> dict:
+    """用 `workers` 個 process 計算密碼雜湊 (0 代表在 thread 中計算)，同時發送登入和讀取請求"""
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    class Config(TestConfig):
+        DATABASE_URL = f"sqlite:///{path}"
+        DB_POOL_SIZE = args.clients
+        DB_MAX_OVERFLOW = 0
+        PASSWORD_SCHEME = args.scheme
+        PASSWORD_ARGON2_MEMORY_COST = BaseConfig.PASSWORD_ARGON2_MEMORY_COST
+        PASSWORD_ARGON2_TIME_COST = BaseConfig.PASSWORD_ARGON2_TIME_COST
+        PASSWORD_ARGON2_PARALLELISM = BaseConfig.PASSWORD_ARGON2_PARALLELISM
+        PASSWORD_BCRYPT_ROUNDS = BaseConfig.PASSWORD_BCRYPT_ROUNDS
+        PASSWORD_HASH_WORKERS = workers
+        LOGIN_RATE_LIMIT_ENABLE = False
+
+    app = create_app("test")
+    register_router(app, ROOT_URL)
+
+    # `create_app()` 會使用 `TestConfig` 的設定，要在之後重新設定 (所有 client 來自同一個 IP ，關閉登入限流)
+    passwords.configure_password_hashing(Config)
+    login_rate_limiter.configure(Config)
+
+    engine = create_engine_from_config(Config)
+    model.Base.metadata.create_all(bind=engine)
+    seed_users(engine, args.users)
+    seed_restaurants(engine, 1000)
+
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+
+        try:
+            yield db
+
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    latencies = {"login": [], "read": []}
+    errors = {"login": 0, "read": 0}
+    lock = threading.Lock()
+
+    def client_loop(seed: int):
+        rnd = random.Random(seed)
+
+        with httpx.Client(base_url=f"{base_url}{ROOT_URL}", timeout=60) as client:
+            while time.perf_counter() < deadline:
+                if rnd.random() < args.login_ratio:
+                    kind = "login"
+                    username = f"user_{rnd.randrange(args.users)}"
+                    request = lambda: client.post(  # noqa: E731
+                        "/user/token", data={"username": username, "password": PASSWORD}
+                    )
+
+                else:
+                    kind = "read"
+                    request = lambda: client.get("/restaurant/", params={"limit": 10})  # noqa: E731
+
+                start = time.perf_counter()
+
+                try:
+                    ok = request().status_code == 200
+
+                except httpx.HTTPError:
+                    ok = False
+
+                elapsed = time.perf_counter() - start
+
+                with lock:
+                    if ok:
+                        latencies[kind].append(elapsed)
+
+                    else:
+                        errors[kind] += 1
+
+    with serve_app(app) as base_url:
+        deadline = time.perf_counter() + args.duration
+
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            list(executor.map(client_loop, range(args.clients)))
+
+    passwords.shutdown_password_pool()
+    engine.dispose()
+
+    result = {"mode": name, "duration": args.duration}
+
+    for kind in ("login", "read"):
+        result[kind] = {
+            "count": len(latencies[kind]),
+            "errors": errors[kind],
+            "p50": percentile(latencies[kind], 50) * 1000,
+            "p99": percentile(latencies[kind], 99) * 1000,
+            "mean": (statistics.mean(latencies[kind]) * 1000) if latencies[kind] else float("nan"),
+        }
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100, help="資料庫中的使用者數量")
+    parser.add_argument("--clients", type=int, default=16, help="同時發送請求的 client 數量")
+    parser.add_argument("--duration", type=float, default=10, help="每一種模式測試的秒數")
+    parser.add_argument("--login-ratio", type=float, default=0.5, help="登入請求的比例")
+    parser.add_argument(
+        "--scheme",
+        default=BaseConfig.PASSWORD_SCHEME,
+        choices=passwords.PASSWORD_SCHEMES,
+        help="密碼雜湊演算法 (使用 `BaseConfig` 的參數)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="process pool 模式使用的 process 數量",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':<14} {'kind':<6} {'req/s':>8} {'errors':>7} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}"
+    )
+
+    for name, workers in (("thread", 0), (f"process x{args.workers}", args.workers)):
+        result = run_mode(name, workers, args)
+
+        for kind in ("login", "read"):
+            stats = result[kind]
+
+            print(
+                f"{name:<14} {kind:<6} {stats['count'] / args.duration:8.1f} {stats['errors']:7d} "
+                f"{stats['p50']:8.2f} {stats['p99']:8.2f} {stats['mean']:8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+'''
+Author: weijay
+Date: 2026-10-18 20:11:26
+LastEditors: weijay
+LastEditTime: 2026-10-18 20:11:26
+Description: 串流匯出餐廳資料的速度和記憶體用量
+
+使用方式:
+    python -m benchmarks.bench_export --numbers 10000 100000
+'''
+
+import argparse
+import time
+import tracemalloc
+
+from app import export
+from app.database import crud
+from benchmarks._utils import create_bench_engine, seed_restaurants
+
+
+def _export(db, compress: bool) -> int:
+    content = export.iter_ndjson(crud.iter_restaurants_for_export(db))
+
+    if compress:
+        content = export.iter_gzip(content)
+
+    return sum(len(chunk) for chunk in content)
+
+
+def run(number: int, compress: bool):
+    engine, SessionLocal = create_bench_engine()
+    seed_restaurants(engine, number)
+
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        size = _export(db, compress)
+        elapsed = time.perf_counter() - start
+
+        # tracemalloc 會讓程式變慢很多，所以另外執行一次來計算記憶體用量
+        tracemalloc.start()
+        _export(db, compress)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(
+        f"{number:>10} rows  compress={compress!s:<5}  {elapsed * 1000:10.1f} ms  "
+        f"{size / 1024 / 1024:8.2f} MB output  peak {peak / 1024 / 1024:6.2f} MB"
+    )
+
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numbers", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    for number in args.numbers:
+        for compress in (False, True):
+            run(number, compress)
+
+
+if __name__ == "__main__":
+    main()
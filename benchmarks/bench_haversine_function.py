@@ -0,0 +1,91 @@
+'''
+Author: weijay
+Date: 2026-10-18 16:40:12
+LastEditors: weijay
+LastEditTime: 2026-10-18 16:40:12
+Description: SQLite 自訂 haversine_km() 函式與原本 SQL 數學運算式的效能比較
+
+使用方式:
+    python -m benchmarks.bench_haversine_function --number 200000
+'''
+
+import argparse
+import random
+
+from sqlalchemy import func, text
+
+from app.database import crud, model
+from benchmarks._utils import create_bench_engine, seed_restaurants, random_location, timer
+
+# 原本在 SQL 中直接計算 Haversine 的寫法 (需要 SQLite 有編譯數學函式)
+_EXPRESSION_HAVERSINE_SQL = """
+(
+    6371 * 2 * ASIN(
+        SQRT(
+            POWER(SIN((:lat - lat) * PI() / 180 / 2), 2)
+            + COS(:lat * PI() / 180)
+            * COS(lat * PI() / 180)
+            * POWER(SIN((:lng - lng) * PI() / 180 / 2), 2)
+        )
+    )
+) <= :distance
+"""
+
+
+def count_query(db, sql, lat, lng, distance):
+    """全表掃描，每一筆資料都計算距離"""
+
+    return (
+        db.query(func.count(model.Restaurant.id))
+        .filter(text(sql))
+        .params(lat=lat, lng=lng, distance=distance)
+        .scalar()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200000, help="餐廳資料筆數")
+    parser.add_argument("--distance", type=float, default=5.0, help="搜尋半徑 (km)")
+    parser.add_argument("--repeat", type=int, default=10, help="每種查詢執行次數")
+    args = parser.parse_args()
+
+    engine, SessionLocal = create_bench_engine()
+
+    print(f"seeding {args.number} restaurants ...")
+    seed_restaurants(engine, args.number)
+
+    rnd = random.Random(1)
+    locations = [random_location(rnd) for _ in range(args.repeat)]
+
+    with SessionLocal() as db:
+        lat, lng = locations[0]
+
+        try:
+            expected = count_query(db, _EXPRESSION_HAVERSINE_SQL, lat, lng, args.distance)
+
+        except Exception as e:
+            expected = None
+            print(f"SQLite 沒有數學函式，無法執行原本的寫法 ({e.__class__.__name__})")
+
+        actual = count_query(db, crud._HAVERSINE_SQL, lat, lng, args.distance)
+        print(f"rows in range: expression={expected}, haversine_km={actual}\n")
+
+        if expected is not None:
+            with timer("full scan: SQL expression", args.repeat):
+                for lat, lng in locations:
+                    count_query(db, _EXPRESSION_HAVERSINE_SQL, lat, lng, args.distance)
+
+        with timer("full scan: haversine_km()", args.repeat):
+            for lat, lng in locations:
+                count_query(db, crud._HAVERSINE_SQL, lat, lng, args.distance)
+
+        with timer("crud.get_restaurant_randomly", args.repeat):
+            for lat, lng in locations:
+                crud.get_restaurant_randomly(db, lat, lng, args.distance, 10)
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
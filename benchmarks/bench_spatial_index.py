@@ -0,0 +1,67 @@
+'''
+Author: weijay
+Date: 2026-10-18 14:05:19
+LastEditors: weijay
+LastEditTime: 2026-10-18 14:05:19
+Description: 記憶體空間索引與資料庫查詢的隨機選擇餐廳效能比較
+
+使用方式:
+    python -m benchmarks.bench_spatial_index --numbers 100000 1000000
+'''
+
+import argparse
+import random
+import time
+
+from app.database import crud
+from app.spatial_index import RestaurantSpatialIndex
+from benchmarks._utils import create_bench_engine, seed_restaurants, random_location, timer
+
+
+def run(number: int, distance: float, limit: int, repeat: int):
+    engine, SessionLocal = create_bench_engine()
+
+    print(f"\n=== {number} restaurants ===")
+    seed_restaurants(engine, number)
+
+    index = RestaurantSpatialIndex()
+
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        index.build(db)
+        print(f"{'build index':<40} {(time.perf_counter() - start) * 1000:10.3f} ms")
+
+    rnd = random.Random(1)
+    locations = [random_location(rnd) for _ in range(repeat)]
+
+    with SessionLocal() as db:
+        with timer("sql: crud.get_restaurant_randomly", repeat):
+            for lat, lng in locations:
+                crud.get_restaurant_randomly(db, lat, lng, distance, limit)
+
+        with timer("memory: index.sample", repeat):
+            for lat, lng in locations:
+                index.sample(lat, lng, distance, limit)
+
+        with timer("memory: index.sample + hydrate", repeat):
+            for lat, lng in locations:
+                items = index.sample(lat, lng, distance, limit)
+                crud.get_restaurants_with_ids(db, [r_id for r_id, _ in items])
+
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numbers", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--distance", type=float, default=5.0, help="搜尋半徑 (km)")
+    parser.add_argument("--limit", type=int, default=10, help="每次選擇的餐廳數量")
+    parser.add_argument("--repeat", type=int, default=50, help="每種查詢執行次數")
+    args = parser.parse_args()
+
+    for number in args.numbers:
+        run(number, args.distance, args.limit, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+'''
+Author: weijay
+Date: 2026-10-18 23:06:25
+LastEditors: weijay
+LastEditTime: 2026-10-18 23:06:25
+Description: 比較 SQLite PRAGMA 設定組合在同時讀寫時的效能 (透過 FastAPI app 發送請求)
+
+使用方式:
+    python -m benchmarks.bench_sqlite_pragmas --clients 16 --duration 10 --write-ratio 0.2
+'''
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from sqlalchemy.orm import sessionmaker
+
+from app import create_app, pagination
+from app.config.config import SQLITE_PRAGMA_PROFILES, BaseConfig
+from app.database import create_engine_from_config, model
+from app.routers import register_router
+from app.routers.depends import get_db
+from benchmarks._utils import percentile, seed_restaurants, serve_app
+
+ROOT_URL = "/api/v1"
+
+
+def run_profile(name: str, pragmas: dict, args) -> dict:
+    """用 `pragmas` 建立資料庫並啟動 app，同時發送讀取和寫入請求 `args.duration` 秒"""
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    class Config(BaseConfig):
+        DATABASE_URL = f"sqlite:///{path}"
+        SQLITE_PRAGMAS = pragmas
+        DB_POOL_SIZE = args.clients
+        DB_MAX_OVERFLOW = 0
+
+    engine = create_engine_from_config(Config)
+    model.Base.metadata.create_all(bind=engine)
+    seed_restaurants(engine, args.restaurants)
+
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+
+        try:
+            yield db
+
+        finally:
+            db.close()
+
+    app = create_app("test")
+    register_router(app, ROOT_URL)
+    app.dependency_overrides[get_db] = override_get_db
+
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+
+    def client_loop(seed: int):
+        rnd = random.Random(seed)
+
+        with httpx.Client(base_url=f"{base_url}{ROOT_URL}", timeout=30) as client:
+            while time.perf_counter() < deadline:
+                restaurant_id = rnd.randint(1, args.restaurants)
+
+                if rnd.random() < args.write_ratio:
+                    kind = "write"
+                    request = lambda: client.patch(  # noqa: E731
+                        f"/restaurant/{restaurant_id}", json={"name": f"updated_{seed}"}
+                    )
+
+                else:
+                    kind = "read"
+                    cursor = pagination.encode_cursor(restaurant_id)
+                    request = lambda: client.get(  # noqa: E731
+                        "/restaurant/", params={"cursor": cursor, "limit": 50}
+                    )
+
+                start = time.perf_counter()
+
+                try:
+                    ok = request().status_code == 200
+
+                except httpx.HTTPError:
+                    ok = False
+
+                elapsed = time.perf_counter() - start
+
+                with lock:
+                    if ok:
+                        latencies[kind].append(elapsed)
+
+                    else:
+                        errors[kind] += 1
+
+    with serve_app(app) as base_url:
+        deadline = time.perf_counter() + args.duration
+
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            list(executor.map(client_loop, range(args.clients)))
+
+    engine.dispose()
+
+    result = {"profile": name, "duration": args.duration}
+
+    for kind in ("read", "write"):
+        result[kind] = {
+            "count": len(latencies[kind]),
+            "errors": errors[kind],
+            "p50": percentile(latencies[kind], 50) * 1000,
+            "p99": percentile(latencies[kind], 99) * 1000,
+            "mean": (statistics.mean(latencies[kind]) * 1000) if latencies[kind] else float("nan"),
+        }
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--restaurants", type=int, default=20000, help="資料庫中的餐廳數量")
+    parser.add_argument("--clients", type=int, default=16, help="同時發送請求的 client 數量")
+    parser.add_argument("--duration", type=float, default=10, help="每一組設定測試的秒數")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="寫入請求的比例")
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(SQLITE_PRAGMA_PROFILES),
+        choices=list(SQLITE_PRAGMA_PROFILES),
+        help="要比較的 PRAGMA 設定組合",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'profile':<10} {'kind':<6} {'req/s':>8} {'errors':>7} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}"
+    )
+
+    for name in args.profiles:
+        result = run_profile(name, SQLITE_PRAGMA_PROFILES[name], args)
+
+        for kind in ("read", "write"):
+            stats = result[kind]
+
+            print(
+                f"{name:<10} {kind:<6} {stats['count'] / args.duration:8.1f} {stats['errors']:7d} "
+                f"{stats['p50']:8.2f} {stats['p99']:8.2f} {stats['mean']:8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,14 @@ Description: 定義一些測試會用到的通用測試 case
 
 import unittest
 
+from app import passwords
+from app.config.config import TestConfig
 from tests.utils import FakeDataBase
 
+# 預設的雜湊演算法是 argon2 ，測試時降低計算成本 (argon2 記憶體 1024 KiB、迭代 1 次、平行度 1，bcrypt rounds 4)，
+# 並且在目前 process 的 thread 中計算雜湊，不建立 process pool
+passwords.configure_password_hashing(TestConfig)
+
 
 class BaseDataBaseTestCase(unittest.TestCase):
     """如果會需要使用的測試資料庫的話，可以繼承這個類別
@@ -0,0 +1,102 @@
+'''
+Author: weijay
+Date: 2026-10-18 20:58:02
+LastEditors: weijay
+LastEditTime: 2026-10-18 20:58:02
+Description: app.bulk_import 單元測試
+'''
+
+from unittest import mock
+
+from sqlalchemy import text
+
+from app import bulk_import
+from app.database.model import Restaurant
+from tests import BaseDataBaseTestCase
+from tests.utils import fake_get_coords_batch
+
+
+class TestBulkImport(BaseDataBaseTestCase):
+    def tearDown(self) -> None:
+        with self.fake_database.get_db() as db:
+            db.execute(text("DELETE FROM restaurant_open_time"))
+            db.execute(text("DELETE FROM restaurant"))
+            db.commit()
+
+    def test_validate_row(self):
+        row = bulk_import.validate_row(
+            0,
+            {
+                "name": "test",
+                "address": "test address",
+                "open_times": [{"day_of_week": 1, "open_time": "11:00", "close_time": "14:00"}],
+            },
+        )
+
+        self.assertEqual(row.item.name, "test")
+        self.assertEqual(len(row.open_times), 1)
+
+        for data in [
+            "not an object",
+            {"name": "test"},
+            {
+                "name": "test",
+                "address": "test address",
+                "open_times": [{"day_of_week": 1, "open_time": "11-00", "close_time": "14:00"}],
+            },
+        ]:
+            with self.assertRaises(ValueError):
+                bulk_import.validate_row(0, data)
+
+    def test_parse_csv(self):
+        content = (
+            "name,address,phone,price,open_times\n"
+            "餐廳1,地址1,,100,1|11:00|14:00;1|17:00|21:00\n"
+            "餐廳2,地址2,0912345678,,\n"
+        )
+
+        rows = bulk_import.parse_csv(content)
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["price"], "100")
+        self.assertEqual(len(rows[0]["open_times"]), 2)
+        self.assertEqual(
+            rows[0]["open_times"][1],
+            {"day_of_week": "1", "open_time": "17:00", "close_time": "21:00"},
+        )
+        self.assertNotIn("phone", rows[0])
+        self.assertNotIn("open_times", rows[1])
+
+    @mock.patch("app.utils.MapApi._get_coords_batch", fake_get_coords_batch)
+    def test_import_restaurants(self):
+        data = [
+            {
+                "name": "餐廳1",
+                "address": "地址1",
+                "open_times": [{"day_of_week": 1, "open_time": "11:00", "close_time": "14:00"}],
+            },
+            {"name": "餐廳2"},
+            {"name": "餐廳3", "address": "invalid address"},
+            {"name": "餐廳4", "address": "地址4"},
+        ]
+
+        with self.fake_database.get_db() as db:
+            result = bulk_import.import_restaurants(db, data, max_workers=2)
+
+            self.assertEqual(result["total"], 4)
+            self.assertEqual(result["created"], 2)
+            self.assertEqual(result["failed"], 2)
+            self.assertEqual([error["index"] for error in result["errors"]], [1, 2])
+
+            restaurants = (
+                db.query(Restaurant).filter(Restaurant.id.in_(result["restaurant_ids"])).all()
+            )
+
+            self.assertEqual(set(r.name for r in restaurants), {"餐廳1", "餐廳4"})
+
+            for restaurant in restaurants:
+                self.assertIsNotNone(restaurant.geohash)
+
+                if restaurant.name == "餐廳1":
+                    self.assertEqual(len(restaurant.open_times), 1)
+                    self.assertIsNotNone(restaurant.open_time_bitmap)
@@ -6,11 +6,18 @@ LastEditTime: 2023-08-01 17:47:30
 Description: DataBase CRUD 單元測試
 '''
 
-from sqlalchemy import text
+from datetime import time
+from unittest import mock
+
+import requests
+from sqlalchemy import event, text
+from sqlalchemy.dialects import mysql, postgresql
 
 from app.schemas import database_schema
 from app.database.model import Restaurant, RestaurantOpenTime, User
+from app import geo, open_time_bitmap
 from app.database import crud
+from app.utils import MapApiError
 from tests import BaseDataBaseTestCase
 from tests.utils import FakeData, FakeInitData
 
@@ -50,6 +57,19 @@ class TestRestaurantCURD(BaseDataBaseTestCase):
         self.assertTrue(isinstance(restaurants, list))
         self.assertEqual(restaurants[0].name, fake_restaurant.name)
 
+    def test_get_restaurants_function_with_after_id(self):
+        with self.fake_database.get_db() as db:
+            db.add_all([Restaurant(**data) for data in FakeData.fake_restaurant(number=3)])
+            db.commit()
+
+            all_ids = [r.id for r in crud.get_restaurants(db)]
+
+            first_page = crud.get_restaurants(db, limit=2)
+            second_page = crud.get_restaurants(db, after_id=first_page[-1].id, limit=2)
+
+        self.assertEqual(all_ids, sorted(all_ids))
+        self.assertEqual([r.id for r in first_page + second_page], all_ids)
+
     def test_get_restaurant_function(self):
         fake_data = FakeData.fake_restaurant()
 
@@ -65,6 +85,22 @@ class TestRestaurantCURD(BaseDataBaseTestCase):
             self.assertIsNotNone(restaurant)
             self.assertEqual(restaurant.name, db_restaurant.name)
 
+    def test_get_restaurants_with_ids_function(self):
+        fake_data_list = FakeData.fake_restaurant(number=3)
+
+        with self.fake_database.get_db() as db:
+            db_restaurants = [Restaurant(**data) for data in fake_data_list]
+
+            db.add_all(db_restaurants)
+            db.commit()
+
+            restaurant_ids = [r.id for r in reversed(db_restaurants)] + [1000]
+
+            restaurants = crud.get_restaurants_with_ids(db, restaurant_ids)
+
+            self.assertEqual([r.id for r in restaurants], restaurant_ids[:3])
+            self.assertEqual(crud.get_restaurants_with_ids(db, []), [])
+
     def test_create_restaurant_function(self):
         fake_data = FakeData.fake_restaurant()
 
@@ -96,6 +132,109 @@ class TestRestaurantCURD(BaseDataBaseTestCase):
         self.assertEqual(updated_restaurant.address, restaurant.address)
         self.assertEqual(updated_restaurant.phone, restaurant.phone)
 
+    def test_update_restaurant_function_update_geohash(self):
+        """更新經緯度時， `geohash` 也要跟著更新"""
+
+        fake_data = FakeData.fake_restaurant()
+        far_lat, far_lng = FakeData.fake_current_location_far()
+
+        with self.fake_database.get_db() as db:
+            restaurant = crud.create_restaurant(db, database_schema.RestaurantDBModel(**fake_data))
+
+            self.assertEqual(
+                restaurant.geohash, geo.encode_geohash(fake_data["lat"], fake_data["lng"])
+            )
+
+            update_data = database_schema.RestaurantUpdateDBModel(lat=far_lat, lng=far_lng)
+
+            updated_restaurant = crud.update_restaurant(db, restaurant.id, update_data)
+
+        self.assertEqual(updated_restaurant.geohash, geo.encode_geohash(far_lat, far_lng))
+
+    def test_update_restaurant_function_with_address_changed(self):
+        """地址正規化後不同時才會重新查詢經緯度，並更新 `geohash`"""
+
+        fake_data = FakeData.fake_restaurant()
+        far_lat, far_lng = FakeData.fake_current_location_far()
+
+        with self.fake_database.get_db() as db, mock.patch(
+            "app.utils.MapApi._get_coords_batch", return_value=[(far_lat, far_lng)]
+        ) as mock_get_coords_batch:
+            restaurant = crud.create_restaurant(
+                db,
+                database_schema.RestaurantDBModel(**{**fake_data, "address": "台北市 信義路 1 號"}),
+            )
+
+            crud.update_restaurant(
+                db,
+                restaurant.id,
+                database_schema.RestaurantUpdateDBModel(address=" 臺北市  信義路 １ 號"),
+            )
+
+            mock_get_coords_batch.assert_not_called()
+
+            updated_restaurant = crud.update_restaurant(
+                db,
+                restaurant.id,
+                database_schema.RestaurantUpdateDBModel(address="update restaurant new address"),
+            )
+
+            mock_get_coords_batch.assert_called_once()
+
+        self.assertEqual(updated_restaurant.address, "update restaurant new address")
+        self.assertEqual((updated_restaurant.lat, updated_restaurant.lng), (far_lat, far_lng))
+        self.assertEqual(updated_restaurant.geohash, geo.encode_geohash(far_lat, far_lng))
+
+    @mock.patch("app.utils.MapApi._get_coords_batch", return_value=[(None, None)])
+    def test_update_restaurant_function_with_invalid_address(self, mock_get_coords_batch):
+        fake_data = FakeData.fake_restaurant()
+
+        with self.fake_database.get_db() as db:
+            restaurant = crud.create_restaurant(db, database_schema.RestaurantDBModel(**fake_data))
+            update_data = database_schema.RestaurantUpdateDBModel(
+                name="invalid address", address="update restaurant invalid address"
+            )
+
+            with self.assertRaises(ValueError):
+                crud.update_restaurant(db, restaurant.id, update_data)
+
+            db.refresh(restaurant)
+
+            self.assertEqual(restaurant.name, fake_data["name"])
+            self.assertEqual(restaurant.address, fake_data["address"])
+
+            # 延後查詢時，改成等待背景 worker 查詢經緯度
+            updated_restaurant = crud.update_restaurant(
+                db, restaurant.id, update_data, defer_geocode=True
+            )
+
+        self.assertEqual(updated_restaurant.geocode_status, "pending_geocode")
+        self.assertIsNone(updated_restaurant.lat)
+        self.assertIsNone(updated_restaurant.geohash)
+
+    @mock.patch(
+        "app.utils.MapApi._get_coords_batch", side_effect=requests.ConnectionError("unavailable")
+    )
+    def test_update_restaurant_function_with_map_api_unavailable(self, mock_get_coords_batch):
+        fake_data = FakeData.fake_restaurant()
+
+        with self.fake_database.get_db() as db:
+            restaurant = crud.create_restaurant(db, database_schema.RestaurantDBModel(**fake_data))
+            update_data = database_schema.RestaurantUpdateDBModel(
+                address="update restaurant unavailable address"
+            )
+
+            with self.assertRaises(MapApiError):
+                crud.update_restaurant(db, restaurant.id, update_data)
+
+            # 延後查詢時，改成等待背景 worker 查詢經緯度
+            updated_restaurant = crud.update_restaurant(
+                db, restaurant.id, update_data, defer_geocode=True
+            )
+
+        self.assertEqual(updated_restaurant.geocode_status, "pending_geocode")
+        self.assertEqual(updated_restaurant.address, "update restaurant unavailable address")
+
     def test_update_restaurant_function_with_not_exist_id(self):
         fake_data = FakeData.fake_restaurant()
 
@@ -200,6 +339,37 @@ class TestUserRestaurantCRUD(BaseDataBaseTestCase):
 
             self.assertFalse(result)
 
+    def test_check_is_user_restaurant_memoized(self):
+        """同一個 session 中重複檢查不會再查詢資料庫，使用者的餐廳改變後會重新查詢"""
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(self.fake_database.engine, "before_cursor_execute", count_statement)
+        self.addCleanup(
+            event.remove, self.fake_database.engine, "before_cursor_execute", count_statement
+        )
+
+        with self.fake_database.get_db() as db:
+            self.assertFalse(crud.check_is_user_restaurant(db, self.db_user_id, 100))
+            self.assertFalse(crud.check_is_user_restaurant(db, self.db_user_id, 100))
+
+            self.assertEqual(len(statements), 1)
+            self.assertIn("EXISTS", statements[0])
+            self.assertIn("user_restaurant_intermediary", statements[0])
+
+            db_restaurant = crud.create_restaurant_with_user(
+                db, database_schema.RestaurantDBModel(**FakeData.fake_restaurant()), self.db_user_id
+            )
+
+            self.assertTrue(crud.check_is_user_restaurant(db, self.db_user_id, db_restaurant.id))
+
+            crud.delete_restaurant(db, db_restaurant.id)
+
+            self.assertFalse(crud.check_is_user_restaurant(db, self.db_user_id, db_restaurant.id))
+
     def test_get_restaurants_with_user_function(self):
         """測試 取得使用者收藏的餐廳列表 CRUD 功能
 
@@ -226,6 +396,9 @@ class TestUserRestaurantCRUD(BaseDataBaseTestCase):
 
             self.assertEqual(len(items), 1)
 
+            # 使用者不存在
+            self.assertEqual(crud.get_restaurants_with_user(db, 1000), [])
+
     def test_create_restaurant_with_user_function(self):
         """測試 建立使用者餐廳 功能
 
@@ -252,10 +425,43 @@ class TestUserRestaurantCRUD(BaseDataBaseTestCase):
             self.assertEqual(user_restaurants[0].name, fake_restaurant["name"])
             self.assertEqual(user_restaurants[0].address, fake_restaurant["address"])
 
+            # 使用者不存在
+            self.assertIsNone(
+                crud.create_restaurant_with_user(
+                    db, database_schema.RestaurantDBModel(**fake_restaurant), 1000
+                )
+            )
+
 
 class TestChoiceRestaurantCURD(BaseDataBaseTestCase):
     """隨機選擇餐廳 CURD 功能測試"""
 
+    def _explain_filter_by_distance(self, db, lat: float, lng: float, distance: float) -> str:
+        """回傳依照距離篩選餐廳的 SQLite query plan"""
+
+        query = crud._filter_by_distance(
+            crud._query_enabled_restaurants(db), lat, lng, distance
+        ).params(lat=lat, lng=lng, distance=distance)
+
+        compiled = query.statement.compile(db.get_bind())
+        params = [compiled.params[name] for name in compiled.positiontup]
+        rows = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(params))
+
+        return "\n".join(row[-1] for row in rows)
+
+    def test_filter_by_distance_query_plan(self):
+        """依照距離篩選時要使用 geohash 或經緯度的 index，不能被其他欄位的 index 取代"""
+
+        with self.fake_database.get_db() as db:
+            lat, lng = FakeData.fake_current_location()
+
+            self.assertIn(
+                "ix_restaurant_geohash", self._explain_filter_by_distance(db, lat, lng, 5)
+            )
+
+            # 搜尋範圍跨越 180 度經線，沒辦法用 geohash 表示時，改用經緯度範圍
+            self.assertIn("idx_lat_lng", self._explain_filter_by_distance(db, 0, 179.99, 5))
+
     def tearDown(self) -> None:
         with self.fake_database.get_db() as db:
             db.execute(text("DELETE FROM restaurant"))
@@ -325,6 +531,172 @@ class TestChoiceRestaurantCURD(BaseDataBaseTestCase):
                 random_restaurant[0].open_times[0].close_time, open_time1["close_time"]
             )
 
+    def test_get_restaurant_randomly_function_is_random(self):
+        """每一間距離內的餐廳都要有機會被選到，而且不會選到重複的餐廳"""
+
+        fake_inner_data_list = FakeData.fake_restaurant(number=3)
+
+        with self.fake_database.get_db() as db:
+            db.add_all([Restaurant(**data) for data in fake_inner_data_list])
+            db.commit()
+
+            lat, lng = FakeData.fake_current_location()
+
+            chosen_names = set()
+
+            for _ in range(50):
+                items = crud.get_restaurant_randomly(db, lat, lng, 5.0, 2)
+
+                self.assertEqual(len(items), 2)
+                self.assertNotEqual(items[0].id, items[1].id)
+
+                chosen_names.update(item.name for item in items)
+
+        self.assertEqual(chosen_names, set(data["name"] for data in fake_inner_data_list))
+
+    def test_get_restaurant_randomly_with_open_time_function_not_duplicate(self):
+        """同一間餐廳有多個符合的營業時間時，不會被重複選到"""
+
+        fake_data = FakeData.fake_restaurant()
+
+        db_restaurant = Restaurant(**fake_data)
+        db_open_times = [
+            RestaurantOpenTime(day_of_week=1, open_time=time(8, 0), close_time=time(14, 0)),
+            RestaurantOpenTime(day_of_week=1, open_time=time(11, 0), close_time=time(20, 0)),
+        ]
+
+        db_restaurant.open_times.extend(db_open_times)
+
+        with self.fake_database.get_db() as db:
+            db.add(db_restaurant)
+            db.add_all(db_open_times)
+            db.commit()
+
+            lat, lng = FakeData.fake_current_location()
+
+            items = crud.get_restaurant_randomly_with_open_time(db, lat, lng, 5.0, 1, "12:00", 10)
+
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].name, fake_data["name"])
+
+    def test_get_restaurant_nearest_function(self):
+        inner_data_list = FakeData.fake_restaurant(number=2)
+        outer_data = FakeData.fake_restaurant_far()
+
+        with self.fake_database.get_db() as db:
+            db.add_all([Restaurant(**data) for data in inner_data_list + [outer_data]])
+            db.commit()
+
+            lat, lng = FakeData.fake_current_location()
+
+            items = crud.get_restaurant_nearest(db, lat, lng, 5.0, 10)
+
+            distances = [item.distance_km for item in items]
+
+            self.assertEqual(len(items), 2)
+            self.assertEqual(distances, sorted(distances))
+
+            for item in items:
+                self.assertAlmostEqual(
+                    item.distance_km, geo.haversine(lat, lng, item.lat, item.lng)
+                )
+
+            items = crud.get_restaurant_nearest(db, lat, lng, 5.0, 1)
+
+            self.assertEqual(len(items), 1)
+
+    def test_get_restaurant_randomly_function_skip_disabled(self):
+        """停用的餐廳不會被選到 (和記憶體中的空間索引相同)"""
+
+        enabled_data, disabled_data = FakeData.fake_restaurant(number=2)
+
+        with self.fake_database.get_db() as db:
+            disabled_restaurant = Restaurant(**disabled_data)
+            disabled_restaurant.is_enable = False
+
+            db.add_all([Restaurant(**enabled_data), disabled_restaurant])
+            db.commit()
+
+            lat, lng = FakeData.fake_current_location()
+
+            for items in (
+                crud.get_restaurant_randomly(db, lat, lng, 5.0, 10),
+                crud.get_restaurant_nearest(db, lat, lng, 5.0, 10),
+            ):
+                self.assertEqual([item.name for item in items], [enabled_data["name"]])
+
+    def test_filter_by_distance_with_postgresql(self):
+        """PostgreSQL 使用 PostGIS 的 ST_DWithin 篩選距離"""
+
+        lat, lng = FakeData.fake_current_location()
+
+        with self.fake_database.get_db() as db:
+            bind = mock.Mock()
+            bind.dialect.name = "postgresql"
+
+            with mock.patch.object(db, "get_bind", return_value=bind):
+                query = crud._filter_by_distance(db.query(Restaurant.id), lat, lng, 5.0)
+
+            sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+        self.assertIn("ST_DWithin", sql)
+        self.assertNotIn("haversine_km", sql)
+        self.assertNotIn("geohash", sql)
+
+    def test_filter_by_distance_with_mysql(self):
+        """SQLite 和 PostgreSQL 以外的資料庫沒有 haversine_km()，使用 SQL 數學運算式"""
+
+        lat, lng = FakeData.fake_current_location()
+
+        with self.fake_database.get_db() as db:
+            bind = mock.Mock()
+            bind.dialect.name = "mysql"
+
+            with mock.patch.object(db, "get_bind", return_value=bind):
+                query = crud._filter_by_distance(db.query(Restaurant.id), lat, lng, 5.0)
+                query = query.with_entities(
+                    Restaurant.id, crud._get_distance_column(query, lat, lng)
+                )
+
+            sql = str(query.statement.compile(dialect=mysql.dialect()))
+
+        self.assertIn("asin", sql.lower())
+        self.assertNotIn("haversine_km", sql)
+
+    def test_get_restaurant_nearest_function_with_haversine_expression(self):
+        """數學運算式和 haversine_km() 的結果相同 (SQLite 有編譯數學函式時才能執行)"""
+
+        inner_fake_data1, inner_fake_data2 = FakeData.fake_restaurant(number=2)
+        outer_fake_data = FakeData.fake_restaurant_far()
+        lat, lng = FakeData.fake_current_location()
+
+        with self.fake_database.get_db() as db:
+            db.add_all(
+                [
+                    Restaurant(**inner_fake_data1),
+                    Restaurant(**inner_fake_data2),
+                    Restaurant(**outer_fake_data),
+                ]
+            )
+            db.commit()
+
+            try:
+                db.execute(text("SELECT asin(1)"))
+
+            except Exception:
+                self.skipTest("SQLite is not compiled with math functions.")
+
+            expected = crud.get_restaurant_nearest(db, lat, lng, 5.0, 10)
+
+            with mock.patch("app.database.crud._is_sqlite", return_value=False):
+                items = crud.get_restaurant_nearest(db, lat, lng, 5.0, 10)
+
+        self.assertEqual([item.id for item in items], [item.id for item in expected])
+        self.assertEqual(len(items), 2)
+
+        for item, expected_item in zip(items, expected):
+            self.assertAlmostEqual(item.distance_km, expected_item.distance_km, places=6)
+
 
 class TestChoiceUserRestaurantCURD(BaseDataBaseTestCase):
     """測試隨機選擇使用者餐廳 CURD 功能"""
@@ -376,6 +748,32 @@ class TestChoiceUserRestaurantCURD(BaseDataBaseTestCase):
             self.assertEqual(len(restaurants), 1)
             self.assertEqual(restaurants[0].name, inner_restaurant.name)
 
+    def test_get_user_restaurant_randomly_function_is_random(self):
+        fake_inner_data_list = FakeData.fake_restaurant(number=3)
+
+        with self.fake_database.get_db() as db:
+            user = db.get(User, self.db_user_id)
+
+            for data in fake_inner_data_list:
+                db_restaurant = Restaurant(**data)
+                user.restaurants.append(db_restaurant)
+                db.add(db_restaurant)
+
+            db.commit()
+
+            lat, lng = FakeData.fake_current_location()
+
+            chosen_names = set()
+
+            for _ in range(50):
+                items = crud.get_user_restaurant_randomly(db, self.db_user_id, lat, lng, 5.0, 1)
+
+                self.assertEqual(len(items), 1)
+
+                chosen_names.add(items[0].name)
+
+        self.assertEqual(chosen_names, set(data["name"] for data in fake_inner_data_list))
+
     def test_get_user_restaurant_randomly_with_open_time_function(self):
         fake_inner_data1, fake_inner_data2 = FakeData.fake_restaurant(number=2)
 
@@ -521,6 +919,63 @@ class TestRestaurantOpenTimeCRUD(BaseDataBaseTestCase):
         self.assertIsNotNone(open_time)
         self.assertIsNone(delete_open_time_obj)
 
+    def test_update_restaurant_open_time_function_update_bitmap(self):
+        with self.fake_database.get_db() as db:
+            open_time_obj = self._get_open_time_obj(db)
+
+            # 初始資料的 day_of_week 不在 1~7 之間，所以沒有 bitmap
+            self.assertIsNone(self._get_restaurant_obj(db).open_time_bitmap)
+
+            update_data = database_schema.RestaurantOpenTimeUpdateDBModel(day_of_week=5)
+
+            crud.update_restaurant_open_time(db, open_time_obj.id, update_data)
+
+            bitmap = self._get_restaurant_obj(db).open_time_bitmap
+
+            self.assertTrue(
+                open_time_bitmap.is_open(bitmap, open_time_bitmap.get_slot_index(5, "10:00"))
+            )
+            self.assertFalse(
+                open_time_bitmap.is_open(bitmap, open_time_bitmap.get_slot_index(5, "23:00"))
+            )
+            self.assertFalse(
+                open_time_bitmap.is_open(bitmap, open_time_bitmap.get_slot_index(4, "10:00"))
+            )
+
+            crud.delete_restaurant_open_time(db, open_time_obj.id)
+
+            self.assertIsNone(self._get_restaurant_obj(db).open_time_bitmap)
+
+    def test_create_restaurant_open_time_function_with_overnight(self):
+        """跨夜的營業時間會延續到隔天"""
+
+        with self.fake_database.get_db() as db:
+            r_obj = self._get_restaurant_obj(db)
+
+            crud.create_restaurant_open_times(
+                db,
+                r_obj.id,
+                [
+                    database_schema.RestaurantOpenTimeDBModel(
+                        day_of_week=7, open_time=time(22, 0), close_time=time(2, 0)
+                    ),
+                ],
+            )
+
+            lat, lng = FakeData.fake_current_location()
+
+            for day_of_week, current_time, expected in [
+                (7, "23:30", 1),
+                (1, "01:30", 1),
+                (1, "02:30", 0),
+                (7, "01:30", 0),
+            ]:
+                items = crud.get_restaurant_randomly_with_open_time(
+                    db, lat, lng, 5.0, day_of_week, current_time, 10
+                )
+
+                self.assertEqual(len(items), expected)
+
 
 class TestUserCRUD(BaseDataBaseTestCase):
     def _get_user_obj(self, db) -> "User":
@@ -584,3 +1039,19 @@ class TestUserCRUD(BaseDataBaseTestCase):
             user = db.query(User).filter(User.username == fake_user_date["username"]).first()
 
             self.assertIsNotNone(user)
+
+    def test_update_user_password_hash_function(self):
+        """測試更新 user 的密碼雜湊，密碼雜湊已經被修改時不會更新"""
+
+        with self.fake_database.get_db() as db:
+            user = self._get_user_obj(db)
+            old_password_hash = user.password_hash
+
+            self.assertFalse(crud.update_user_password_hash(db, user.id, "other hash", "new hash"))
+            self.assertTrue(
+                crud.update_user_password_hash(db, user.id, old_password_hash, "new hash")
+            )
+
+            db.refresh(user)
+
+            self.assertEqual(user.password_hash, "new hash")
@@ -0,0 +1,33 @@
+'''
+Author: weijay
+Date: 2026-10-18 16:52:08
+LastEditors: weijay
+LastEditTime: 2026-10-18 16:52:08
+Description: 註冊在 SQLite 連線上的自訂函式測試
+'''
+
+from sqlalchemy import text
+
+from app import geo
+from tests import BaseDataBaseTestCase
+from tests.utils import FakeData
+
+
+class TestSqliteFunctions(BaseDataBaseTestCase):
+    def test_haversine_km_function(self):
+        lat, lng = FakeData.fake_current_location()
+        far_lat, far_lng = FakeData.fake_current_location_far()
+
+        with self.fake_database.get_db() as db:
+            result = db.execute(
+                text("SELECT haversine_km(:lat1, :lng1, :lat2, :lng2)"),
+                {"lat1": lat, "lng1": lng, "lat2": far_lat, "lng2": far_lng},
+            ).scalar()
+
+            self.assertAlmostEqual(result, geo.haversine(lat, lng, far_lat, far_lng))
+
+    def test_haversine_km_function_with_null(self):
+        with self.fake_database.get_db() as db:
+            result = db.execute(text("SELECT haversine_km(NULL, 121.0, 24.0, 121.0)")).scalar()
+
+            self.assertIsNone(result)
@@ -0,0 +1,36 @@
+'''
+Author: weijay
+Date: 2026-10-18 20:03:51
+LastEditors: weijay
+LastEditTime: 2026-10-18 20:03:51
+Description: app.export 單元測試
+'''
+
+import gzip
+import json
+import unittest
+from datetime import datetime
+
+from app import export
+
+
+class TestExport(unittest.TestCase):
+    def test_iter_ndjson(self):
+        rows = [{"id": i, "name": f"餐廳{i}", "create_at": datetime(2023, 1, 1)} for i in range(5)]
+
+        chunks = list(export.iter_ndjson(rows, chunk_rows=2))
+        lines = b"".join(chunks).decode().splitlines()
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(
+            json.loads(lines[0]), {"id": 0, "name": "餐廳0", "create_at": "2023-01-01T00:00:00"}
+        )
+
+    def test_iter_ndjson_without_rows(self):
+        self.assertEqual(list(export.iter_ndjson([])), [])
+
+    def test_iter_gzip(self):
+        chunks = [b"a" * 1000, b"b" * 1000]
+
+        self.assertEqual(gzip.decompress(b"".join(export.iter_gzip(chunks))), b"".join(chunks))
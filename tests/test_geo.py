@@ -0,0 +1,90 @@
+'''
+Author: weijay
+Date: 2026-10-18 11:05:13
+LastEditors: weijay
+LastEditTime: 2026-10-18 11:05:13
+Description: app.geo 單元測試
+'''
+
+import math
+import unittest
+
+from app import geo
+
+
+class TestBoundingBox(unittest.TestCase):
+    def test_bounding_box_contains_circle(self):
+        lat, lng, distance = 24.94409, 121.22538, 5.0
+
+        min_lat, max_lat, min_lng, max_lng = geo.get_bounding_box(lat, lng, distance)
+
+        # 圓上的每一個點都要在範圍內
+        for degree in range(0, 360, 5):
+            bearing = math.radians(degree)
+            angular = distance / geo.EARTH_RADIUS_KM
+
+            lat_rad = math.radians(lat)
+            p_lat = math.asin(
+                math.sin(lat_rad) * math.cos(angular)
+                + math.cos(lat_rad) * math.sin(angular) * math.cos(bearing)
+            )
+            p_lng = math.radians(lng) + math.atan2(
+                math.sin(bearing) * math.sin(angular) * math.cos(lat_rad),
+                math.cos(angular) - math.sin(lat_rad) * math.sin(p_lat),
+            )
+
+            p_lat, p_lng = math.degrees(p_lat), math.degrees(p_lng)
+
+            self.assertAlmostEqual(geo.haversine(lat, lng, p_lat, p_lng), distance, places=6)
+            self.assertTrue(min_lat - 1e-9 <= p_lat <= max_lat + 1e-9)
+            self.assertTrue(min_lng - 1e-9 <= p_lng <= max_lng + 1e-9)
+
+    def test_bounding_box_near_pole(self):
+        min_lat, max_lat, min_lng, max_lng = geo.get_bounding_box(89.99, 10.0, 5.0)
+
+        self.assertEqual(max_lat, 90.0)
+        self.assertIsNone(min_lng)
+        self.assertIsNone(max_lng)
+
+    def test_bounding_box_cross_antimeridian(self):
+        min_lat, max_lat, min_lng, max_lng = geo.get_bounding_box(0.0, 179.99, 5.0)
+
+        self.assertLess(min_lat, 0.0)
+        self.assertGreater(max_lat, 0.0)
+        self.assertIsNone(min_lng)
+        self.assertIsNone(max_lng)
+
+
+class TestHaversine(unittest.TestCase):
+    def test_haversine(self):
+        self.assertEqual(geo.haversine(24.94409, 121.22538, 24.94409, 121.22538), 0.0)
+
+        # 台北 101 到 台南火車站大約 265 km
+        distance = geo.haversine(25.03397, 121.56447, 22.99708, 120.21276)
+
+        self.assertAlmostEqual(distance, 265.0, delta=1.0)
+
+
+class TestGeohash(unittest.TestCase):
+    def test_encode_geohash(self):
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(len(geo.encode_geohash(24.94409, 121.22538)), geo.GEOHASH_PRECISION)
+
+    def test_covering_geohashes_contains_nearby_points(self):
+        lat, lng, distance = 24.94409, 121.22538, 5.0
+
+        prefixes = geo.get_covering_geohashes(lat, lng, distance)
+
+        self.assertIsNotNone(prefixes)
+        self.assertLessEqual(len(prefixes), geo.MAX_COVERING_CELLS)
+
+        min_lat, max_lat, min_lng, max_lng = geo.get_bounding_box(lat, lng, distance)
+
+        for p_lat in (min_lat, lat, max_lat):
+            for p_lng in (min_lng, lng, max_lng):
+                geohash = geo.encode_geohash(p_lat, p_lng)
+
+                self.assertTrue(any(geohash.startswith(prefix) for prefix in prefixes))
+
+    def test_covering_geohashes_with_huge_distance(self):
+        self.assertIsNone(geo.get_covering_geohashes(24.94409, 121.22538, 20000.0))
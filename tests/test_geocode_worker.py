@@ -0,0 +1,161 @@
+'''
+Author: weijay
+Date: 2026-10-18 22:21:47
+LastEditors: weijay
+LastEditTime: 2026-10-18 22:21:47
+Description: app.geocode_worker 單元測試
+'''
+
+import asyncio
+from unittest import mock
+
+import requests
+from sqlalchemy import text
+
+from app import geocoding
+from app.database import crud, model
+from app.geocode_worker import GeocodeWorker, resolve_pending_restaurants
+from app.schemas import database_schema
+from app.utils import MapApiError
+from tests import BaseDataBaseTestCase
+from tests.utils import FakeData, fake_get_coords_batch
+
+
+@mock.patch("app.utils.MapApi._get_coords_batch", fake_get_coords_batch)
+class TestGeocodeWorker(BaseDataBaseTestCase):
+    def setUp(self) -> None:
+        geocoding.coords_cache.clear()
+
+    def tearDown(self) -> None:
+        geocoding.coords_cache.clear()
+
+        with self.fake_database.get_db() as db:
+            db.execute(text("DELETE FROM restaurant"))
+            db.execute(text("DELETE FROM geocode_cache"))
+            db.commit()
+
+    def _create_pending_restaurant(self, db, address: str) -> model.Restaurant:
+        return crud.create_restaurant(
+            db, database_schema.RestaurantDBModel(name="test", address=address)
+        )
+
+    def test_resolve_pending_restaurants(self):
+        lat, lng = FakeData.fake_current_location()
+
+        with self.fake_database.get_db() as db:
+            restaurant = self._create_pending_restaurant(db, "pending address")
+
+            self.assertEqual(restaurant.geocode_status, model.GEOCODE_STATUS_PENDING)
+            self.assertIsNone(restaurant.lat)
+
+            # 還沒查詢到經緯度的餐廳不會出現在依照位置查詢的結果中
+            self.assertEqual(crud.get_restaurant_nearest(db, lat, lng, 5, 10), [])
+
+            self.assertEqual(resolve_pending_restaurants(db), (1, 1))
+
+            db.refresh(restaurant)
+
+            self.assertEqual(restaurant.geocode_status, model.GEOCODE_STATUS_RESOLVED)
+            self.assertIsNotNone(restaurant.lat)
+            self.assertIsNotNone(restaurant.geohash)
+            self.assertEqual(
+                [r.id for r in crud.get_restaurant_nearest(db, lat, lng, 5, 10)], [restaurant.id]
+            )
+
+            # 沒有等待中的餐廳
+            self.assertEqual(resolve_pending_restaurants(db), (0, 0))
+
+    def test_resolve_pending_restaurants_failed(self):
+        with self.fake_database.get_db() as db:
+            restaurant = self._create_pending_restaurant(db, "invalid address")
+
+            self.assertEqual(resolve_pending_restaurants(db, max_attempts=2), (1, 0))
+
+            db.refresh(restaurant)
+
+            self.assertEqual(restaurant.geocode_status, model.GEOCODE_STATUS_PENDING)
+            self.assertEqual(restaurant.geocode_attempts, 1)
+
+            resolve_pending_restaurants(db, max_attempts=2)
+
+            db.refresh(restaurant)
+
+            self.assertEqual(restaurant.geocode_status, model.GEOCODE_STATUS_FAILED)
+            self.assertEqual(resolve_pending_restaurants(db, max_attempts=2), (0, 0))
+
+    def test_resolve_pending_restaurants_with_map_api_unavailable(self):
+        with self.fake_database.get_db() as db:
+            restaurant = self._create_pending_restaurant(db, "pending address")
+
+            # 地圖 API 無法使用不算查詢失敗
+            with mock.patch(
+                "app.utils.MapApi._get_coords_batch", side_effect=requests.ConnectionError()
+            ):
+                for _ in range(3):
+                    with self.assertRaises(MapApiError):
+                        resolve_pending_restaurants(db, max_attempts=2)
+
+            db.refresh(restaurant)
+
+            self.assertEqual(restaurant.geocode_status, model.GEOCODE_STATUS_PENDING)
+            self.assertEqual(restaurant.geocode_attempts, 0)
+
+            self.assertEqual(resolve_pending_restaurants(db, max_attempts=2), (1, 1))
+
+    def test_worker_backoff(self):
+        delays = []
+
+        async def fake_sleep(seconds):
+            delays.append(seconds)
+
+            if len(delays) >= 4:
+                raise asyncio.CancelledError
+
+        async def run():
+            worker = GeocodeWorker(self.fake_database.SessionLocal, interval=1, max_backoff=3)
+
+            with mock.patch.object(
+                worker, "_resolve_once", side_effect=MapApiError("unavailable")
+            ), mock.patch("app.geocode_worker.asyncio.sleep", fake_sleep):
+                worker.start()
+
+                try:
+                    await worker._task
+
+                except asyncio.CancelledError:
+                    pass
+
+                await worker.stop()
+
+        asyncio.run(run())
+
+        # 地圖 API 無法使用時暫停的秒數每次加倍，最多 `max_backoff` 秒
+        self.assertEqual(delays, [1, 2, 3, 3])
+
+    def test_worker(self):
+        with self.fake_database.get_db() as db:
+            restaurant_id = self._create_pending_restaurant(db, "pending address").id
+
+        async def run():
+            worker = GeocodeWorker(self.fake_database.SessionLocal, interval=60)
+            worker.start()
+            worker.notify()
+
+            try:
+                for _ in range(100):
+                    with self.fake_database.get_db() as db:
+                        restaurant = db.get(model.Restaurant, restaurant_id)
+
+                        if restaurant.geocode_status == model.GEOCODE_STATUS_RESOLVED:
+                            return True
+
+                    await asyncio.sleep(0.05)
+
+                return False
+
+            finally:
+                await worker.stop()
+
+                self.assertFalse(worker.is_running)
+
+        self.assertTrue(asyncio.run(run()))
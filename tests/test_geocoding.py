@@ -0,0 +1,132 @@
+'''
+Author: weijay
+Date: 2026-10-18 21:36:12
+LastEditors: weijay
+LastEditTime: 2026-10-18 21:36:12
+Description: app.geocoding 單元測試
+'''
+
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import text
+
+from app import geocoding
+from app.database.model import GeocodeCache
+from app.utils import MapApiError
+from tests import BaseDataBaseTestCase
+
+
+class FakeMapApi:
+    """本地的地圖 API 替身，記錄每一次查詢的地址"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_coords_many(self, addresses: list, max_workers: int = 1):
+        if any("unavailable" in address for address in addresses):
+            raise MapApiError("unavailable")
+
+        results = []
+
+        for address in addresses:
+            self.calls.append(address)
+
+            if "invalid" in address:
+                results.append((None, None))
+
+            else:
+                results.append((25.0 + len(self.calls) / 1000, 121.5))
+
+        return results
+
+
+class TestNormalizeAddress(unittest.TestCase):
+    def test_normalize_address(self):
+        self.assertEqual(
+            geocoding.normalize_address("  臺北市信義區  信義路五段７號 "),
+            "台北市信義區 信義路五段7號",
+        )
+        self.assertEqual(
+            geocoding.normalize_address("１ Main ST"), geocoding.normalize_address("1 main st")
+        )
+
+
+class TestGeocoding(BaseDataBaseTestCase):
+    def setUp(self) -> None:
+        geocoding.coords_cache.clear()
+
+        self.map_api = FakeMapApi()
+        patcher = mock.patch("app.geocoding.MapApi", return_value=self.map_api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        geocoding.coords_cache.clear()
+
+        with self.fake_database.get_db() as db:
+            db.execute(text("DELETE FROM geocode_cache"))
+            db.commit()
+
+    def test_get_coords_cached_in_database(self):
+        with self.fake_database.get_db() as db:
+            coords = geocoding.get_coords(db, "台北市信義區信義路五段7號")
+
+            self.assertEqual(len(self.map_api.calls), 1)
+
+            cache = db.get(GeocodeCache, "台北市信義區信義路五段7號")
+            self.assertEqual((cache.lat, cache.lng), coords)
+
+            # 清掉記憶體快取後，仍然可以從資料庫快取取得
+            geocoding.coords_cache.clear()
+
+            self.assertEqual(geocoding.get_coords(db, " 臺北市信義區信義路五段７號"), coords)
+            self.assertEqual(len(self.map_api.calls), 1)
+
+    def test_get_coords_with_expired_cache(self):
+        with self.fake_database.get_db() as db:
+            geocoding.get_coords(db, "address")
+
+            geocoding.coords_cache.clear()
+            db.get(GeocodeCache, "address").update_at = datetime.utcnow() - timedelta(
+                days=geocoding.BaseConfig.GEOCODE_CACHE_TTL_DAYS + 1
+            )
+            db.commit()
+
+            coords = geocoding.get_coords(db, "address")
+
+            self.assertEqual(len(self.map_api.calls), 2)
+            self.assertEqual(db.get(GeocodeCache, "address").lat, coords[0])
+
+    def test_get_coords_not_found(self):
+        with self.fake_database.get_db() as db:
+            self.assertEqual(geocoding.get_coords(db, "invalid address"), (None, None))
+            self.assertEqual(geocoding.get_coords(db, "invalid address"), (None, None))
+
+            # 查不到的地址不會被快取
+            self.assertEqual(len(self.map_api.calls), 2)
+            self.assertIsNone(db.get(GeocodeCache, "invalid address"))
+
+    def test_get_coords_many(self):
+        with self.fake_database.get_db() as db:
+            geocoding.get_coords(db, "address 1")
+
+            results = geocoding.get_coords_many(
+                db, ["address 1", "address 2", "ADDRESS  2", "invalid"], max_workers=2
+            )
+
+            self.assertEqual(len(results), 4)
+            self.assertEqual(results[1], results[2])
+            self.assertEqual(results[3], (None, None))
+
+            # address 1 使用快取，address 2 只查詢一次
+            self.assertEqual(sorted(self.map_api.calls), ["address 1", "address 2", "invalid"])
+
+    def test_get_coords_with_map_api_unavailable(self):
+        with self.fake_database.get_db() as db:
+            # 地圖 API 無法使用時不會當作查不到經緯度
+            with self.assertRaises(MapApiError):
+                geocoding.get_coords(db, "unavailable address")
+
+            self.assertIsNone(db.get(GeocodeCache, "unavailable address"))
@@ -0,0 +1,58 @@
+'''
+Author: weijay
+Date: 2026-10-18 18:25:37
+LastEditors: weijay
+LastEditTime: 2026-10-18 18:25:37
+Description: app.open_time_bitmap 單元測試
+'''
+
+import unittest
+from datetime import time
+
+from app import open_time_bitmap
+
+
+class TestOpenTimeBitmap(unittest.TestCase):
+    def _is_open(self, bitmap, day_of_week, current_time) -> bool:
+        return open_time_bitmap.is_open(
+            bitmap, open_time_bitmap.get_slot_index(day_of_week, current_time)
+        )
+
+    def test_build_bitmap(self):
+        bitmap = open_time_bitmap.build_bitmap([(1, time(11, 0), time(14, 0))])
+
+        self.assertEqual(len(bitmap), open_time_bitmap.BITMAP_SIZE)
+        self.assertTrue(self._is_open(bitmap, 1, "11:00"))
+        self.assertTrue(self._is_open(bitmap, 1, "13:59"))
+        self.assertFalse(self._is_open(bitmap, 1, "10:59"))
+        self.assertFalse(self._is_open(bitmap, 1, "14:00"))
+        self.assertFalse(self._is_open(bitmap, 2, "12:00"))
+
+    def test_build_bitmap_with_overnight(self):
+        bitmap = open_time_bitmap.build_bitmap([(7, time(18, 0), time(2, 0))])
+
+        self.assertTrue(self._is_open(bitmap, 7, "23:45"))
+        self.assertTrue(self._is_open(bitmap, 1, "00:00"))
+        self.assertTrue(self._is_open(bitmap, 1, "01:59"))
+        self.assertFalse(self._is_open(bitmap, 1, "02:00"))
+        self.assertFalse(self._is_open(bitmap, 7, "01:00"))
+
+    def test_build_bitmap_with_all_day(self):
+        bitmap = open_time_bitmap.build_bitmap([(3, time(0, 0), time(0, 0))])
+
+        self.assertTrue(self._is_open(bitmap, 3, "00:00"))
+        self.assertTrue(self._is_open(bitmap, 3, "23:59"))
+        self.assertFalse(self._is_open(bitmap, 4, "00:00"))
+
+    def test_build_bitmap_without_open_time(self):
+        self.assertIsNone(open_time_bitmap.build_bitmap([]))
+        self.assertIsNone(open_time_bitmap.build_bitmap([(100, time(8, 0), time(22, 0))]))
+        self.assertFalse(open_time_bitmap.is_open(None, 0))
+
+    def test_get_slot_index(self):
+        self.assertEqual(open_time_bitmap.get_slot_index(1, "00:00"), 0)
+        self.assertEqual(open_time_bitmap.get_slot_index("2", "00:14"), 96)
+        self.assertEqual(open_time_bitmap.get_slot_index(7, time(23, 59)), 7 * 96 - 1)
+        self.assertIsNone(open_time_bitmap.get_slot_index(0, "12:00"))
+        self.assertIsNone(open_time_bitmap.get_slot_index(1, "12-00"))
+        self.assertIsNone(open_time_bitmap.get_slot_index("a", "12:00"))
@@ -0,0 +1,40 @@
+'''
+Author: weijay
+Date: 2026-10-18 19:20:13
+LastEditors: weijay
+LastEditTime: 2026-10-18 19:20:13
+Description: app.pagination 單元測試
+'''
+
+import unittest
+from types import SimpleNamespace
+
+from app import pagination
+
+
+class TestPagination(unittest.TestCase):
+    def test_encode_and_decode_cursor(self):
+        cursor = pagination.encode_cursor(123)
+
+        self.assertIsInstance(cursor, str)
+        self.assertEqual(pagination.decode_cursor(cursor), 123)
+        self.assertIsNone(pagination.decode_cursor(None))
+        self.assertIsNone(pagination.decode_cursor(""))
+
+    def test_decode_invalid_cursor(self):
+        for cursor in ["abc", pagination.encode_cursor("1"), "e30"]:
+            with self.assertRaises(ValueError):
+                pagination.decode_cursor(cursor)
+
+    def test_get_page(self):
+        items = [SimpleNamespace(id=i) for i in range(1, 4)]
+
+        page, next_cursor = pagination.get_page(items, 2)
+
+        self.assertEqual([item.id for item in page], [1, 2])
+        self.assertEqual(pagination.decode_cursor(next_cursor), 2)
+
+        page, next_cursor = pagination.get_page(items, 3)
+
+        self.assertEqual(len(page), 3)
+        self.assertIsNone(next_cursor)
@@ -0,0 +1,105 @@
+'''
+Author: weijay
+Date: 2026-10-19 00:31:05
+LastEditors: weijay
+LastEditTime: 2026-10-19 00:31:05
+Description: app.passwords 單元測試
+'''
+
+import asyncio
+import unittest
+
+from app import passwords
+from app.config.config import TestConfig
+
+
+class PoolTestConfig(TestConfig):
+    PASSWORD_HASH_WORKERS = 1
+
+
+class BcryptTestConfig(TestConfig):
+    PASSWORD_SCHEME = "bcrypt"
+
+
+class Argon2TestConfig(TestConfig):
+    PASSWORD_ARGON2_TIME_COST = 2
+
+
+class TestPasswords(unittest.TestCase):
+    def tearDown(self) -> None:
+        passwords.configure_password_hashing(TestConfig)
+
+    def test_hash_password(self):
+        password_hash = passwords.hash_password("password")
+
+        # 使用設定的演算法和參數
+        self.assertTrue(password_hash.startswith("$argon2id$v=19$m=1024,t=1,p=1$"))
+        self.assertTrue(passwords.verify_password("password", password_hash))
+        self.assertFalse(passwords.verify_password("wrong password", password_hash))
+        self.assertFalse(passwords.verify_password("password", None))
+        self.assertFalse(passwords.needs_update(password_hash))
+
+    def test_needs_update(self):
+        password_hash = passwords.hash_password("password")
+
+        # 舊的 bcrypt 雜湊仍然可以驗證，但需要重新計算
+        passwords.configure_password_hashing(BcryptTestConfig)
+        bcrypt_hash = passwords.hash_password("password")
+
+        self.assertTrue(bcrypt_hash.startswith("$2b$04$"))
+        self.assertTrue(passwords.needs_update(password_hash))
+
+        passwords.configure_password_hashing(TestConfig)
+
+        self.assertTrue(passwords.verify_password("password", bcrypt_hash))
+        self.assertTrue(passwords.needs_update(bcrypt_hash))
+
+        # 參數改變時也需要重新計算
+        passwords.configure_password_hashing(Argon2TestConfig)
+
+        self.assertTrue(passwords.verify_password("password", password_hash))
+        self.assertTrue(passwords.needs_update(password_hash))
+
+        self.assertFalse(passwords.needs_update(None))
+
+    def test_unsupported_scheme(self):
+        class Config(TestConfig):
+            PASSWORD_SCHEME = "md5_crypt"
+
+        with self.assertRaises(ValueError):
+            passwords.configure_password_hashing(Config)
+
+    def test_hash_password_async_in_thread(self):
+        async def run():
+            password_hash = await passwords.hash_password_async("password")
+
+            return (
+                await passwords.verify_password_async("password", password_hash),
+                await passwords.verify_password_async("wrong password", password_hash),
+            )
+
+        self.assertEqual(asyncio.run(run()), (True, False))
+
+    def test_hash_password_async_in_process_pool(self):
+        passwords.configure_password_hashing(PoolTestConfig)
+
+        async def run():
+            password_hash = await passwords.hash_password_async("password")
+
+            results = await asyncio.gather(
+                passwords.verify_password_async("password", password_hash),
+                passwords.verify_password_async("wrong password", password_hash),
+            )
+
+            return password_hash, results
+
+        password_hash, results = asyncio.run(run())
+
+        # process pool 中的 process 使用相同的設定
+        self.assertTrue(password_hash.startswith("$argon2id$v=19$m=1024,t=1,p=1$"))
+        self.assertEqual(results, [True, False])
+        self.assertIsNotNone(passwords._pool)
+
+        passwords.shutdown_password_pool()
+
+        self.assertIsNone(passwords._pool)
@@ -0,0 +1,142 @@
+'''
+Author: weijay
+Date: 2026-10-19 01:42:10
+LastEditors: weijay
+LastEditTime: 2026-10-19 01:42:10
+Description: app.rate_limit 單元測試
+'''
+
+import unittest
+from unittest import mock
+
+from app.rate_limit import LocalRateLimitBackend, LoginRateLimiter, RateLimitBackend
+
+
+class TestLocalRateLimitBackend(unittest.TestCase):
+    def test_consume(self):
+        backend = LocalRateLimitBackend()
+
+        with mock.patch("app.rate_limit.time.monotonic", return_value=0):
+            self.assertEqual(backend.consume("a", 2, 1), 0)
+            self.assertEqual(backend.consume("a", 2, 1), 0)
+            self.assertAlmostEqual(backend.consume("a", 2, 1), 1)
+
+            # 不同 key 的 bucket 互不影響
+            self.assertEqual(backend.consume("b", 2, 1), 0)
+
+        # 每秒補充 1 個 token
+        with mock.patch("app.rate_limit.time.monotonic", return_value=1.5):
+            self.assertEqual(backend.consume("a", 2, 1), 0)
+            self.assertAlmostEqual(backend.consume("a", 2, 1), 0.5)
+
+    def test_reset(self):
+        backend = LocalRateLimitBackend()
+
+        self.assertEqual(backend.consume("a", 1, 0), 0)
+        self.assertGreater(backend.consume("a", 1, 0), 0)
+
+        backend.reset("a")
+
+        self.assertEqual(backend.consume("a", 1, 0), 0)
+
+    def test_maxsize(self):
+        backend = LocalRateLimitBackend(maxsize=2)
+
+        for key in ("a", "b", "c"):
+            backend.consume(key, 1, 0)
+
+        self.assertEqual(len(backend), 2)
+
+        # 被丟棄的 bucket 等同補滿
+        self.assertEqual(backend.consume("a", 1, 0), 0)
+
+
+class TestLoginRateLimiter(unittest.TestCase):
+    def _create_limiter(self, **kwargs) -> LoginRateLimiter:
+        options = dict(
+            enabled=True, username_burst=2, username_per_minute=0, ip_burst=3, ip_per_minute=0
+        )
+        options.update(kwargs)
+
+        return LoginRateLimiter(LocalRateLimitBackend(), **options)
+
+    def test_throttle_username(self):
+        limiter = self._create_limiter()
+
+        self.assertEqual(limiter.acquire("user", "1.1.1.1"), 0)
+        self.assertEqual(limiter.acquire("user", "2.2.2.2"), 0)
+        self.assertGreater(limiter.acquire("user", "3.3.3.3"), 0)
+
+        # 登入成功後可以再嘗試
+        limiter.reset_username("user")
+
+        self.assertEqual(limiter.acquire("user", "3.3.3.3"), 0)
+        self.assertEqual(
+            limiter.get_stats(), {"allowed": 3, "throttled_username": 1, "throttled_ip": 0}
+        )
+
+    def test_throttle_ip(self):
+        limiter = self._create_limiter()
+
+        for username in ("a", "b", "c"):
+            self.assertEqual(limiter.acquire(username, "1.1.1.1"), 0)
+
+        self.assertGreater(limiter.acquire("d", "1.1.1.1"), 0)
+        self.assertEqual(limiter.acquire("d", "2.2.2.2"), 0)
+        self.assertEqual(
+            limiter.get_stats(), {"allowed": 4, "throttled_username": 0, "throttled_ip": 1}
+        )
+
+        limiter.reset_stats()
+
+        self.assertEqual(
+            limiter.get_stats(), {"allowed": 0, "throttled_username": 0, "throttled_ip": 0}
+        )
+
+    def test_disabled(self):
+        limiter = self._create_limiter(enabled=False)
+
+        for _ in range(10):
+            self.assertEqual(limiter.acquire("user", "1.1.1.1"), 0)
+
+        self.assertEqual(
+            limiter.get_stats(), {"allowed": 0, "throttled_username": 0, "throttled_ip": 0}
+        )
+
+    def test_get_client_ip(self):
+        limiter = self._create_limiter(trusted_proxies=["10.0.0.1", "172.16.0.0/12"])
+
+        self.assertEqual(limiter.get_client_ip(None), "unknown")
+        self.assertEqual(limiter.get_client_ip("1.1.1.1"), "1.1.1.1")
+
+        # 不是信任的 proxy 時不使用 `X-Forwarded-For`
+        self.assertEqual(limiter.get_client_ip("1.1.1.1", "2.2.2.2"), "1.1.1.1")
+
+        self.assertEqual(limiter.get_client_ip("10.0.0.1", "2.2.2.2"), "2.2.2.2")
+
+        # 從右邊跳過信任的 proxy ，最左邊偽造的值不會被使用
+        self.assertEqual(
+            limiter.get_client_ip("10.0.0.1", "9.9.9.9, 2.2.2.2, 172.16.3.4"), "2.2.2.2"
+        )
+
+        # 全部都是信任的 proxy 時使用最左邊的 IP
+        self.assertEqual(limiter.get_client_ip("10.0.0.1", "172.16.3.4"), "172.16.3.4")
+
+    def test_get_client_ip_without_trusted_proxies(self):
+        limiter = self._create_limiter(trusted_proxies=[])
+
+        self.assertEqual(limiter.get_client_ip("10.0.0.1", "2.2.2.2"), "10.0.0.1")
+
+
+class TestRateLimitBackend(unittest.TestCase):
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            RateLimitBackend()
+
+        class IncompleteBackend(RateLimitBackend):
+            def consume(self, key: str, capacity: float, refill_rate: float) -> float:
+                return 0.0
+
+        # 沒有實作所有方法的後端不能建立
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
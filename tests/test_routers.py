@@ -7,18 +7,28 @@ Description: Api Router 單元測試
 '''
 
 
+import asyncio
+import gzip
+import json
+import threading
 import unittest
+from datetime import datetime, time
 from unittest import mock
 
+import requests
 from fastapi.testclient import TestClient
 from sqlalchemy import text
 
 from app.config import config
-from app import create_app
+from app import create_app, geo, passwords, user_cache
 from app.database.model import Restaurant, RestaurantOpenTime, User
-from app.routers import register_router
+from app.routers import register_router, restaurant_router
 from tests.utils import FakeDataBase, FakeData, FakeInitData
-from app.routers.depends import get_db, get_current_user
+from app.routers.depends import get_db, get_current_user_id
+from app.rate_limit import login_rate_limiter
+from app.spatial_index import restaurant_index
+from app.utils import MapApiError
+from app.database import crud
 
 
 ROOT_URL = "/api/v1"
@@ -70,8 +80,94 @@ class TestResaurantRotuer(InitialTestClient):
         self.assertIsNotNone(data[0]["name"])
         self.assertIsNotNone(data[0]["address"])
 
+    def test_read_restaurant_router_with_is_open(self):
+        fake_data1, fake_data2 = FakeData.fake_restaurant(number=2)
+
+        restaurant1 = Restaurant(**fake_data1)
+        restaurant2 = Restaurant(**fake_data2)
+
+        # 2026-10-19 是星期一
+        open_time = RestaurantOpenTime(day_of_week=1, open_time=time(8, 0), close_time=time(12, 0))
+        restaurant1.open_times.append(open_time)
+
+        with self.fake_database.get_db() as db:
+            db.add_all([restaurant1, restaurant2, open_time])
+            db.commit()
+
+        response = self.client.get(f"{ROOT_URL}/restaurant?at=2026-10-19T10:00:00")
+
+        is_open = {item["name"]: item["is_open"] for item in response.json()["items"]}
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_open[fake_data1["name"]])
+        self.assertTrue(is_open[fake_data2["name"]])
+
+        response = self.client.get(f"{ROOT_URL}/restaurant?at=2026-10-19T13:00:00")
+
+        is_open = {item["name"]: item["is_open"] for item in response.json()["items"]}
+
+        self.assertFalse(is_open[fake_data1["name"]])
+        self.assertTrue(is_open[fake_data2["name"]])
+
+    def test_read_restaurant_router_with_cursor(self):
+        with self.fake_database.get_db() as db:
+            db.add_all([Restaurant(**data) for data in FakeData.fake_restaurant(number=3)])
+            db.commit()
+
+        response = self.client.get(f"{ROOT_URL}/restaurant?limit=2")
+
+        first_page = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(first_page["items"]), 2)
+        self.assertIsNotNone(first_page["next_cursor"])
+
+        response = self.client.get(
+            f"{ROOT_URL}/restaurant?limit=2&cursor={first_page['next_cursor']}"
+        )
+
+        second_page = response.json()
+
+        self.assertEqual(len(second_page["items"]), 1)
+        self.assertIsNone(second_page["next_cursor"])
+        self.assertEqual(
+            len(set(item["id"] for item in first_page["items"] + second_page["items"])), 3
+        )
+
+        response = self.client.get(f"{ROOT_URL}/restaurant?cursor=invalid")
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_restaurants_router(self):
+        fake_data1, fake_data2 = FakeData.fake_restaurant(number=2)
+
+        restaurant1 = Restaurant(**fake_data1)
+        restaurant2 = Restaurant(**fake_data2)
+        restaurant2.create_at = datetime(2020, 1, 1)
+
+        with self.fake_database.get_db() as db:
+            db.add_all([restaurant1, restaurant2])
+            db.commit()
+
+        response = self.client.get(f"{ROOT_URL}/restaurant/export")
+
+        rows = [json.loads(line) for line in response.text.splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        self.assertEqual(set(row["name"] for row in rows), {fake_data1["name"], fake_data2["name"]})
+
+        response = self.client.get(
+            f"{ROOT_URL}/restaurant/export?since=2021-01-01T00:00:00&compress=true"
+        )
+
+        rows = [json.loads(line) for line in gzip.decompress(response.content).splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["name"] for row in rows], [fake_data1["name"]])
+
     # 使用 測試方法層面 mock 直接替換掉 get_coords()
-    @mock.patch("app.utils.MapApi.get_coords", return_value=(25.0, 121.0))
+    @mock.patch("app.utils.AsyncMapApi.get_coords", return_value=(25.0, 121.0))
     def test_create_restaurant_router(self, mock_get_coords):
         fake_restaurant = FakeData.fake_restaurant(is_lat_lng=False)
         response = self.client.post(
@@ -82,6 +178,101 @@ class TestResaurantRotuer(InitialTestClient):
         self.assertEqual(response.status_code, 201)
         self.assertEqual(response.json(), {"message": "created."})
 
+    def test_create_restaurant_router_runs_database_off_event_loop(self):
+        threads = {}
+
+        create_restaurant = crud.create_restaurant
+
+        async def fake_get_coords(address):
+            threads["map_api"] = threading.current_thread()
+            return 25.0, 121.0
+
+        def fake_create_restaurant(db, item):
+            threads["database"] = threading.current_thread()
+            return create_restaurant(db, item)
+
+        with mock.patch("app.utils.AsyncMapApi.get_coords", side_effect=fake_get_coords), mock.patch(
+            "app.database.crud.create_restaurant", side_effect=fake_create_restaurant
+        ):
+            response = self.client.post(
+                f"{ROOT_URL}/restaurant",
+                json={"name": "test", "address": "event loop address"},
+            )
+
+        self.assertEqual(response.status_code, 201)
+
+        # 路由直接在 event loop 中等待地圖 Api (不佔用 worker thread)，資料庫操作在 worker thread 中執行
+        self.assertTrue(asyncio.iscoroutinefunction(restaurant_router.create_restaurant))
+        self.assertIsNot(threads["map_api"], threads["database"])
+
+    @mock.patch("app.utils.AsyncMapApi.get_coords")
+    def test_create_restaurant_router_with_deferred_geocode(self, mock_get_coords):
+        with mock.patch.object(config.BaseConfig, "GEOCODE_DEFERRED", True), mock.patch(
+            "app.geocode_worker.geocode_worker.notify"
+        ) as mock_notify:
+            response = self.client.post(
+                f"{ROOT_URL}/restaurant",
+                json={"name": "deferred", "address": "deferred geocode address"},
+            )
+
+        self.assertEqual(response.status_code, 201)
+        mock_get_coords.assert_not_called()
+        mock_notify.assert_called_once()
+
+        with self.fake_database.get_db() as db:
+            restaurant = db.query(Restaurant).filter(Restaurant.name == "deferred").one()
+
+            self.assertEqual(restaurant.geocode_status, "pending_geocode")
+            self.assertIsNone(restaurant.lat)
+
+    @mock.patch("app.utils.AsyncMapApi.get_coords", side_effect=MapApiError)
+    def test_create_restaurant_router_with_map_api_unavailable(self, mock_get_coords):
+        response = self.client.post(
+            f"{ROOT_URL}/restaurant",
+            json={"name": "test", "address": "map api unavailable address"},
+        )
+
+        self.assertEqual(response.status_code, 503)
+
+    @mock.patch(
+        "app.utils.MapApi._get_coords_batch",
+        side_effect=lambda addresses: [(25.0, 121.0)] * len(addresses),
+    )
+    def test_import_restaurants_router(self, mock_get_coords_batch):
+        fake_restaurants = FakeData.fake_restaurant(is_lat_lng=False, number=2)
+
+        response = self.client.post(
+            f"{ROOT_URL}/restaurant/import", json=fake_restaurants + [{"name": "no address"}]
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertEqual(response.json()["errors"][0]["index"], 2)
+
+        content = "name,address,open_times\n餐廳1,地址1,1|11:00|14:00\n"
+
+        response = self.client.post(
+            f"{ROOT_URL}/restaurant/import/csv",
+            files={"file": ("restaurants.csv", content.encode(), "text/csv")},
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual(response.json()["failed"], 0)
+
+    @mock.patch(
+        "app.utils.MapApi._get_coords_batch", side_effect=requests.ConnectionError("unavailable")
+    )
+    def test_import_restaurants_router_with_map_api_unavailable(self, mock_get_coords_batch):
+        # 使用沒有快取過的地址，才會呼叫地圖 Api
+        fake_restaurants = [
+            {"name": "test", "address": f"map api unavailable address {i}"} for i in range(2)
+        ]
+
+        response = self.client.post(f"{ROOT_URL}/restaurant/import", json=fake_restaurants)
+
+        self.assertEqual(response.status_code, 503)
+
     def test_upate_restaurant_router(self):
         fake_data = FakeData.fake_restaurant()
         with self.fake_database.get_db() as db:
@@ -100,6 +291,44 @@ class TestResaurantRotuer(InitialTestClient):
 
         self.assertEqual(response.status_code, 200)
 
+    @mock.patch("app.utils.AsyncMapApi.get_coords", return_value=(None, None))
+    def test_update_restaurant_router_with_invalid_address(self, mock_get_coords):
+        fake_data = FakeData.fake_restaurant()
+
+        with self.fake_database.get_db() as db:
+            restaurant = Restaurant(**fake_data)
+            db.add(restaurant)
+            db.commit()
+            db.refresh(restaurant)
+
+        response = self.client.patch(
+            f"{ROOT_URL}/restaurant/{restaurant.id}",
+            json={"address": "update restaurant router invalid address"},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        mock_get_coords.assert_called_once()
+
+    @mock.patch("app.utils.AsyncMapApi.get_coords", side_effect=MapApiError)
+    def test_update_restaurant_router_with_map_api_unavailable(self, mock_get_coords):
+        fake_data = FakeData.fake_restaurant()
+
+        with self.fake_database.get_db() as db:
+            restaurant = Restaurant(**fake_data)
+            db.add(restaurant)
+            db.commit()
+            db.refresh(restaurant)
+
+        response = self.client.patch(
+            f"{ROOT_URL}/restaurant/{restaurant.id}",
+            json={"address": "update restaurant router unavailable address"},
+        )
+
+        self.assertEqual(response.status_code, 503)
+
+        with self.fake_database.get_db() as db:
+            self.assertEqual(db.get(Restaurant, restaurant.id).address, fake_data["address"])
+
     def test_delete_restaurant_router(self):
         fake_data = FakeData.fake_restaurant()
 
@@ -200,6 +429,113 @@ class TestChoiceRestaurantRouter(InitialTestClient):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()["items"]), 1)
 
+    def test_read_retaurant_randomly_router_is_open_at_filtered_time(self):
+        """有篩選營業時段但沒有傳入 `at` 時，`is_open` 要用篩選的時段計算"""
+
+        restaurant = Restaurant(**FakeData.fake_restaurant())
+
+        with self.fake_database.get_db() as db:
+            db.add(restaurant)
+            db.commit()
+            db.refresh(restaurant)
+
+            open_time = RestaurantOpenTime(
+                day_of_week=1, open_time=time(11, 0), close_time=time(14, 0)
+            )
+            restaurant.open_times.append(open_time)
+
+            db.add(open_time)
+            db.commit()
+
+        lat, lng = FakeData.fake_current_location()
+        url = f"{ROOT_URL}/restaurant/choice?lat={lat}&lng={lng}&distance=5&day_of_week=1&current_time=12:00"
+
+        for mode in ("random", "nearest"):
+            response = self.client.get(f"{url}&mode={mode}")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([item["is_open"] for item in response.json()["items"]], [True])
+
+        # 有傳入 `at` 時使用 `at` 計算 (2023-07-03 是星期一)
+        response = self.client.get(f"{url}&at=2023-07-03T15:00:00")
+
+        self.assertEqual([item["is_open"] for item in response.json()["items"]], [False])
+
+    def test_read_retaurant_randomly_router_with_spatial_index(self):
+        inner_fake_data1, inner_fake_data2 = FakeData.fake_restaurant(number=2)
+        outer_fake_data = FakeData.fake_restaurant_far()
+
+        with self.fake_database.get_db() as db:
+            db.add_all(
+                [
+                    Restaurant(**inner_fake_data1),
+                    Restaurant(**inner_fake_data2),
+                    Restaurant(**outer_fake_data),
+                ]
+            )
+
+            db.commit()
+
+            restaurant_index.build(db)
+
+        lat, lng = FakeData.fake_current_location()
+        distance = 5.0
+
+        try:
+            response = self.client.get(
+                f"{ROOT_URL}/restaurant/choice?lat={lat}&lng={lng}&distance={distance}&limit=10"
+            )
+
+        finally:
+            restaurant_index.clear()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(item["name"] for item in response.json()["items"]),
+            set([inner_fake_data1["name"], inner_fake_data2["name"]]),
+        )
+        self.assertTrue(all(item["distance_km"] < distance for item in response.json()["items"]))
+
+
+    def test_read_retaurant_nearest_router(self):
+        inner_fake_data1, inner_fake_data2 = FakeData.fake_restaurant(number=2)
+        outer_fake_data = FakeData.fake_restaurant_far()
+
+        with self.fake_database.get_db() as db:
+            db.add_all(
+                [
+                    Restaurant(**inner_fake_data1),
+                    Restaurant(**inner_fake_data2),
+                    Restaurant(**outer_fake_data),
+                ]
+            )
+
+            db.commit()
+
+        lat, lng = FakeData.fake_current_location()
+        distance = 5.0
+
+        response = self.client.get(
+            f"{ROOT_URL}/restaurant/choice?lat={lat}&lng={lng}&distance={distance}&limit=10&mode=nearest"
+        )
+
+        items = response.json()["items"]
+        distances = [item["distance_km"] for item in items]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(items), 2)
+        self.assertEqual(distances, sorted(distances))
+
+        for item in items:
+            self.assertAlmostEqual(
+                item["distance_km"], geo.haversine(lat, lng, item["lat"], item["lng"])
+            )
+
+        response = self.client.get(
+            f"{ROOT_URL}/restaurant/choice?lat={lat}&lng={lng}&distance={distance}&mode=other"
+        )
+
+        self.assertEqual(response.status_code, 422)
 
 class TestRestaurantOpenTimeRouter(InitialTestClient):
     def to_datetime(self, str):
@@ -281,11 +617,16 @@ class TestUserAuthRouter(InitialTestClient):
     def setUp(self) -> None:
         self.test_app.dependency_overrides[get_db] = self.fake_database.override_get_db
 
+        login_rate_limiter.backend.clear()
+        login_rate_limiter.reset_stats()
+
     def tearDown(self) -> None:
         with self.fake_database.get_db() as db:
             db.execute(text("DELETE FROM user"))
             db.commit()
 
+        user_cache.clear_user_cache()
+
     def test_user_register(self):
         fake_data = FakeData.fake_user()
 
@@ -300,6 +641,38 @@ class TestUserAuthRouter(InitialTestClient):
 
         self.assertEqual(response.status_code, 201)
 
+    def test_user_register_runs_database_off_event_loop(self):
+        fake_data = FakeData.fake_user()
+        threads = {}
+
+        hash_password_async = passwords.hash_password_async
+        create_user_not_oauth = crud.create_user_not_oauth
+
+        async def fake_hash_password_async(password):
+            threads["event_loop"] = threading.current_thread()
+            return await hash_password_async(password)
+
+        def fake_create_user_not_oauth(db, user):
+            threads["database"] = threading.current_thread()
+            return create_user_not_oauth(db, user)
+
+        with mock.patch(
+            "app.passwords.hash_password_async", side_effect=fake_hash_password_async
+        ), mock.patch(
+            "app.database.crud.create_user_not_oauth", side_effect=fake_create_user_not_oauth
+        ):
+            response = self.client.post(
+                f"{ROOT_URL}/user/",
+                json={
+                    "username": fake_data["username"],
+                    "email": fake_data["email"],
+                    "password": fake_data["password"],
+                },
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNot(threads["event_loop"], threads["database"])
+
     def test_user_register_with_exist_username(self):
         fake_data = FakeData.fake_user()
 
@@ -388,6 +761,153 @@ class TestUserAuthRouter(InitialTestClient):
 
         self.assertEqual(response.status_code, 401)
 
+    def test_user_login_rehash_outdated_password(self):
+        """登入成功後，用目前的設定重新計算過時的密碼雜湊"""
+
+        fake_user = FakeData.fake_user()
+        bcrypt_hash = passwords.pwd_context.handler("bcrypt").using(rounds=4).hash(
+            fake_user["password"]
+        )
+
+        with self.fake_database.get_db() as db:
+            db.add(
+                User(
+                    username=fake_user["username"],
+                    email=fake_user["email"],
+                    password_hash=bcrypt_hash,
+                )
+            )
+            db.commit()
+
+        # 重新計算雜湊的背景工作使用自己的 session
+        with mock.patch("app.auth.SessionLocal", self.fake_database.SessionLocal):
+            response = self.client.post(
+                f"{ROOT_URL}/user/token",
+                data={"username": fake_user["username"], "password": fake_user["password"]},
+            )
+
+        self.assertEqual(response.status_code, 200)
+
+        with self.fake_database.get_db() as db:
+            user = db.query(User).filter(User.username == fake_user["username"]).first()
+
+            self.assertTrue(user.password_hash.startswith("$argon2id$"))
+            self.assertFalse(user.password_needs_update)
+            self.assertTrue(user.verify_password(fake_user["password"]))
+
+    def test_user_login_rate_limit(self):
+        """同一個使用者名稱連續登入失敗太多次時，直接回傳 429 ，不會驗證密碼"""
+
+        fake_user = FakeData.fake_user()
+
+        with self.fake_database.get_db() as db:
+            db.add(User(**fake_user))
+            db.commit()
+
+        def login(password: str):
+            return self.client.post(
+                f"{ROOT_URL}/user/token",
+                data={"username": fake_user["username"], "password": password},
+            )
+
+        # 登入成功會補滿使用者名稱的 bucket
+        for _ in range(config.TestConfig.LOGIN_USERNAME_BURST + 1):
+            self.assertEqual(login(fake_user["password"]).status_code, 200)
+
+        for _ in range(config.TestConfig.LOGIN_USERNAME_BURST):
+            self.assertEqual(login("wrong password").status_code, 401)
+
+        with mock.patch("app.auth.authenticate_user_async") as mock_authenticate:
+            response = login(fake_user["password"])
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+        mock_authenticate.assert_not_called()
+
+        self.assertEqual(
+            login_rate_limiter.get_stats(),
+            {
+                "allowed": config.TestConfig.LOGIN_USERNAME_BURST * 2 + 1,
+                "throttled_username": 1,
+                "throttled_ip": 0,
+            },
+        )
+
+    def test_user_login_rate_limit_client_ip(self):
+        """連線不是來自信任的 proxy 時，不使用 `X-Forwarded-For` 的 IP 限流"""
+
+        fake_user = FakeData.fake_user()
+
+        with mock.patch.object(login_rate_limiter, "acquire", return_value=0) as mock_acquire:
+            self.client.post(
+                f"{ROOT_URL}/user/token",
+                data={"username": fake_user["username"], "password": fake_user["password"]},
+                headers={"X-Forwarded-For": "1.1.1.1"},
+            )
+
+            mock_acquire.assert_called_once_with(fake_user["username"], "testclient")
+
+            with mock.patch.object(login_rate_limiter, "_is_trusted_proxy", return_value=True):
+                mock_acquire.reset_mock()
+
+                self.client.post(
+                    f"{ROOT_URL}/user/token",
+                    data={"username": fake_user["username"], "password": fake_user["password"]},
+                    headers={"X-Forwarded-For": "1.1.1.1"},
+                )
+
+            mock_acquire.assert_called_once_with(fake_user["username"], "1.1.1.1")
+
+    def test_user_token_skip_user_lookup(self):
+        """token 中有使用者 ID，只需要使用者 ID 的路由不會用使用者名稱查詢使用者"""
+
+        fake_user = FakeData.fake_user()
+
+        with self.fake_database.get_db() as db:
+            db.add(User(**fake_user))
+            db.commit()
+
+        response = self.client.post(
+            f"{ROOT_URL}/user/token",
+            data={"username": fake_user["username"], "password": fake_user["password"]},
+        )
+        token = response.json()["access_token"]
+
+        with mock.patch("app.database.crud.get_user_with_username") as mock_get_user:
+            response = self.client.get(
+                f"{ROOT_URL}/user/restaurant", headers={"Authorization": f"Bearer {token}"}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        mock_get_user.assert_not_called()
+
+    def test_user_token_with_deleted_user(self):
+        """使用者被刪除後，token 中的使用者 ID 不能再使用"""
+
+        fake_user = FakeData.fake_user()
+
+        with self.fake_database.get_db() as db:
+            db.add(User(**fake_user))
+            db.commit()
+
+        response = self.client.post(
+            f"{ROOT_URL}/user/token",
+            data={"username": fake_user["username"], "password": fake_user["password"]},
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        self.assertEqual(
+            self.client.get(f"{ROOT_URL}/user/restaurant", headers=headers).status_code, 200
+        )
+
+        with self.fake_database.get_db() as db:
+            db.delete(db.query(User).filter(User.username == fake_user["username"]).one())
+            db.commit()
+
+        response = self.client.get(f"{ROOT_URL}/user/restaurant", headers=headers)
+
+        self.assertEqual(response.status_code, 401)
+
 
 class TestUserRestaurantRouter(InitialTestClient):
     """針對使用者的餐廳操作的單元測試
@@ -422,7 +942,7 @@ class TestUserRestaurantRouter(InitialTestClient):
 
     def setUp(self) -> None:
         self.test_app.dependency_overrides[get_db] = self.fake_database.override_get_db
-        self.test_app.dependency_overrides[get_current_user] = self._get_db_user
+        self.test_app.dependency_overrides[get_current_user_id] = lambda: self.db_user_id
 
     def tearDown(self) -> None:
         with self.fake_database.get_db() as db:
@@ -478,7 +998,7 @@ class TestUserRestaurantRouter(InitialTestClient):
         self.assertEqual(response.status_code, 200)
 
     # 使用 測試方法層面 mock 直接替換掉 get_coords()
-    @mock.patch("app.utils.MapApi.get_coords", return_value=(25.0, 121.0))
+    @mock.patch("app.utils.AsyncMapApi.get_coords", return_value=(25.0, 121.0))
     def test_create_user_restaurant_router(self, mock_get_coords):
         """測試 建立使用者餐廳資料路由
 
@@ -507,14 +1027,6 @@ class TestUserRestaurantRouter(InitialTestClient):
         Ref: `app/routers/user_router/update_user_restaurant()`
         """
 
-        def _inner_get_user(user_id):
-            def wrap():
-                with self.fake_database.get_db() as db:
-                    user = db.get(User, user_id)
-                return user
-
-            return wrap
-
         fake_restaurant = FakeData.fake_restaurant()
         fake_user = FakeData.fake_user()
 
@@ -552,7 +1064,7 @@ class TestUserRestaurantRouter(InitialTestClient):
             self.assertEqual(db_user1.restaurants.all()[0].name, "update")
 
         # 測試錯誤的使用者
-        self.test_app.dependency_overrides[get_current_user] = _inner_get_user(db_user2_id)
+        self.test_app.dependency_overrides[get_current_user_id] = lambda: db_user2_id
 
         # 測試正確的使用者
         response = self.client.patch(
@@ -567,15 +1079,6 @@ class TestUserRestaurantRouter(InitialTestClient):
         Ref: `app/routers/user_router/delete_user_restaurant()`
         """
 
-        def _inner_get_user(user_id):
-            def wrap():
-                with self.fake_database.get_db() as db:
-                    user = db.get(User, user_id)
-
-                return user
-
-            return wrap
-
         fake_restaurant = FakeData.fake_restaurant()
         fake_user = FakeData.fake_user()
 
@@ -616,7 +1119,8 @@ class TestUserRestaurantRouter(InitialTestClient):
 
             self.assertEqual(len(restaurants), 0)
 
-        self.test_app.dependency_overrides[get_current_user] = _inner_get_user(db_user2.id)
+        db_user2_id = db_user2.id
+        self.test_app.dependency_overrides[get_current_user_id] = lambda: db_user2_id
 
         # 錯誤的使用者
         response = self.client.delete(f"{ROOT_URL}/user/restaurant/100")
@@ -627,15 +1131,6 @@ class TestUserRestaurantRouter(InitialTestClient):
 class TestUserRestaurantOpenTimeRouter(InitialTestClient):
     """針對使用者的餐廳營業時間操作的單元測試"""
 
-    def _get_db_user(self, user_id):
-        def wrap():
-            with self.fake_database.get_db() as db:
-                user = db.get(User, user_id)
-
-            return user
-
-        return wrap
-
     @classmethod
     def setUpClass(cls) -> None:
         """在這個 class 開始測試之前，先新增兩個 user 和餐廳資料到資料庫"""
@@ -674,7 +1169,7 @@ class TestUserRestaurantOpenTimeRouter(InitialTestClient):
 
     def setUp(self) -> None:
         self.test_app.dependency_overrides[get_db] = self.fake_database.override_get_db
-        self.test_app.dependency_overrides[get_current_user] = self._get_db_user(self.db_user1_id)
+        self.test_app.dependency_overrides[get_current_user_id] = lambda: self.db_user1_id
 
     def tearDown(self) -> None:
         with self.fake_database.get_db() as db:
@@ -713,7 +1208,7 @@ class TestUserRestaurantOpenTimeRouter(InitialTestClient):
     def test_create_user_restaurant_open_time_router_with_invalid_user(self):
         """測試 使用無效的使用者建立餐廳營業時間"""
 
-        self.test_app.dependency_overrides[get_current_user] = self._get_db_user(self.db_user2_id)
+        self.test_app.dependency_overrides[get_current_user_id] = lambda: self.db_user2_id
 
         open_time_items = FakeData.fake_restaurant_open_time(to_str=True, number=2)
 
@@ -799,12 +1294,6 @@ class TestUserRestaurantOpenTimeRouter(InitialTestClient):
 class TestChoiceUserRestaurantRouter(InitialTestClient):
     """隨機選擇使用者餐廳路由測試"""
 
-    def _get_db_user(self) -> "User":
-        with self.fake_database.get_db() as db:
-            user = db.get(User, self.db_user_id)
-
-        return user
-
     @classmethod
     def setUpClass(cls) -> None:
         super().setUpClass()
@@ -822,7 +1311,7 @@ class TestChoiceUserRestaurantRouter(InitialTestClient):
 
     def setUp(self) -> None:
         self.test_app.dependency_overrides[get_db] = self.fake_database.override_get_db
-        self.test_app.dependency_overrides[get_current_user] = self._get_db_user
+        self.test_app.dependency_overrides[get_current_user_id] = lambda: self.db_user_id
 
     def tearDown(self) -> None:
         with self.fake_database.get_db() as db:
@@ -869,6 +1358,38 @@ class TestChoiceUserRestaurantRouter(InitialTestClient):
 
         self.assertEqual(len(response.json()["items"]), 2)
 
+    def test_get_user_restaurant_nearest_router(self):
+        inner_fake_data1, inner_fake_data2 = FakeData.fake_restaurant(number=2)
+        outer_fake_data = FakeData.fake_restaurant_far()
+
+        with self.fake_database.get_db() as db:
+            user = db.get(User, self.db_user_id)
+
+            db_restaurants = [
+                Restaurant(**inner_fake_data1),
+                Restaurant(**inner_fake_data2),
+                Restaurant(**outer_fake_data),
+            ]
+
+            for db_restaurant in db_restaurants:
+                user.restaurants.append(db_restaurant)
+
+            db.add_all(db_restaurants)
+            db.commit()
+
+        lat, lng = FakeData.fake_current_location()
+        distance = 5.0
+
+        response = self.client.get(
+            f"{ROOT_URL}/user/restaurant_choice?lat={lat}&lng={lng}&distance={distance}&limit=10&mode=nearest"
+        )
+
+        distances = [item["distance_km"] for item in response.json()["items"]]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(distances), 2)
+        self.assertEqual(distances, sorted(distances))
+
     def test_get_user_restaurant_randomly_router_with_open_time(self):
         fake_data1, fake_data2 = FakeData.fake_restaurant(number=2)
         fake_open_time1, fake_open_time2 = FakeData.fake_restaurant_open_time(number=2)
@@ -911,3 +1432,50 @@ class TestChoiceUserRestaurantRouter(InitialTestClient):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()["items"]), 1)
         self.assertEqual(response.json()["items"][0]["name"], fake_data1["name"])
+
+
+class TestMonitorRouter(InitialTestClient):
+    def setUp(self) -> None:
+        patcher = mock.patch.object(config.BaseConfig, "MONITOR_ENABLE", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.test_app.dependency_overrides[get_current_user_id] = lambda: 1
+
+    def tearDown(self) -> None:
+        self.test_app.dependency_overrides.pop(get_current_user_id, None)
+
+    def test_read_db_pool_stats_router(self):
+        response = self.client.get(f"{ROOT_URL}/monitor/db-pool")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("pool", response.json())
+
+    def test_read_db_pool_stats_router_without_login(self):
+        self.test_app.dependency_overrides.pop(get_current_user_id)
+
+        response = self.client.get(f"{ROOT_URL}/monitor/db-pool")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_read_login_rate_limit_stats_router(self):
+        login_rate_limiter.reset_stats()
+
+        response = self.client.get(f"{ROOT_URL}/monitor/login-rate-limit")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"allowed": 0, "throttled_username": 0, "throttled_ip": 0}
+        )
+
+        self.test_app.dependency_overrides.pop(get_current_user_id)
+
+        response = self.client.get(f"{ROOT_URL}/monitor/login-rate-limit")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_read_db_pool_stats_router_disabled(self):
+        with mock.patch.object(config.BaseConfig, "MONITOR_ENABLE", False):
+            response = self.client.get(f"{ROOT_URL}/monitor/db-pool")
+
+        self.assertEqual(response.status_code, 404)
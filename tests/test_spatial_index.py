@@ -0,0 +1,144 @@
+'''
+Author: weijay
+Date: 2026-10-18 13:41:26
+LastEditors: weijay
+LastEditTime: 2026-10-18 13:41:26
+Description: app.spatial_index 單元測試
+'''
+
+from sqlalchemy import text
+
+from app.database import crud
+from app.database.model import Restaurant
+from app.schemas import database_schema
+from app.spatial_index import RestaurantSpatialIndex, restaurant_index
+from tests import BaseDataBaseTestCase
+from tests.utils import FakeData
+
+
+class TestRestaurantSpatialIndex(BaseDataBaseTestCase):
+    def setUp(self) -> None:
+        self.inner_data_list = FakeData.fake_restaurant(number=2)
+        self.outer_data = FakeData.fake_restaurant_far()
+
+        with self.fake_database.get_db() as db:
+            restaurants = [Restaurant(**data) for data in self.inner_data_list]
+            restaurants.append(Restaurant(**self.outer_data))
+
+            db.add_all(restaurants)
+            db.commit()
+
+            self.inner_ids = set(r.id for r in restaurants[:2])
+            self.outer_id = restaurants[2].id
+
+    def tearDown(self) -> None:
+        restaurant_index.clear()
+
+        with self.fake_database.get_db() as db:
+            db.execute(text("DELETE FROM restaurant"))
+            db.commit()
+
+    def test_index_is_not_ready_before_build(self):
+        index = RestaurantSpatialIndex()
+
+        index.upsert(1, 24.94197, 121.22291)
+
+        self.assertFalse(index.is_ready)
+        self.assertEqual(len(index), 0)
+
+    def test_query_radius(self):
+        index = RestaurantSpatialIndex()
+
+        with self.fake_database.get_db() as db:
+            index.build(db)
+
+        lat, lng = FakeData.fake_current_location()
+
+        self.assertTrue(index.is_ready)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(set(index.query_radius(lat, lng, 5.0)), self.inner_ids)
+
+        far_lat, far_lng = FakeData.fake_current_location_far()
+
+        self.assertEqual(index.query_radius(far_lat, far_lng, 5.0), [self.outer_id])
+
+    def test_sample(self):
+        index = RestaurantSpatialIndex()
+
+        with self.fake_database.get_db() as db:
+            index.build(db)
+
+        lat, lng = FakeData.fake_current_location()
+
+        items = index.sample(lat, lng, 5.0, 1)
+
+        self.assertEqual(len(items), 1)
+        self.assertIn(items[0][0], self.inner_ids)
+        self.assertEqual(set(r_id for r_id, _ in index.sample(lat, lng, 5.0, 10)), self.inner_ids)
+
+    def test_nearest(self):
+        index = RestaurantSpatialIndex()
+
+        with self.fake_database.get_db() as db:
+            index.build(db)
+
+        lat, lng = FakeData.fake_current_location()
+
+        items = index.nearest(lat, lng, 5.0, 10)
+        distances = [r_distance for _, r_distance in items]
+
+        self.assertEqual(set(r_id for r_id, _ in items), self.inner_ids)
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(len(index.nearest(lat, lng, 5.0, 1)), 1)
+
+    def test_upsert_and_remove(self):
+        index = RestaurantSpatialIndex()
+
+        with self.fake_database.get_db() as db:
+            index.build(db)
+
+        lat, lng = FakeData.fake_current_location()
+        far_lat, far_lng = FakeData.fake_current_location_far()
+
+        # 把遠的餐廳移到附近
+        index.upsert(self.outer_id, lat, lng)
+
+        self.assertIn(self.outer_id, index.query_radius(lat, lng, 5.0))
+        self.assertEqual(index.query_radius(far_lat, far_lng, 5.0), [])
+
+        index.upsert(self.outer_id, lat, lng, is_enable=False)
+
+        self.assertNotIn(self.outer_id, index.query_radius(lat, lng, 5.0))
+
+        for restaurant_id in self.inner_ids:
+            index.remove(restaurant_id)
+
+        self.assertEqual(len(index), 0)
+
+    def test_crud_keep_index_up_to_date(self):
+        with self.fake_database.get_db() as db:
+            restaurant_index.build(db)
+
+            far_lat, far_lng = FakeData.fake_current_location_far()
+
+            fake_data = FakeData.fake_restaurant()
+            fake_data.update({"lat": far_lat, "lng": far_lng})
+
+            db_restaurant = crud.create_restaurant(
+                db, database_schema.RestaurantDBModel(**fake_data)
+            )
+
+            self.assertIn(db_restaurant.id, restaurant_index.query_radius(far_lat, far_lng, 1.0))
+
+            lat, lng = FakeData.fake_current_location()
+
+            crud.update_restaurant(
+                db, db_restaurant.id, database_schema.RestaurantUpdateDBModel(lat=lat, lng=lng)
+            )
+
+            self.assertNotIn(db_restaurant.id, restaurant_index.query_radius(far_lat, far_lng, 1.0))
+            self.assertIn(db_restaurant.id, restaurant_index.query_radius(lat, lng, 5.0))
+
+            crud.delete_restaurant(db, db_restaurant.id)
+
+            self.assertNotIn(db_restaurant.id, restaurant_index.query_radius(lat, lng, 5.0))
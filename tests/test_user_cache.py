@@ -0,0 +1,157 @@
+'''
+Author: weijay
+Date: 2026-10-18 23:52:30
+LastEditors: weijay
+LastEditTime: 2026-10-18 23:52:30
+Description: app.user_cache 和取得目前使用者的依賴項目單元測試
+'''
+
+from unittest import mock
+
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app import auth, user_cache
+from app.database import crud
+from app.database.model import User
+from app.routers.depends import get_current_user, get_current_user_id
+from tests import BaseDataBaseTestCase
+from tests.utils import FakeData
+
+
+class TestUserCache(BaseDataBaseTestCase):
+    def setUp(self) -> None:
+        user_cache.clear_user_cache()
+
+        fake_user = FakeData.fake_user()
+
+        with self.fake_database.get_db() as db:
+            user = User(**fake_user)
+            db.add(user)
+            db.commit()
+
+            self.user_id = user.id
+            self.username = user.username
+
+    def tearDown(self) -> None:
+        user_cache.clear_user_cache()
+
+        with self.fake_database.get_db() as db:
+            db.execute(text("DELETE FROM user"))
+            db.commit()
+
+    def test_get_current_user_cached(self):
+        token = auth.create_access_token({"sub": self.username})
+
+        with self.fake_database.get_db() as db:
+            with mock.patch(
+                "app.database.crud.get_user_with_username", wraps=crud.get_user_with_username
+            ) as mock_get_user:
+                user = get_current_user(db, token)
+                cached_user = get_current_user(db, token)
+
+            self.assertEqual(mock_get_user.call_count, 1)
+            self.assertEqual(user, cached_user)
+            self.assertEqual(cached_user.id, self.user_id)
+
+    def test_get_current_user_expired(self):
+        token = auth.create_access_token({"sub": self.username})
+
+        with self.fake_database.get_db() as db:
+            with mock.patch("app.utils.time.monotonic", return_value=0):
+                get_current_user(db, token)
+
+            with mock.patch(
+                "app.utils.time.monotonic", return_value=user_cache.BaseConfig.USER_CACHE_TTL
+            ):
+                self.assertIsNone(user_cache.get_cached_user(self.username))
+
+    def test_invalidate_on_user_change(self):
+        token = auth.create_access_token({"sub": self.username})
+
+        with self.fake_database.get_db() as db:
+            get_current_user(db, token)
+
+            user = db.get(User, self.user_id)
+            user.username = self.username + "_new"
+            db.commit()
+
+            # 舊的使用者名稱已經不能使用
+            self.assertIsNone(user_cache.get_cached_user(self.username))
+
+            with self.assertRaises(HTTPException):
+                get_current_user(db, token)
+
+            db.delete(user)
+            db.commit()
+
+    def test_get_current_user_with_invalid_token(self):
+        with self.fake_database.get_db() as db:
+            with self.assertRaises(HTTPException):
+                get_current_user(db, "invalid token")
+
+            with self.assertRaises(HTTPException):
+                get_current_user(db, auth.create_access_token({"uid": self.user_id}))
+
+    def test_get_current_user_id(self):
+        token = auth.create_access_token({"sub": self.username, "uid": self.user_id})
+
+        with self.fake_database.get_db() as db:
+            with mock.patch("app.database.crud.get_user", wraps=crud.get_user) as mock_get_user:
+                self.assertEqual(get_current_user_id(db, token), self.user_id)
+                self.assertEqual(get_current_user_id(db, token), self.user_id)
+
+        # 第二次使用快取確認使用者存在
+        self.assertEqual(mock_get_user.call_count, 1)
+
+        # 沒有 `uid` 的舊 token 需要查詢使用者
+        token = auth.create_access_token({"sub": self.username})
+
+        with self.fake_database.get_db() as db:
+            self.assertEqual(get_current_user_id(db, token), self.user_id)
+
+    def test_get_current_user_id_with_deleted_user(self):
+        token = auth.create_access_token({"sub": self.username, "uid": self.user_id})
+
+        with self.fake_database.get_db() as db:
+            get_current_user_id(db, token)
+
+            db.delete(db.get(User, self.user_id))
+            db.commit()
+
+            # 刪除使用者時會清除快取，token 不能再使用
+            self.assertIsNone(user_cache.get_cached_user_by_id(self.user_id))
+
+            with self.assertRaises(HTTPException) as context:
+                get_current_user_id(db, token)
+
+        self.assertEqual(context.exception.status_code, 401)
+
+    def test_custom_backend(self):
+        backend = user_cache.LocalUserCacheBackend(maxsize=2)
+        default_backend = user_cache.get_user_cache_backend()
+        user_cache.set_user_cache_backend(backend)
+
+        try:
+            with self.fake_database.get_db() as db:
+                get_current_user(db, auth.create_access_token({"sub": self.username}))
+
+            # 使用者名稱和使用者 ID 各一個 key
+            self.assertEqual(len(backend), 2)
+            self.assertEqual(user_cache.get_cached_user(self.username).id, self.user_id)
+            self.assertEqual(user_cache.get_cached_user_by_id(self.user_id).username, self.username)
+
+        finally:
+            user_cache.set_user_cache_backend(default_backend)
+
+    def test_backend_is_abstract(self):
+        with self.assertRaises(TypeError):
+            user_cache.UserCacheBackend()
+
+        class IncompleteBackend(user_cache.UserCacheBackend):
+            def get(self, key: str):
+                return None
+
+        # 沒有實作所有方法的後端不能建立
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
@@ -6,13 +6,16 @@ LastEditTime: 2023-05-01 16:53:21
 Description: app.utils 單元測試
 '''
 
+import json
 import os
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
 
 import requests
 
-from app.utils import MapApi
+from app.utils import AsyncMapApi, CircuitBreaker, LRUCache, MapApi, MapApiError
 
 
 class TestMapApi(unittest.TestCase):
@@ -53,3 +56,230 @@ class TestMapApi(unittest.TestCase):
             result = self.map_api.get_coords("Invaild address")
 
             self.assertEqual(result, (None, None))
+
+    def test_get_coords_many(self):
+        def fake_post(url, json, timeout):
+            mock_response = MagicMock()
+            mock_response.json.return_value = {
+                "results": [
+                    {"locations": [{"latLng": {"lat": 25.0, "lng": float(location[-1])}}]}
+                    for location in json["locations"]
+                ]
+            }
+
+            return mock_response
+
+        with patch("requests.post", side_effect=fake_post) as mock_post, patch.object(
+            MapApi, "BATCH_SIZE", 2
+        ):
+            result = self.map_api.get_coords_many(
+                ["address 1", "address 2", "address 1", "address 3"], max_workers=2
+            )
+
+        self.assertEqual(result, [(25.0, 1.0), (25.0, 2.0), (25.0, 1.0), (25.0, 3.0)])
+
+        # 相同的地址只查詢一次，每 2 個地址一次請求
+        self.assertEqual(mock_post.call_count, 2)
+
+        for call in mock_post.call_args_list:
+            self.assertIn("/batch?key=", call.args[0])
+
+    def test_get_coords_many_with_failed_batch(self):
+        with patch("requests.post") as mock_post, patch.object(MapApi, "BATCH_SIZE", 2):
+            mock_post.side_effect = [
+                requests.exceptions.ReadTimeout(),
+                MagicMock(
+                    **{
+                        "json.return_value": {
+                            "results": [{"locations": [{"latLng": {"lat": 25.0, "lng": 121.5}}]}]
+                        }
+                    }
+                ),
+            ]
+
+            # 地圖 API 無法使用和查不到經緯度不同，不會回傳 `(None, None)`
+            with self.assertRaises(MapApiError):
+                self.map_api.get_coords_many(["address 1", "address 2", "address 3"])
+
+    def test_get_coords_many_with_invalid_response(self):
+        with patch("requests.post") as mock_post:
+            mock_post.return_value = MagicMock(**{"json.return_value": {"results": []}})
+
+            with self.assertRaises(MapApiError):
+                self.map_api.get_coords_many(["address 1"])
+
+    def test_get_coords_many_not_found(self):
+        with patch("requests.post") as mock_post:
+            mock_post.return_value = MagicMock(
+                **{"json.return_value": {"results": [{"locations": []}]}}
+            )
+
+            self.assertEqual(self.map_api.get_coords_many(["address 1"]), [(None, None)])
+
+
+class FakeMapQuestServer:
+    """本地的假 MapQuest 伺服器
+
+    `statuses` 依序決定每一次請求回應的 HTTP 狀態碼 (用完之後都回應 200)，
+    地址包含 `invalid` 時回傳空的查詢結果
+    """
+
+    def __init__(self):
+        self.statuses = []
+        self.requests = []
+        self.connections = set()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+                server.requests.append((self.path, body))
+                server.connections.add(self.client_address)
+
+                status = server.statuses.pop(0) if server.statuses else 200
+
+                if status != 200:
+                    data = {}
+
+                elif "invalid" in body["location"]:
+                    data = {"results": [{"locations": []}]}
+
+                else:
+                    data = {"results": [{"locations": [{"latLng": {"lat": 25.0, "lng": 121.5}}]}]}
+
+                content = json.dumps(data).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/geocoding/v1"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestAsyncMapApi(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.server = FakeMapQuestServer()
+        self.server.start()
+
+        self.map_api = AsyncMapApi(
+            api_key="test_api_key",
+            base_url=self.server.base_url,
+            max_retries=2,
+            backoff=0,
+            circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.map_api.aclose()
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    async def test_get_coords(self):
+        for _ in range(3):
+            result = await self.map_api.get_coords("台北市信義區信義路五段7號")
+
+            self.assertEqual(result, (25.0, 121.5))
+
+        path, body = self.server.requests[0]
+
+        self.assertEqual(path, "/geocoding/v1/address?key=test_api_key")
+        self.assertEqual(body, {"location": "台北市信義區信義路五段7號"})
+
+        # 共用同一個 keep-alive 連線
+        self.assertEqual(len(self.server.connections), 1)
+
+    async def test_get_coords_with_invalid_address(self):
+        self.assertEqual(await self.map_api.get_coords("invalid address"), (None, None))
+
+    async def test_retry(self):
+        self.server.statuses = [500, 429]
+
+        self.assertEqual(await self.map_api.get_coords("address"), (25.0, 121.5))
+        self.assertEqual(len(self.server.requests), 3)
+
+    async def test_no_retry_on_client_error(self):
+        self.server.statuses = [403]
+
+        with self.assertRaises(MapApiError):
+            await self.map_api.get_coords("address")
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertFalse(self.map_api.circuit_breaker.is_open)
+
+    async def test_circuit_breaker(self):
+        self.server.statuses = [500] * 6
+
+        for _ in range(2):
+            with self.assertRaises(MapApiError):
+                await self.map_api.get_coords("address")
+
+        self.assertTrue(self.map_api.circuit_breaker.is_open)
+        self.assertEqual(len(self.server.requests), 6)
+
+        # 斷路器開啟時不會發送請求
+        with self.assertRaises(MapApiError):
+            await self.map_api.get_coords("address")
+
+        self.assertEqual(len(self.server.requests), 6)
+
+        # 超過 reset_timeout 後放行一個請求，成功就關閉斷路器
+        self.map_api.circuit_breaker.opened_at -= 60
+
+        self.assertEqual(await self.map_api.get_coords("address"), (25.0, 121.5))
+        self.assertFalse(self.map_api.circuit_breaker.is_open)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evict_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        cache.set("a", (1, 1))
+        cache.set("b", (2, 2))
+        cache.get("a")
+        cache.set("c", (3, 3))
+
+        self.assertEqual(cache.get("a"), (1, 1))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), (3, 3))
+        self.assertEqual(len(cache), 2)
+
+    def test_expired(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        with patch("app.utils.time.monotonic", return_value=0):
+            cache.set("a", (1, 1))
+
+        with patch("app.utils.time.monotonic", return_value=61):
+            self.assertIsNone(cache.get("a"))
+
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl_per_key(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        with patch("app.utils.time.monotonic", return_value=0):
+            cache.set("a", (1, 1), ttl=10)
+            cache.set("b", (2, 2))
+
+        # 個別指定的保存秒數不會影響其他 key
+        with patch("app.utils.time.monotonic", return_value=11):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), (2, 2))
@@ -214,6 +214,15 @@ class FakeData:
         return result
 
 
+def fake_get_coords_batch(self, addresses: list):
+    """替換 `MapApi._get_coords_batch` ，地址包含 `invalid` 時查不到經緯度"""
+
+    return [
+        (None, None) if "invalid" in address else FakeData.fake_current_location()
+        for address in addresses
+    ]
+
+
 class FakeInitData:
     """生成測試資料
     與 :class:`FakeData` 不同的是， :class:`FakeInitData` 是生成在測試初始化時要新增進資料庫的資料。